@@ -0,0 +1,52 @@
+"""
+Benchmark of the per-file project context sent while building a project.
+
+Compares the full context of `gather_project_context` (every function of every file, for every file) with the
+relevance-scoped context of `BlueprintIndex.context_for` on synthetic blueprints of increasing size.
+
+Usage:
+    python benchmarks/context.py [--sizes 10 50 200]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import SYNTHETIC_DESCRIPTION, synthetic_blueprint  # noqa: E402
+from scriptmonkey.agents import gather_project_context  # noqa: E402
+from scriptmonkey.blueprint import BlueprintIndex  # noqa: E402
+from scriptmonkey.utils.tokens import count_tokens  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Project context benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200])
+    args = parser.parse_args()
+
+    print(f"{'files':>6} {'full tokens':>12} {'scoped tokens':>14} {'ratio':>7} {'full ms':>9} {'scoped ms':>10}")
+    for size in args.sizes:
+        files = synthetic_blueprint(size)["files"]
+        code_files = [project_file for project_file in files if not project_file["path"].endswith("/")]
+
+        start = time.perf_counter()
+        full_tokens = sum(
+            count_tokens(gather_project_context(SYNTHETIC_DESCRIPTION, files)) for _ in code_files
+        )
+        full_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        index = BlueprintIndex(SYNTHETIC_DESCRIPTION, files)
+        scoped_tokens = sum(count_tokens(index.context_for(project_file)) for project_file in code_files)
+        scoped_ms = (time.perf_counter() - start) * 1000
+
+        print(
+            f"{len(code_files):6d} {full_tokens:12d} {scoped_tokens:14d} {full_tokens / scoped_tokens:6.1f}x "
+            f"{full_ms:9.1f} {scoped_ms:10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
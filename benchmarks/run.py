@@ -0,0 +1,331 @@
+"""
+End-to-end benchmark suite of ScriptMonkey, running offline against the fake backend.
+
+Every case runs in a fresh subprocess so its peak memory is measured in isolation. For each case the suite reports
+the wall time, the API time simulated by the fake backend (the sum over all requests, which exceeds the wall time
+when requests run in parallel), prompt, completion and provider-cached prompt tokens, and peak RSS. Build cases also
+report the time spent planning the blueprint, the median and 99th percentile time of generating a file, and how many
+requests were hedged. The results can be saved as a JSON baseline and later runs compared against it.
+
+Cases:
+    build-10, build-50, build-200   the full build flow of `scriptmonkey` (blueprint, files, README)
+    ask-large                       `--ask` with three large source files
+    fix-large                       the `scriptmonkey.run()` error handler on a large source file
+    tree, gather-context, remove-code-blocks, render
+                                    micro-benchmarks of create_tree, gather_project_context,
+                                    remove_code_block_lines and render_response_with_syntax_highlighting
+
+Usage:
+    python benchmarks/run.py [--cases build-10 ask-large] [--output baseline.json]
+    python benchmarks/run.py --compare baseline.json [--tolerance 0.2]
+    python benchmarks/run.py --cases build-200 --straggler-rate 0.05   # provider-side stragglers
+    python benchmarks/run.py --cases build-200 --straggler-rate 0.05 --hedge 95   # ... hedged at p95
+    python benchmarks/run.py --cases build-200 --plan hierarchical      # outline, then packages in parallel
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import SYNTHETIC_DESCRIPTION, synthetic_blueprint  # noqa: E402
+
+BUILD_CASES = {"build-10": 10, "build-50": 50, "build-200": 200}
+CASES = list(BUILD_CASES) + ["ask-large", "fix-large", "tree", "gather-context", "remove-code-blocks", "render"]
+
+# Metrics compared against a baseline; lower is better for all of them
+COMPARED_METRICS = ["wall_seconds", "peak_rss_mb", "prompt_tokens", "completion_tokens"]
+
+
+def large_python_source(lines: int) -> str:
+    """A syntactically valid Python module of about `lines` lines."""
+    parts = ['"""A large generated module."""', "import os", "import json", ""]
+    for i in range(lines // 6):
+        parts += ["", f"def function_{i}(value, factor={i}):", f'    """Scales value by {i}."""', "    return value * factor"]
+    return "\n".join(parts) + "\n"
+
+
+def markdown_response(code_blocks: int) -> str:
+    """A ChatGPT-like Markdown answer alternating explanations and Python code blocks."""
+    parts = []
+    for i in range(code_blocks):
+        parts.append(f"### Step {i}\n\nThis **step** explains how `function_{i}` works and why it is needed.\n\n")
+        parts.append(f"```python\ndef function_{i}(value):\n    return [value * n for n in range({i})]\n```\n\n")
+    return "".join(parts)
+
+
+def percentile(values: list, percent: float):
+    """The `percent` percentile of a list of values (nearest rank), or None if it is empty."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, math.ceil(len(values) * percent / 100) - 1))]
+
+
+def timed(function, number: int) -> dict:
+    """Runs a function `number` times and reports the total and per-call time."""
+    start = time.perf_counter()
+    for _ in range(number):
+        function()
+    elapsed = time.perf_counter() - start
+    return {"calls": number, "per_call_ms": elapsed / number * 1000}
+
+
+def run_case(name: str, workdir: str, args) -> dict:
+    """Runs one case in this process and returns its case-specific metrics."""
+    from scriptmonkey.openai_client import FakeBackend, disable_cache, set_backend
+
+    disable_cache()
+    backend = FakeBackend(
+        latency=args.latency,
+        latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        project_files=BUILD_CASES.get(name, 30),
+        straggler_rate=args.straggler_rate,
+    )
+    set_backend(backend)
+    metrics = {}
+
+    if name in BUILD_CASES:
+        from scriptmonkey.core import run_build
+        from scriptmonkey.telemetry import add_span_hook
+        from scriptmonkey.openai_client import configure_hedging, get_hedger
+
+        if args.hedge is not None:
+            configure_hedging(args.hedge)
+        file_seconds = []
+        blueprint_seconds = []
+
+        def record_span(span):
+            if span.name == "file":
+                file_seconds.append(span.duration)
+            elif span.name == "blueprint":
+                blueprint_seconds.append(span.duration)
+
+        add_span_hook(record_span)
+        failed_files = run_build(
+            SYNTHETIC_DESCRIPTION, base_directory=workdir, max_workers=args.jobs, planning=args.plan
+        )
+        metrics["files"] = BUILD_CASES[name]
+        metrics["failed_files"] = len(failed_files)
+        metrics["blueprint_seconds"] = sum(blueprint_seconds)
+        metrics["file_p50_seconds"] = percentile(file_seconds, 50)
+        metrics["file_p99_seconds"] = percentile(file_seconds, 99)
+        metrics["hedged_requests"] = get_hedger().stats["hedged"]
+
+    elif name == "ask-large":
+        from scriptmonkey.agents import ask_gpt_with_files
+
+        paths = []
+        for i in range(3):
+            path = os.path.join(workdir, f"module_{i}.py")
+            with open(path, "w") as f:
+                f.write(large_python_source(30_000))
+            paths.append(path)
+        ask_gpt_with_files("Why does function_1234 scale by the wrong factor?", paths, stream=True)
+
+    elif name == "fix-large":
+        from scriptmonkey.core import scriptmonkey_exception_handler
+
+        path = os.path.join(workdir, "large_module.py")
+        source = large_python_source(20_000) + "\nresult = function_1(1) / 0\n"
+        with open(path, "w") as f:
+            f.write(source)
+        try:
+            exec(compile(source, path, "exec"), {})
+        except ZeroDivisionError:
+            scriptmonkey_exception_handler(*sys.exc_info())
+
+    elif name == "tree":
+        from tree import build_synthetic_tree
+        from scriptmonkey.utils.tree import create_tree
+
+        metrics["entries"] = build_synthetic_tree(workdir, 20_000)
+        metrics.update(timed(lambda: create_tree(workdir), 5))
+
+    elif name == "gather-context":
+        from scriptmonkey.agents import gather_project_context
+
+        files = synthetic_blueprint(200)["files"]
+        metrics.update(timed(lambda: gather_project_context(SYNTHETIC_DESCRIPTION, files), 200))
+
+    elif name == "remove-code-blocks":
+        from scriptmonkey.utils.parsers import remove_code_block_lines
+
+        text = "```python\n" + large_python_source(50_000) + "```\n"
+        metrics.update(timed(lambda: remove_code_block_lines(text), 20))
+
+    elif name == "render":
+        from scriptmonkey.utils.ui import render_response_with_syntax_highlighting
+
+        response = markdown_response(50)
+        metrics.update(timed(lambda: render_response_with_syntax_highlighting(response), 5))
+
+    metrics.update({f"api_{key}": value for key, value in backend.stats.items()})
+    return metrics
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 / 1024 if platform.system() == "Darwin" else peak / 1024
+
+
+def child_main(args) -> None:
+    workdir = tempfile.mkdtemp(prefix="scriptmonkey-bench-")
+    stdout = sys.stdout
+    try:
+        # The cases print a lot; only the result matters
+        sys.stdout = open(os.devnull, "w")
+        start = time.perf_counter()
+        metrics = run_case(args.run_case, workdir, args)
+        wall_seconds = time.perf_counter() - start
+    finally:
+        sys.stdout = stdout
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "wall_seconds": wall_seconds,
+        "simulated_api_seconds": metrics.pop("api_simulated_seconds"),
+        "requests": metrics.pop("api_requests"),
+        "errors": metrics.pop("api_errors"),
+        "prompt_tokens": metrics.pop("api_prompt_tokens"),
+        "completion_tokens": metrics.pop("api_completion_tokens"),
+        "cached_tokens": metrics.pop("api_cached_tokens"),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    result.update(metrics)
+    with open(args.result_file, "w") as f:
+        json.dump(result, f)
+
+
+def run_in_subprocess(name: str, args) -> dict:
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        result_file = f.name
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--run-case", name,
+        "--result-file", result_file,
+        "--jobs", str(args.jobs),
+        "--latency", str(args.latency),
+        "--latency-sigma", str(args.latency_sigma),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--error-rate", str(args.error_rate),
+        "--straggler-rate", str(args.straggler_rate),
+        "--plan", args.plan,
+    ] + (["--hedge", str(args.hedge)] if args.hedge is not None else [])  # fmt: skip
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Case {name} failed:\n{completed.stderr}")
+        with open(result_file) as f:
+            return json.load(f)
+    finally:
+        os.remove(result_file)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a description of every metric that is worse than the baseline by more than `tolerance`."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("cases", {}).get(name)
+        if reference is None:
+            continue
+        for metric in COMPARED_METRICS + (["per_call_ms"] if "per_call_ms" in result else []):
+            old, new = reference.get(metric), result.get(metric)
+            if old and new is not None and new > old * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def format_value(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.3f}" if value < 100 else f"{value:.0f}"
+    return str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ScriptMonkey end-to-end benchmarks (offline, fake backend)")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--output", help="Write the results as a JSON baseline to this file")
+    parser.add_argument("--compare", help="Compare the results with a JSON baseline and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default: 0.2)")
+    parser.add_argument("--jobs", type=int, default=8, help="Files generated in parallel in build cases")
+    parser.add_argument("--latency", type=float, default=0.05, help="Median simulated time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--tokens-per-second", type=float, default=2000, help="Simulated generation speed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of simulated requests that fail")
+    parser.add_argument(
+        "--straggler-rate", type=float, default=0.0, help="Fraction of simulated requests that are 5x slower"
+    )
+    parser.add_argument(
+        "--plan", choices=["single", "hierarchical"], default="single", help="How build cases plan the blueprint"
+    )
+    parser.add_argument(
+        "--hedge", type=float, metavar="PERCENTILE", help="Hedge requests slower than this latency percentile"
+    )
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        child_main(args)
+        return
+
+    columns = ["wall_seconds", "simulated_api_seconds", "requests", "prompt_tokens", "completion_tokens",
+               "cached_tokens", "file_p99_seconds", "peak_rss_mb", "per_call_ms"]  # fmt: skip
+    print(f"{'case':<20}" + "".join(f"{column:>22}" for column in columns))
+    results = {}
+    for name in args.cases:
+        results[name] = run_in_subprocess(name, args)
+        print(f"{name:<20}" + "".join(f"{format_value(results[name].get(column)):>22}" for column in columns))
+
+    if args.output:
+        baseline = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {
+                "jobs": args.jobs,
+                "latency": args.latency,
+                "latency_sigma": args.latency_sigma,
+                "tokens_per_second": args.tokens_per_second,
+                "error_rate": args.error_rate,
+                "straggler_rate": args.straggler_rate,
+                "plan": args.plan,
+                "hedge": args.hedge,
+            },
+            "cases": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"- {regression}")
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
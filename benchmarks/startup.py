@@ -0,0 +1,103 @@
+"""
+Startup benchmark for ScriptMonkey.
+
+Measures the cold import time of `scriptmonkey` with `python -X importtime`, the wall time of
+`python -m scriptmonkey --help`, and checks that no heavy dependency is imported eagerly.
+
+Usage:
+    python benchmarks/startup.py [--runs 10] [--import-budget-ms 100] [--help-budget-ms 300]
+
+Exits with a non-zero status when a budget is exceeded.
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Target cold-start budgets
+IMPORT_BUDGET_MS = 100
+HELP_BUDGET_MS = 300
+
+# Modules that must only be imported on first real use
+HEAVY_MODULES = ["openai", "rich", "pydantic", "pyperclip", "dotenv", "httpx"]
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env.pop("OPENAI_API_KEY", None)  # Importing must never need the API key
+    return env
+
+
+def measure_import_ms() -> float:
+    """Returns the cumulative import time of the `scriptmonkey` package in milliseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import scriptmonkey"],
+        env=_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == "scriptmonkey":
+            return int(parts[1]) / 1000
+    raise RuntimeError("Could not find scriptmonkey in the -X importtime output")
+
+
+def measure_help_ms() -> float:
+    """Returns the wall time of `python -m scriptmonkey --help` in milliseconds."""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "scriptmonkey", "--help"], env=_env(), capture_output=True, check=True
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+def eager_heavy_modules() -> list:
+    """Returns the heavy modules that are loaded by a plain `import scriptmonkey`."""
+    code = f"import sys, scriptmonkey; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], env=_env(), capture_output=True, text=True, check=True
+    )
+    return [name for name in result.stdout.strip().split(",") if name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ScriptMonkey startup benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--help-budget-ms", type=float, default=HELP_BUDGET_MS)
+    args = parser.parse_args()
+
+    import_times = [measure_import_ms() for _ in range(args.runs)]
+    help_times = [measure_help_ms() for _ in range(args.runs)]
+    eager = eager_heavy_modules()
+
+    import_ms = statistics.median(import_times)
+    help_ms = statistics.median(help_times)
+    print(f"import scriptmonkey:           median {import_ms:7.1f} ms (budget {args.import_budget_ms:.0f} ms)")
+    print(f"python -m scriptmonkey --help: median {help_ms:7.1f} ms (budget {args.help_budget_ms:.0f} ms)")
+    print(f"heavy modules imported eagerly: {', '.join(eager) or 'none'}")
+
+    failures = []
+    if import_ms > args.import_budget_ms:
+        failures.append("import time")
+    if help_ms > args.help_budget_ms:
+        failures.append("--help time")
+    if eager:
+        failures.append("eager imports")
+    if failures:
+        print(f"FAILED: {', '.join(failures)} over budget")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
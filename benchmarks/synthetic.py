@@ -0,0 +1,18 @@
+"""
+Synthetic inputs shared by the benchmarks.
+
+The blueprints come from the fake backend (`scriptmonkey.openai_client.fake`), which also returns them for
+project structure requests.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scriptmonkey.openai_client.fake import synthetic_blueprint  # noqa: E402,F401
+
+SYNTHETIC_DESCRIPTION = (
+    "A Flask web application for managing a book library with user authentication, models for users, books "
+    "and authors, a REST API, an admin dashboard and HTML templates."
+)
@@ -0,0 +1,95 @@
+"""
+Benchmark for `scriptmonkey.utils.tree.create_tree` on a synthetic large directory tree.
+
+The synthetic workspace mixes source packages, data files, an ignored `node_modules` directory and `generated`
+directories excluded by a `.gitignore`, similar to a large monorepo.
+
+Usage:
+    python benchmarks/tree.py [--entries 300000] [--runs 3] [--keep DIR]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scriptmonkey.utils.tree import create_tree  # noqa: E402
+
+
+def build_synthetic_tree(root: str, entries: int) -> int:
+    """Creates roughly `entries` files and directories under `root` and returns how many were created."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("generated/\n*.log\n")
+    created = 1
+    package = 0
+    while created < entries:
+        # A source package: nested modules, a data directory and some docs
+        package_dir = os.path.join(root, "packages", f"pkg_{package:04d}")
+        for depth in range(4):
+            module_dir = os.path.join(package_dir, *[f"level{d}" for d in range(depth + 1)])
+            os.makedirs(module_dir, exist_ok=True)
+            created += 1
+            for i in range(10):
+                open(os.path.join(module_dir, f"module_{i}.py"), "w").close()
+                open(os.path.join(module_dir, f"data_{i}.json"), "w").close()
+                created += 2
+
+        # An ignored dependency directory with many files, which should never be walked
+        vendor_dir = os.path.join(package_dir, "node_modules", "dep", "lib")
+        os.makedirs(vendor_dir, exist_ok=True)
+        for i in range(100):
+            open(os.path.join(vendor_dir, f"file_{i}.js"), "w").close()
+        created += 103
+
+        # Build artifacts excluded by the .gitignore, which should never be walked either
+        generated_dir = os.path.join(package_dir, "generated", "artifacts")
+        os.makedirs(generated_dir, exist_ok=True)
+        for i in range(50):
+            open(os.path.join(generated_dir, f"artifact_{i}.py"), "w").close()
+        created += 52
+        package += 1
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="create_tree benchmark")
+    parser.add_argument("--entries", type=int, default=300_000, help="Approximate number of entries to create")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--keep", help="Build the synthetic tree in this directory and keep it")
+    args = parser.parse_args()
+
+    root = args.keep or tempfile.mkdtemp(prefix="scriptmonkey_tree_bench_")
+    try:
+        start = time.perf_counter()
+        created = build_synthetic_tree(root, args.entries)
+        print(f"Created {created} entries in {time.perf_counter() - start:.1f} s at {root}")
+
+        configurations = [
+            ("default budget", {}),
+            ("no node/byte budget", {"max_nodes": None, "max_bytes": None}),
+            ("unbounded depth and budget", {"max_depth": None, "max_nodes": None, "max_bytes": None}),
+            ("unbounded, no ignore files", {"max_depth": None, "max_nodes": None, "max_bytes": None, "respect_ignore_files": False}),
+        ]
+        for label, kwargs in configurations:
+            timings = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                tree = create_tree(root, **kwargs)
+                timings.append(time.perf_counter() - start)
+            print(
+                f"{label:28s} median {statistics.median(timings) * 1000:8.1f} ms, "
+                f"{tree.count(chr(10)):7d} lines, {len(tree):9d} chars"
+            )
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
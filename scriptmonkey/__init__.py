@@ -1,2 +1 @@
-from .core import run
-
+from .core import run, stop
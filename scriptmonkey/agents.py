@@ -1,42 +1,128 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from rich.table import Table
 from rich.console import Console
 
+from .blueprint import describe_file, project_layout, project_overview
+from .planner import HIERARCHICAL, SINGLE, normalize_path, stream_hierarchical_structure
+from .routing import OUTPUT_CONTINUATIONS, TEMPLATE, Router, output_limit
+from .scheduler import BuildScheduler
+from .templates import render_template, template_for
+from .telemetry import current_span, span, traced
 from .utils.tree import create_tree
+from .utils.tokens import count_tokens
+from .utils.context_packer import DEFAULT_MAX_CONTEXT_TOKENS, OMITTED, TRUNCATED, pack_files
 from .utils.file_handler import read_file
-from .utils.ui import render_response_with_syntax_highlighting
+from .utils.manifest import BuildManifest, DONE, FAILED, MODIFIED, UNTRACKED
+from .utils.ui import StreamingRenderer, render_response_with_syntax_highlighting
 from .utils.parsers import remove_code_block_lines
-from .openai_client.client import chatgpt_json, chatgpt
-from .openai_client.basemodels import ProjectStructureResponse
+from .utils.json_stream import JsonArrayStream
+from .openai_client.client import (
+    chatgpt_json,
+    chatgpt,
+    chatgpt_stream,
+    chatgpt_json_stream,
+    chatgpt_json_async,
+    chatgpt_async,
+    chatgpt_stream_async,
+    get_usage,
+    track_usage,
+)
+from .openai_client.basemodels import ProjectFile, ProjectStructureResponse
 
 console = Console()
 
 
+PROJECT_STRUCTURE_INSTRUCTIONS = (
+    "Generate a detailed project structure for a multi-level application. The project will be placed directly inside a folder named 'generated_project'."
+    "\n- Do NOT include 'generated_project/' as part of the paths. All paths should be relative to the root of the project directory, meaning they should start directly with the file or folder names as if they are inside 'generated_project'."
+    "\n- Provide a list of directories and files with their full relative paths."
+    "\n- Each directory should end with a '/' to indicate that it is a folder."
+    "\n- For each file or directory, include a 'description' that explains its purpose."
+    "\n- If the file is a Python code file, also include a 'functions' list. For each function, include:"
+    "\n  - 'function_name': The name of the function."
+    "\n  - 'description': A description of what the function does."
+    "\n  - 'inputs': A list of the function's expected inputs, including data types."
+    "\n  - 'outputs': A list of the function's expected outputs, including data types."
+    "\n- Do not include any extra explanations, commentary, or introductory text. Only provide the structured data as requested."
+)
+
+
+# Opens the system message of every file and README request of a build, followed by the project overview, so the
+# requests of a build share a byte-identical prefix that the provider can serve from its prompt cache
+BUILD_SYSTEM_PROMPT = (
+    "You are writing the files of a software project, one file per request. The project is described below."
+)
+
+README_INSTRUCTIONS = (
+    "Write a complete README.md file based on the following project details. "
+    "The README should include the project overview, installation instructions, usage guide, file structure summary, key features, and configuration details. "
+    "Make sure the README is well-structured and formatted using Markdown without wrapping the entire README in backticks or any other non-readme commentary."
+    "Do not include any commentary, explanations, or text outside of the README content."
+)
+
+
 def generate_project_structure(description: str) -> ProjectStructureResponse:
     """Generates the project structure based on the user's project description using OpenAI."""
-    instructions = (
-        "Generate a detailed project structure for a multi-level application. The project will be placed directly inside a folder named 'generated_project'."
-        "\n- Do NOT include 'generated_project/' as part of the paths. All paths should be relative to the root of the project directory, meaning they should start directly with the file or folder names as if they are inside 'generated_project'."
-        "\n- Provide a list of directories and files with their full relative paths."
-        "\n- Each directory should end with a '/' to indicate that it is a folder."
-        "\n- For each file or directory, include a 'description' that explains its purpose."
-        "\n- If the file is a Python code file, also include a 'functions' list. For each function, include:"
-        "\n  - 'function_name': The name of the function."
-        "\n  - 'description': A description of what the function does."
-        "\n  - 'inputs': A list of the function's expected inputs, including data types."
-        "\n  - 'outputs': A list of the function's expected outputs, including data types."
-        "\n- Do not include any extra explanations, commentary, or introductory text. Only provide the structured data as requested."
-    )
-
     # Call the chatgpt_json function to get structured project plan
-    project_structure = chatgpt_json(
-        instructions=instructions, content=description, response_format=ProjectStructureResponse
-    )
+    with span("blueprint"):
+        project_structure = chatgpt_json(
+            instructions=PROJECT_STRUCTURE_INSTRUCTIONS, content=description, response_format=ProjectStructureResponse
+        )
 
     return project_structure
 
 
-def generate_code_for_file(file_description: dict, project_description: str, project_files: list) -> str:
+def stream_project_structure(description: str):
+    """
+    Streams the project structure: yields each entry of its `files` as soon as it has been generated, so work on
+    the first files can start while the rest of the blueprint is still being written.
+
+    The complete structure is validated when the stream ends, so a malformed blueprint raises like
+    generate_project_structure() does, after the valid entries before it were yielded.
+
+    Yields:
+        dict: A blueprint entry, with the path, description and functions of a file or directory.
+    """
+    # Ended explicitly: the generator is suspended at every entry and the caller's spans must not nest in it
+    trace_span = span("blueprint")
+    parser = JsonArrayStream("files")
+    chunks = []
+    try:
+        for chunk in chatgpt_json_stream(
+            instructions=PROJECT_STRUCTURE_INSTRUCTIONS, content=description, response_format=ProjectStructureResponse
+        ):
+            chunks.append(chunk)
+            for project_file in parser.feed(chunk):
+                yield ProjectFile.model_validate(project_file).model_dump()
+        ProjectStructureResponse.model_validate_json("".join(chunks))
+    except GeneratorExit:
+        trace_span.end()
+        raise
+    except BaseException as e:
+        trace_span.end(e)
+        raise
+    trace_span.end()
+
+
+async def generate_project_structure_async(description: str) -> ProjectStructureResponse:
+    """Async version of generate_project_structure()."""
+    with span("blueprint"):
+        return await chatgpt_json_async(
+            instructions=PROJECT_STRUCTURE_INSTRUCTIONS, content=description, response_format=ProjectStructureResponse
+        )
+
+
+def generate_code_for_file(
+    file_description: dict,
+    project_description: str,
+    project_files: list,
+    context: str = None,
+    model: str = None,
+    overview: str = None,
+) -> str:
     """
     Generates content for a given file based on its description using the chatgpt() function.
 
@@ -44,12 +130,89 @@ def generate_code_for_file(file_description: dict, project_description: str, pro
         file_description (dict): The description of the file for which content is being generated.
         project_description (str): A high-level description of the project's purpose and goals.
         project_files (list): List of all project files for context.
+        context (str, optional): Precomputed project context for this file, e.g. from `BlueprintIndex.context_for`.
+            Defaults to the full context of every file from `gather_project_context`.
+        model (str, optional): Model to use, e.g. the one chosen by `scriptmonkey.routing.Router`. Defaults to the
+            backend's default model.
+        overview (str, optional): The part of the context shared by every file, e.g. from
+            `BlueprintIndex.overview`, with `context` then only the part specific to this file. It is sent ahead of
+            the file's prompt so the provider can cache it across files. Defaults to None.
 
     Returns:
         str: The generated content for the file.
+
+    Raises:
+        RuntimeError: The code was still cut off at its output cap (see routing.output_limit) after its
+            continuations.
     """
-    # Gather context about the project goal and other files
-    context = gather_project_context(project_description, project_files)
+    # Call the chatgpt function to generate the content
+    system, prompt = _code_prompt(file_description, project_description, project_files, context, overview)
+    max_tokens = output_limit(file_description)
+    generated_content, finish_reason = chatgpt(
+        prompt=prompt,
+        model=model,
+        system=system,
+        max_tokens=max_tokens,
+        max_continuations=OUTPUT_CONTINUATIONS,
+        with_finish_reason=True,
+    )
+    # Recorded on the enclosing span, e.g. the file span of a build
+    current_span().set(truncated=finish_reason == "length")
+    _check_complete(finish_reason, max_tokens)
+
+    # Clean up any unintended code blocks
+    generated_content = remove_code_block_lines(generated_content)
+
+    return generated_content
+
+
+async def generate_code_for_file_async(
+    file_description: dict,
+    project_description: str,
+    project_files: list,
+    context: str = None,
+    model: str = None,
+    overview: str = None,
+) -> str:
+    """Async version of generate_code_for_file()."""
+    system, prompt = _code_prompt(file_description, project_description, project_files, context, overview)
+    max_tokens = output_limit(file_description)
+    generated_content, finish_reason = await chatgpt_async(
+        prompt=prompt,
+        model=model,
+        system=system,
+        max_tokens=max_tokens,
+        max_continuations=OUTPUT_CONTINUATIONS,
+        with_finish_reason=True,
+    )
+    # Recorded on the enclosing span, e.g. the file span of a build
+    current_span().set(truncated=finish_reason == "length")
+    _check_complete(finish_reason, max_tokens)
+    return remove_code_block_lines(generated_content)
+
+
+def _check_complete(finish_reason: str, max_tokens: int) -> None:
+    """Raises if the code of a file was still cut off at its output cap after its continuations: it would not run."""
+    if finish_reason == "length":
+        raise RuntimeError(
+            f"the generated code was still cut off after {OUTPUT_CONTINUATIONS + 1} x {max_tokens} tokens"
+        )
+
+
+def _code_prompt(
+    file_description: dict, project_description: str, project_files: list, context: str = None, overview: str = None
+) -> tuple:
+    """
+    Builds the prompt that generates the content of a file.
+
+    Returns:
+        tuple: The system message, with the context shared by every file of the project, and the prompt, with the
+            description and context of this file.
+    """
+    # Gather context about the project goal and other files, which is the same for every file
+    if context is None:
+        overview, context = gather_project_context(project_description, project_files), ""
+    system = BUILD_SYSTEM_PROMPT if overview is None else f"{BUILD_SYSTEM_PROMPT}\n\n{overview}"
 
     # Extract the file extension to inform the content type
     file_extension = os.path.splitext(file_description["path"])[1].lower().strip(".")
@@ -67,9 +230,11 @@ def generate_code_for_file(file_description: dict, project_description: str, pro
         "Use relevant imports, references, and appropriate formatting or structure where necessary. Do not add extra commentary or explanation. "
         "Make sure to return the content directly, without wrapping it in any code fences like triple quotes or backticks ."
         "i.e. DO NOT include any triple backtrick wrappers at all for any code, (e.g. ```python<content here>```) just return the code as plain text."
+        f"\n\nFile Path: {file_description['path']}"
         f"\n\nFile Description: {file_description['description']}"
-        f"\n\n{context}\n"
     )
+    if context:
+        instructions += f"\n\n{context}\n"
 
     # Include functions for code files (if provided)
     if file_description.get("functions"):
@@ -80,43 +245,241 @@ def generate_code_for_file(file_description: dict, project_description: str, pro
                 f"(Inputs: {function['inputs']}, Outputs: {function['outputs']})\n"
             )
 
-    # Call the chatgpt function to generate the content
-    generated_content = chatgpt(prompt=instructions)
+    return system, instructions
 
-    # Clean up any unintended code blocks
-    generated_content = remove_code_block_lines(generated_content)
 
-    return generated_content
+def build_project(
+    project_structure_response: dict,
+    project_description: str,
+    base_directory: str = "./generated_project",
+    max_workers: int = 1,
+    manifest: BuildManifest = None,
+    routing: bool = True,
+    skip_readme: bool = False,
+) -> list:
+    """
+    Creates the directories and files for the project and generates code content for all file types.
 
+    Files are generated concurrently on up to `max_workers` threads, in dependency order: each file starts as soon
+    as the files it imports are written, and its prompt includes their actual signatures (see BuildScheduler).
+    Each file is written as soon as its content is ready. Progress is still reported in blueprint order, and a
+    failure in one file is reported without aborting the others or the files that depend on it.
 
-def build_project(
-    project_structure_response: dict, project_description: str, base_directory: str = "./generated_project"
-):
-    """Creates the directories and files for the project and generates code content for all file types."""
-    # Extract the list of project files for context
+    The build is resumable: a manifest under `<base_directory>/.scriptmonkey/` records every finished file, so
+    a rerun skips files that are already up to date before making any API call and only regenerates files that
+    are missing, failed, or whose blueprint entry changed. Files that were edited by hand are never overwritten.
+
+    With `routing`, trivial files such as empty `__init__.py` files, `.gitignore` and `requirements.txt` are
+    produced locally without an API call and simple files go to the backend's small model (see
+    scriptmonkey.routing); a table of the files, time and tokens of each tier is printed at the end.
+
+    Args:
+        project_structure_response (dict): The project blueprint returned by `generate_project_structure`.
+        project_description (str): A high-level description of the project's purpose and goals.
+        base_directory (str, optional): Directory the project is written to. Defaults to "./generated_project".
+        max_workers (int, optional): Number of files generated in parallel. Defaults to 1.
+        manifest (BuildManifest, optional): The build manifest to use. Defaults to the one in `base_directory`.
+        routing (bool, optional): Whether to route files to templates and the small model. Defaults to True.
+        skip_readme (bool, optional): Whether to leave out a README.md at the project root, for callers that
+            write it with generate_readme() (see is_project_readme). Defaults to False.
+
+    Returns:
+        list: The paths of the files that could not be generated.
+    """
+    # Extract the list of project files, indexed once so each file only gets the context it needs
     project_files = project_structure_response["files"]
+    manifest = manifest or BuildManifest(base_directory)
+    router = Router(enabled=routing)
+
+    def build_file(project_file, file_path, overview, context):
+        return _build_file(
+            project_file,
+            file_path,
+            project_description,
+            project_files,
+            overview,
+            context,
+            manifest,
+            base_directory,
+            router,
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        # Create directories up front and queue every file that needs to be generated, in dependency order
+        scheduler = BuildScheduler(
+            executor, build_file, project_description, base_directory, manifest, project_files=project_files
+        )
+        for project_file in project_files:
+            if not (skip_readme and is_project_readme(project_file)):
+                scheduler.add(project_file)
+        scheduler.finish_blueprint()
+        _print_levels(scheduler)
+        failed_files = _report_files(scheduler.pending)
+    router.print_report()
+    return failed_files
+
+
+def build_project_streaming(
+    project_description: str,
+    base_directory: str = "./generated_project",
+    max_workers: int = 1,
+    manifest: BuildManifest = None,
+    on_blueprint=None,
+    routing: bool = True,
+    planning: str = SINGLE,
+    skip_readme: bool = False,
+) -> tuple:
+    """
+    Plans and builds a project at the same time: the blueprint is streamed and each file is queued for generation
+    as soon as its entry is complete, which hides most of the blueprint's latency behind file generation.
+
+    A large project is planned hierarchically (see scriptmonkey.planner): its files are queued package by package,
+    as the parallel requests that detail the packages finish.
+
+    Files are generated, written and recorded in the manifest like in build_project(). While the blueprint is
+    still streaming, a file only waits for the files planned before it that it depends on, and entry points wait
+    for the complete blueprint.
 
-    # Iterate through each file in the project structure
-    for project_file in project_files:
-        file_path = os.path.join(base_directory, project_file["path"].lstrip("/"))
+    Args:
+        project_description (str): A high-level description of the project's purpose and goals.
+        base_directory (str, optional): Directory the project is written to. Defaults to "./generated_project".
+        max_workers (int, optional): Number of files generated in parallel. Defaults to 1.
+        manifest (BuildManifest, optional): The build manifest to use. Defaults to the one in `base_directory`.
+        on_blueprint (callable, optional): Called with the complete blueprint as soon as it is final, while files
+            are still being generated, e.g. to start the README. Defaults to None.
+        routing (bool, optional): Whether to route files to templates and the small model. Defaults to True.
+        planning (str, optional): How the blueprint is planned: "single", or "hierarchical" for a large project
+            (see scriptmonkey.planner). Defaults to "single".
+        skip_readme (bool, optional): Whether to leave out a README.md at the project root, like in
+            build_project(). Defaults to False.
+
+    Returns:
+        tuple: The project blueprint, and the paths of the files that could not be generated.
+    """
+    manifest = manifest or BuildManifest(base_directory)
+    router = Router(enabled=routing)
+    project_files = []
+    if planning == HIERARCHICAL:
+        blueprint = stream_hierarchical_structure(project_description)
+    else:
+        blueprint = stream_project_structure(project_description)
+
+    def build_file(project_file, file_path, overview, context):
+        return _build_file(
+            project_file,
+            file_path,
+            project_description,
+            project_files,
+            overview,
+            context,
+            manifest,
+            base_directory,
+            router,
+        )
 
-        # Check if it's a directory or file (directories end with '/')
-        if file_path.endswith("/"):
-            os.makedirs(file_path, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        scheduler = BuildScheduler(executor, build_file, project_description, base_directory, manifest)
+        for project_file in blueprint:
+            print(f"🐒 ScriptMonkey planned: {project_file['path']}")
+            project_files.append(project_file)
+            if not (skip_readme and is_project_readme(project_file)):
+                scheduler.add(project_file)
+        scheduler.finish_blueprint()
+        _print_levels(scheduler)
+
+        project_structure = {"files": project_files}
+        manifest.set_blueprint(project_description, project_structure)
+        if on_blueprint is not None:
+            on_blueprint(project_structure)
+        failed_files = _report_files(scheduler.pending)
+    router.print_report()
+    return project_structure, failed_files
+
+
+def is_project_readme(project_file: dict) -> bool:
+    """
+    Whether a blueprint entry is the project's README.md. run_build() writes it with generate_readme(), from the
+    whole blueprint, and so skips it when building the other files.
+    """
+    return normalize_path(project_file["path"]) == "README.md"
+
+
+def _print_levels(scheduler: BuildScheduler) -> None:
+    widest = max((len(level) for level in scheduler.levels), default=0)
+    print(
+        f"🐒 ScriptMonkey ordered {len(scheduler.entries)} file(s) by their dependencies: "
+        f"{len(scheduler.levels)} level(s), up to {widest} file(s) in parallel."
+    )
+
+
+def _report_files(pending: list) -> list:
+    """Waits for the queued files and reports every file in blueprint order. Returns the files that failed."""
+    failed_files = []
+    for file_path, future, status in pending:
+        if status is None:
             print(f"🐒 ScriptMonkey created directory: {file_path}")
+        elif status == DONE:
+            print(f"Already up to date, skipping: {file_path}")
+        elif status == MODIFIED:
+            print(f"File was modified after it was generated, skipping: {file_path}")
+        elif status == UNTRACKED:
+            print(f"File already exists, skipping: {file_path}")
         else:
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            try:
+                future.result()
+                print(f"🐒 ScriptMonkey created file with generated content at: '{file_path}'.")
+            except Exception as e:
+                failed_files.append(file_path)
+                print(f"❌ ScriptMonkey failed to generate '{file_path}': {e}")
+    return failed_files
+
+
+def _build_file(
+    project_file: dict,
+    file_path: str,
+    project_description: str,
+    project_files: list,
+    overview: str,
+    context: str,
+    manifest: BuildManifest,
+    base_directory: str,
+    router: Router,
+) -> str:
+    """
+    Generates the content for a single blueprint file with the tier chosen by the router, writes it and records
+    the outcome in the manifest.
 
-            # Generate content for all files, including Python, HTML, JSON, CSS, etc.
-            generated_content = generate_code_for_file(project_file, project_description, project_files)
+    Returns:
+        str: The generated content.
+    """
+    with span("file", path=project_file["path"]) as file_span:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        # Until the file is written it counts as failed, so an interrupted build regenerates it
+        manifest.mark(project_file, FAILED)
+
+        # Generate content for all files, including Python, HTML, JSON, CSS, etc.
+        tier = router.route(project_file)
+        model = router.model_for(tier)
+        file_span.set(tier=tier, model=model)
+        started = time.perf_counter()
+        usage = None
+        if tier == TEMPLATE:
+            template = template_for(project_file)
+            generated_content = render_template(template, project_file, base_directory, project_files)
+        else:
+            # The usage reported by the API: the system message, cached prompt tokens and continuations included. A
+            # cut-off file raises and is not written, so it stays FAILED and the next build regenerates it
+            with track_usage() as usage:
+                generated_content = generate_code_for_file(
+                    project_file, project_description, project_files, context, model=model, overview=overview
+                )
+        router.record(tier, model, time.perf_counter() - started, usage)
 
-            # Write the generated content to the file if it doesn't already exist
-            if not os.path.exists(file_path):
-                with open(file_path, "w") as f:
-                    f.write(generated_content)
-                print(f"🐒 ScriptMonkey created file with generated content at: '{file_path}'.")
-            else:
-                print(f"File already exists, skipping: {file_path}")
+        with open(file_path, "w") as f:
+            f.write(generated_content)
+        manifest.mark(project_file, DONE, content=generated_content)
+        return generated_content
 
 
 def gather_project_context(project_description: str, project_files: list) -> str:
@@ -133,85 +496,217 @@ def gather_project_context(project_description: str, project_files: list) -> str
     context = f"Project Goal: {project_description}\n\n"
     context += "Project Context:\n"
     for file in project_files:
-        if file["functions"]:
-            context += f"- In '{file['path']}', the following functions are defined:\n"
-            for function in file["functions"]:
-                context += f"  - {function['function_name']}: {function['description']} (Inputs: {function['inputs']}, Outputs: {function['outputs']})\n"
-        else:
-            context += f"- '{file['path']}' is defined with no specific functions listed.\n"
+        context += describe_file(file)
     return context
 
 
 def generate_readme(description: str, project_structure: dict) -> str:
     """Generates a README.md content based on the project description and structure."""
-    instructions = (
-        "Write a complete README.md file based on the following project details. "
-        "The README should include the project overview, installation instructions, usage guide, file structure summary, key features, and configuration details. "
-        "Make sure the README is well-structured and formatted using Markdown without wrapping the entire README in backticks or any other non-readme commentary."
-        "Do not include any commentary, explanations, or text outside of the README content."
-        f"\n\nProject Description: {description}\n"
-        f"\nProject Structure: {project_structure}\n"
-    )
-
-    readme_content = chatgpt(prompt=instructions)
+    with span("readme"):
+        system, prompt = _readme_prompt(description, project_structure)
+        readme_content = chatgpt(prompt=prompt, system=system)
     readme_content = readme_content.strip("```markdown").strip("```")
     return readme_content
 
 
-def ask_gpt_with_files(question, file_paths, include_tree=False):
+async def generate_readme_async(description: str, project_structure: dict) -> str:
+    """Async version of generate_readme()."""
+    with span("readme"):
+        system, prompt = _readme_prompt(description, project_structure)
+        readme_content = await chatgpt_async(prompt=prompt, system=system)
+    return readme_content.strip("```markdown").strip("```")
+
+
+def _readme_prompt(description: str, project_structure: dict) -> tuple:
+    """Builds the system message, with the same project overview as the files of the build, and the prompt."""
+    layout = project_layout([project_file["path"] for project_file in project_structure.get("files", [])])
+    system = f"{BUILD_SYSTEM_PROMPT}\n\n{project_overview(description, layout)}"
+    return system, f"{README_INSTRUCTIONS}\n\nProject Structure: {project_structure}\n"
+
+
+@traced("ask")
+def ask_gpt_with_files(
+    question, file_paths, include_tree=False, stream=False, max_context_tokens=DEFAULT_MAX_CONTEXT_TOKENS
+):
     """
     Constructs a detailed and flexible prompt for ChatGPT using a question and optionally including content from specified files.
+
+    With `stream=True` the answer is rendered incrementally while it is being generated instead of after the
+    whole completion has arrived.
+
+    The files and the directory tree are fitted into `max_context_tokens` tokens (None for no limit). When they do
+    not fit, the parts of the files most relevant to the question are kept and the rest is elided with explicit
+    markers. A per-file token breakdown is printed before the prompt is sent.
+
+    The files and the tree come before the question, so asking several questions about the same files sends the
+    same prompt prefix, which the provider serves from its prompt cache.
+
+    Returns:
+        str: The answer, or None if the request failed.
+    """
+    system, prompt = _ask_prompt(question, file_paths, include_tree, max_context_tokens)
+    usage = get_usage()
+
+    # Use the OpenAI API to get a response
+    try:
+        if stream:
+            # Render the response as it streams in
+            console.rule("🐒 ANSWER 🐒")
+            chunks = []
+            with StreamingRenderer() as renderer:
+                for chunk in chatgpt_stream(prompt=prompt, system=system):
+                    chunks.append(chunk)
+                    renderer.feed(chunk)
+            response = "".join(chunks)
+        else:
+            response = chatgpt(prompt=prompt, system=system)
+            # Display the response using rich markdown and detect code blocks
+            console.rule("🐒 ANSWER 🐒")
+            render_response_with_syntax_highlighting(response)
+        console.print("\n")
+        console.rule()
+        print_api_usage(usage)
+        return response
+    except Exception as e:
+        console.print(f"[bold red]Error using OpenAI API: {e}[/bold red]")
+
+
+async def ask_gpt_with_files_async(
+    question, file_paths, include_tree=False, stream=False, max_context_tokens=DEFAULT_MAX_CONTEXT_TOKENS
+):
+    """Async version of ask_gpt_with_files()."""
+    import asyncio
+
+    with span("ask"):
+        # Reading the files and walking the tree block, so they run in a worker thread, off the event loop
+        system, prompt = await asyncio.to_thread(_ask_prompt, question, file_paths, include_tree, max_context_tokens)
+        usage = get_usage()
+
+        try:
+            if stream:
+                console.rule("🐒 ANSWER 🐒")
+                chunks = []
+                with StreamingRenderer() as renderer:
+                    async for chunk in chatgpt_stream_async(prompt=prompt, system=system):
+                        chunks.append(chunk)
+                        renderer.feed(chunk)
+                response = "".join(chunks)
+            else:
+                response = await chatgpt_async(prompt=prompt, system=system)
+                console.rule("🐒 ANSWER 🐒")
+                render_response_with_syntax_highlighting(response)
+            console.print("\n")
+            console.rule()
+            print_api_usage(usage)
+            return response
+        except Exception as e:
+            console.print(f"[bold red]Error using OpenAI API: {e}[/bold red]")
+
+
+def _ask_prompt(question, file_paths, include_tree, max_context_tokens) -> tuple:
+    """
+    Builds the prompt of ask_gpt_with_files() and prints the context that is sent with it.
+
+    Returns:
+        tuple: The system message, with the instructions, files and tree, and the prompt, with the question.
     """
-    prompt = (
-        f"### Question:\n"
-        f"{question}\n\n"
+    system = (
         "If I have included any files below, you can use them for additional context for this question. "
         "Please analyze the provided files below (if available) as needed and reference them when forming your answer. "
         "If the answer involves code, please format any code examples using Markdown with properly labeled language-specific code blocks. "
         "Your response should be in Markdown format to preserve readability.\n\n"
     )
 
+    files = []
+    for path in file_paths:
+        try:
+            files.append((path, read_file(path)))
+        except FileNotFoundError:
+            console.print(f"[bold yellow]Warning: {path} not found. Skipping this file.[/bold yellow]")
+        except Exception as e:
+            console.print(f"[bold red]Error reading {path}: {e}[/bold red]")
+
+    # The directory tree is already bounded in size, so it is taken out of the budget first
+    tree = None
+    tree_tokens = 0
+    if include_tree:
+        tree = create_tree(os.getcwd())
+        tree_tokens = count_tokens(tree)
+
+    files_budget = None if max_context_tokens is None else max(0, max_context_tokens - tree_tokens)
+    packed_files = pack_files(question, files, max_tokens=files_budget)
+    if packed_files or tree is not None:
+        print_context_breakdown(packed_files, tree_tokens if tree is not None else None, max_context_tokens)
+
     if file_paths:
-        prompt += "### Files Provided:\n"
-        for path in file_paths:
-            try:
-                content = read_file(path)
-                prompt += (
-                    f"## File: {path}\n"
-                    f"The content of the file '{path}' is included below. Use this as context for answering the question:\n\n"
-                    f"```\n{content}\n```\n\n"
-                )
-            except FileNotFoundError:
-                console.print(f"[bold yellow]Warning: {path} not found. Skipping this file.[/bold yellow]")
-            except Exception as e:
-                console.print(f"[bold red]Error reading {path}: {e}[/bold red]")
+        system += "### Files Provided:\n"
+        for packed_file in packed_files:
+            path = packed_file.path
+            if packed_file.status == OMITTED:
+                system += f"## File: {path}\nThe file '{path}' was omitted because it did not fit in the context budget.\n\n"
+                continue
+            system += (
+                f"## File: {path}\n"
+                f"The content of the file '{path}' is included below. Use this as context for answering the question:\n\n"
+            )
+            if packed_file.status == TRUNCATED:
+                system += "Only the parts of this file most relevant to the question are included; elided lines are marked with '... [N lines elided] ...'.\n\n"
+            system += f"```\n{packed_file.packed_content}\n```\n\n"
 
     else:
-        prompt += (
-            "No specific files have been provided, so please base your response solely on the question above. "
+        system += (
+            "No specific files have been provided, so please base your response solely on the question. "
             "If the response includes any code examples or technical explanations, please use Markdown formatting with language-specific code blocks for clarity.\n"
         )
 
     # Include the directory tree if the flag is set
-    if include_tree:
-        start_directory = os.getcwd()
-        tree = create_tree(start_directory)
-        prompt += "### Directory Tree:\n"
-        prompt += f"The directory tree of the current working directory is included below (up to a depth of 6 levels):\n\n```\n{tree}\n```\n\n"
+    if tree is not None:
+        system += "### Directory Tree:\n"
+        system += f"The directory tree of the current working directory is included below (up to a depth of 6 levels):\n\n```\n{tree}\n```\n\n"
         console.print("- - Directory Tree - -")
         console.print(tree)
 
     # Output the constructed prompt to the console for transparency
     console.rule("🐒 ScriptMonkey is Thinking 🐒")
     console.rule()
+    return system, f"### Question:\n{question}\n"
 
-    # Use the OpenAI API to get a response
-    try:
-        response = chatgpt(prompt=prompt)
-        # Display the response using rich markdown and detect code blocks
-        console.rule("🐒 ANSWER 🐒")
-        render_response_with_syntax_highlighting(response)
-        console.print("\n")
-        console.rule()
-    except Exception as e:
-        console.print(f"[bold red]Error using OpenAI API: {e}[/bold red]")
+
+def print_api_usage(since: dict = None) -> None:
+    """
+    Prints the requests and tokens of the API calls made since `since`, a snapshot from `get_usage()` (or since
+    the start of the process), including the prompt tokens the provider served from its prompt cache.
+    """
+    usage = get_usage()
+    if since is not None:
+        usage = {key: value - since.get(key, 0) for key, value in usage.items()}
+    if not usage["requests"]:
+        return
+    cached = usage["cached_tokens"]
+    share = cached / usage["prompt_tokens"] * 100 if usage["prompt_tokens"] else 0
+    print(
+        f"🐒 API usage: {usage['requests']} request(s), {usage['prompt_tokens']} prompt tokens "
+        f"({cached} cached by the provider, {share:.0f}%), {usage['completion_tokens']} completion tokens."
+    )
+
+
+def print_context_breakdown(packed_files: list, tree_tokens, max_context_tokens) -> None:
+    """Prints how many tokens of each file (and of the directory tree) are sent to the model."""
+    table = Table(title="🐒 Context Sent to ChatGPT", title_justify="left")
+    table.add_column("Source")
+    table.add_column("Tokens", justify="right")
+    table.add_column("Sent", justify="right")
+    table.add_column("Status")
+
+    total = 0
+    for packed_file in packed_files:
+        table.add_row(packed_file.path, str(packed_file.tokens), str(packed_file.packed_tokens), packed_file.status)
+        total += packed_file.packed_tokens
+    if tree_tokens is not None:
+        table.add_row("(directory tree)", str(tree_tokens), str(tree_tokens), "full")
+        total += tree_tokens
+
+    budget = "no limit" if max_context_tokens is None else f"budget {max_context_tokens}"
+    table.add_section()
+    table.add_row("Total", "", str(total), budget)
+    console.print(table)
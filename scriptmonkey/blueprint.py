@@ -0,0 +1,215 @@
+import os
+import re
+
+from .utils.tokens import count_tokens
+
+# Token cap for the signatures of related files included in each per-file prompt
+DEFAULT_CONTEXT_TOKENS = 2000
+# Paths listed in the project layout before it is summarized
+MAX_LAYOUT_ENTRIES = 200
+
+
+def describe_file(project_file: dict) -> str:
+    """Summarizes a blueprint entry as its path and function signatures, in the format used in prompts."""
+    if not project_file.get("functions"):
+        return f"- '{project_file['path']}' is defined with no specific functions listed.\n"
+    description = f"- In '{project_file['path']}', the following functions are defined:\n"
+    for function in project_file["functions"]:
+        description += f"  - {function['function_name']}: {function['description']} (Inputs: {function['inputs']}, Outputs: {function['outputs']})\n"
+    return description
+
+
+def project_layout(paths: list) -> str:
+    """Lists the paths of a blueprint, in blueprint order, up to MAX_LAYOUT_ENTRIES of them."""
+    layout = "".join(f"- {path}\n" for path in paths[:MAX_LAYOUT_ENTRIES])
+    if len(paths) > MAX_LAYOUT_ENTRIES:
+        layout += f"- … {len(paths) - MAX_LAYOUT_ENTRIES} more files\n"
+    return layout
+
+
+def project_overview(project_description: str, layout: str) -> str:
+    """
+    The part of the project context that is the same for every file of a project: its goal and its layout.
+
+    It only depends on the project and ends with the layout, so prompts that start with it share a byte-identical
+    prefix that the provider can cache; while a blueprint is streamed, the layouts of its successive entries are
+    prefixes of one another.
+    """
+    return f"Project Goal: {project_description}\n\nProject Layout:\n{layout}\n"
+
+
+def module_names(path: str) -> list:
+    """Returns the names a file is likely to be referred to by: its dotted module path, its suffixes and its stem."""
+    stem, _ = os.path.splitext(path.strip("/"))
+    parts = [part for part in stem.split("/") if part]
+    if parts and parts[-1] == "__init__":
+        parts = parts[:-1]
+    return [".".join(parts[i:]) for i in range(len(parts))]
+
+
+def _entry_text(project_file: dict) -> str:
+    """All the free text of a blueprint entry, which is where references to other files show up."""
+    text = project_file.get("description", "")
+    for function in project_file.get("functions") or []:
+        text += f"\n{function['function_name']} {function['description']} {function['inputs']} {function['outputs']}"
+    return text
+
+
+def _reference_names(project_file: dict) -> set:
+    """The names other entries can refer to a file by: module names, file name and function names."""
+    path = project_file["path"]
+    names = set(module_names(path)) | {os.path.basename(path)}
+    names.update(function["function_name"] for function in project_file.get("functions") or [])
+    return {name for name in names if len(name) >= 3}
+
+
+def _names_pattern(names) -> re.Pattern:
+    alternatives = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    return re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)")
+
+
+class BlueprintIndex:
+    """
+    A symbol and import graph of a project blueprint, built once per build, or entry by entry with `add`.
+
+    Each file is linked to the files it is likely to import (those whose module name, file name or function names
+    appear in its description or function specs) and to the files likely to import it. `context_for` then gives
+    each file the project goal and layout plus the signatures of only those related files, within a token cap,
+    instead of the signatures of every file in the project.
+
+    Usage:
+        index = BlueprintIndex(project_description, project_structure["files"])
+        context = index.context_for(project_file)
+    """
+
+    def __init__(
+        self, project_description: str, project_files: list, max_context_tokens: int = DEFAULT_CONTEXT_TOKENS
+    ):
+        self.project_description = project_description
+        self.max_context_tokens = max_context_tokens
+        self.paths = [project_file["path"] for project_file in project_files]
+        self.files = [project_file for project_file in project_files if not project_file["path"].endswith("/")]
+        self.by_path = {project_file["path"]: project_file for project_file in self.files}
+        self.descriptions = {project_file["path"]: describe_file(project_file) for project_file in self.files}
+        self.tokens = {path: count_tokens(description) for path, description in self.descriptions.items()}
+        self.texts = {project_file["path"]: _entry_text(project_file) for project_file in self.files}
+        self.layout = self._build_layout()
+
+        # Map every name a file can be referred to by to the files that own it
+        self.owners = {}
+        for project_file in self.files:
+            for name in _reference_names(project_file):
+                self.owners.setdefault(name, set()).add(project_file["path"])
+
+        # Scan each entry once with a single pattern of all names, longest names first
+        self.imports = {project_file["path"]: set() for project_file in self.files}
+        self.imported_by = {project_file["path"]: set() for project_file in self.files}
+        self._patterns = [_names_pattern(self.owners)] if self.owners else []
+        for project_file in self.files:
+            self._link(project_file["path"])
+
+    def add(self, project_file: dict) -> None:
+        """
+        Adds a blueprint entry, e.g. while the blueprint is still being streamed. The entry is linked to the files
+        already in the index and they to it, without rescanning the whole blueprint.
+        """
+        path = project_file["path"]
+        self.paths.append(path)
+        self.layout = self._build_layout()
+        if path.endswith("/") or path in self.by_path:
+            return
+        self.files.append(project_file)
+        self.by_path[path] = project_file
+        self.descriptions[path] = describe_file(project_file)
+        self.tokens[path] = count_tokens(self.descriptions[path])
+        self.texts[path] = _entry_text(project_file)
+        self.imports[path] = set()
+        self.imported_by[path] = set()
+
+        names = _reference_names(project_file)
+        for name in names:
+            self.owners.setdefault(name, set()).add(path)
+        if names:
+            pattern = _names_pattern(names)
+            self._patterns.append(pattern)
+            # Only the entries that mention the new file need to be linked again
+            for other in self.texts:
+                if other != path and pattern.search(self.texts[other]):
+                    self._link(other)
+        self._link(path)
+
+    def _link(self, path: str) -> None:
+        """(Re)links a file to the files whose names appear in its entry."""
+        for owner in self.imports[path]:
+            self.imported_by[owner].discard(path)
+        self.imports[path] = set()
+
+        # Like a single pattern of all names, longest names first: the leftmost, longest non-overlapping matches
+        text = self.texts[path]
+        matches = sorted(
+            (match.start(), -len(match.group()), match.group())
+            for pattern in self._patterns
+            for match in pattern.finditer(text)
+        )
+        end = 0
+        for start, negative_length, name in matches:
+            if start < end:
+                continue
+            end = start - negative_length
+            for owner in self.owners.get(name, ()):
+                if owner != path:
+                    self.imports[path].add(owner)
+                    self.imported_by[owner].add(path)
+
+    def _build_layout(self) -> str:
+        return project_layout(self.paths)
+
+    def related_files(self, path: str) -> list:
+        """
+        Returns the paths of the files related to a file, most relevant first: the files it likely imports, then
+        the files that likely import it, then the other files of its package.
+        """
+        related = sorted(self.imports.get(path, ()))
+        related += sorted(self.imported_by.get(path, set()) - set(related))
+
+        directory = os.path.dirname(path)
+        seen = set(related) | {path}
+        related += [
+            other["path"]
+            for other in self.files
+            if other["path"] not in seen and os.path.dirname(other["path"]) == directory
+        ]
+        return related
+
+    def context_for(self, project_file: dict) -> str:
+        """
+        Builds the project context for one file: the project goal, the layout of the project and the signatures
+        of the related files that fit in `max_context_tokens`.
+
+        Args:
+            project_file (dict): The blueprint entry of the file being generated.
+
+        Returns:
+            str: A summary of the project goal and the modules, classes, and functions relevant to the file.
+        """
+        return self.overview() + self.related_context(project_file)
+
+    def overview(self) -> str:
+        """The part of the context shared by every file: the project goal and layout (see project_overview)."""
+        return project_overview(self.project_description, self.layout)
+
+    def related_context(self, project_file: dict) -> str:
+        """The part of the context specific to a file: the signatures of its related files, within the token cap."""
+        context = "Project Context (related files):\n"
+
+        remaining = self.max_context_tokens
+        omitted = 0
+        for path in self.related_files(project_file["path"]):
+            if self.tokens[path] > remaining:
+                omitted += 1
+                continue
+            context += self.descriptions[path]
+            remaining -= self.tokens[path]
+        if omitted:
+            context += f"- … {omitted} more related files omitted.\n"
+        return context
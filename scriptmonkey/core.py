@@ -1,32 +1,40 @@
 import os
 import sys
-import time
 import argparse
 import platform
 import traceback
 from pprint import pprint
 
-from rich.console import Console
-
-from .utils.ui import Spinner, cli_text_editor
+# Only lightweight modules are imported here. rich, pydantic, pyperclip and openai are imported on first real use,
+# so `import scriptmonkey`, `scriptmonkey.run()` and `scriptmonkey --help` start quickly.
 from .utils.key_manager import update_api_key
-from .utils.file_handler import read_file, write_file, copy_files_to_clipboard
-from .agents import (
-    ask_gpt_with_files,
-    generate_project_structure,
-    build_project,
-    generate_readme,
-)
-
-from .openai_client.basemodels import ScriptMonkeyResponse
+from .utils.manifest import BuildManifest, NEEDS_BUILD, DONE, README_KEY
+from .utils.context_packer import DEFAULT_MAX_CONTEXT_TOKENS
+from .utils.file_handler import read_file
 from .openai_client import (
     chatgpt_json,
     default_prompts,
+    enable_cache,
+    disable_cache,
+    get_cache,
+    get_usage,
+    set_backend,
+    OpenAIBackend,
+    OpenAICompatibleBackend,
 )
+from .openai_client.backends import DEFAULT_MODEL, DEFAULT_SMALL_MODEL, DEFAULT_STRUCTURED_MODEL
+from .telemetry import span, traced, enable_tracing, disable_tracing, print_summary
 
-console = Console()
 CONFIG_FILE = os.path.expanduser("~/.scriptmonkey_config")
 
+# Token budget for the code sent with an exception fix, set by run() (see utils.code_context)
+_fix_context_tokens = None
+# The exception hooks of run(mode="background"), once installed
+_background_fixer = None
+# Fixes requested at once for an error, and the seconds each may run to be verified, set by run() (see verify)
+_fix_candidates = 1
+_verify_timeout = 30
+
 
 def get_platform():
     os_name = platform.system()
@@ -39,33 +47,369 @@ def scriptmonkey_exception_handler(exc_type, exc_value, exc_traceback):
         sys.__excepthook__(exc_type, exc_value, exc_traceback)
         return
 
-    error_message = "".join(traceback.format_exception(exc_type, exc_value, exc_traceback))
+    with span("fix") as fix_span:
+        from .utils.ui import Spinner
+        from .utils import fix_store
+        from .utils.fix_store import get_fix_store, fix_fingerprint, content_hash
+        from .utils.code_context import DEFAULT_FIX_CONTEXT_TOKENS, extract_fix_context
+
+        error_message = "".join(traceback.format_exception(exc_type, exc_value, exc_traceback))
+
+        print(f"\n🐒 ScriptMonkey Detected an Error:")
+        print(error_message, "\n")
+
+        # Large files are not sent whole: only the code around the error, within the token budget
+        max_tokens = _fix_context_tokens
+        if max_tokens is None:
+            max_tokens = int(os.getenv("SCRIPTMONKEY_FIX_CONTEXT_TOKENS", DEFAULT_FIX_CONTEXT_TOKENS))
+        fix_context = extract_fix_context(exc_traceback, max_tokens)
+        if fix_context is None:
+            print("❌ ScriptMonkey could not find the source code of this error.")
+            return
+        file_path = fix_context.path
+        window = fix_context.target
+        fix_span.set(path=file_path, context_tokens=fix_context.tokens, windowed=window is not None)
+
+        content = f"{get_platform()}{fix_context.render()}# Error Message:\n{error_message}"
+
+        store = get_fix_store()
+        if store is None:
+            _request_fix(fix_span, fix_context, content, exc_type, exc_traceback)
+            return
+
+        # The same bug often fires in many processes at once: the first one requests the fix, the others reuse it
+        signature, fingerprint = fix_fingerprint(exc_type, exc_traceback, fix_context)
+        store_path = os.path.realpath(file_path)
+        applied = store.find_applied(signature, store_path, content_hash(fix_context.source))
+        if applied is not None:
+            # This process still runs the code from before another process fixed it
+            fix_span.set(fix_store="applied")
+            _print_solution(applied["solution"], reused=True)
+            print(f"🐒 ScriptMonkey already fixed this error in: '{file_path}'. Restart to run the fixed code.")
+            return
+        with Spinner("🐒 ScriptMonkey is checking for a fix from another process"):
+            state, entry = store.claim(fingerprint)
+        if state == fix_store.FAILED:
+            fix_span.set(fix_store="failed")
+            print("❌ ScriptMonkey could not fix this error in another process, so it did not try again.")
+            return
+        if state == fix_store.DONE:
+            if _reuse_fix(entry, fix_context):
+                fix_span.set(fix_store="reused")
+                return
+            # The file changed since, so the stored fix does not apply: request one without recording it
+            fix_span.set(fix_store="stale")
+            _request_fix(fix_span, fix_context, content, exc_type, exc_traceback)
+            return
+
+        fix_span.set(fix_store="owner")
+        try:
+            result = _request_fix(fix_span, fix_context, content, exc_type, exc_traceback)
+        except BaseException:
+            store.release(fingerprint)
+            raise
+        if result is None:
+            store.fail(fingerprint)
+        else:
+            before, corrected_code, solution = result
+            store.complete(fingerprint, signature, store_path, before, corrected_code, solution)
+
 
-    print(f"\n🐒 ScriptMonkey Detected an Error:")
-    print(error_message, "\n")
+def _request_fix(fix_span, fix_context, content: str, exc_type, exc_traceback):
+    """Requests the fix of an error and writes it to the file. Returns the same as propose_fix."""
+    from .utils.patching import write_file_atomic
 
-    frame = traceback.extract_tb(exc_traceback)[-1]
-    file_path = frame.filename
+    if _fix_candidates > 1:
+        result = propose_verified_fix(fix_span, fix_context, content, exc_type, exc_traceback)
+    else:
+        result = propose_fix(fix_span, fix_context, content)
+    if result is not None:
+        write_file_atomic(fix_context.path, result[1])
+        _print_fixed(fix_context)
+    return result
+
+
+def propose_fix(fix_span, fix_context, content: str):
+    """
+    Requests the fix of an error and applies it to the content of the file, without writing it.
 
-    original_code = read_file(file_path)
-    content = f"{get_platform()}# Original Code:\n```\n{original_code}\n```\n\n# Error Message:\n{error_message}"
+    Args:
+        fix_span (Span): The span of the fix, which records how it was applied.
+        fix_context (FixContext): The code that raised the error.
+        content (str): The fix request: the platform, the rendered context and the error message.
 
+    Returns:
+        tuple: The file before and after the fix and the model's explanation of it, or None if it could not be
+            applied.
+    """
+    from .utils.ui import Spinner
+    from .utils.code_context import add_imports
+    from .utils.patching import PatchError, apply_edits
+    from .openai_client.basemodels import ScriptMonkeyPatchResponse
+
+    file_path = fix_context.path
+    window = fix_context.target
+
+    # The fix comes back as search/replace edits, so its length depends on the change, not on the file
     solution = None
     with Spinner("🐒 ScriptMonkey is working on a solution"):
         solution = chatgpt_json(
-            instructions=default_prompts.fix_error, content=content, response_format=ScriptMonkeyResponse
+            instructions=default_prompts.fix_error_patch, content=content, response_format=ScriptMonkeyPatchResponse
         )
+    _print_solution(solution)
 
-    print(f"\n🐒 ScriptMonkey Fixed It:\nProblem:\n{solution['problem']}\n")
+    # The edits are checked against the file as it is now and applied all or nothing
+    region = (window.start, window.end) if window is not None else None
+    before = read_file(file_path)
+    try:
+        corrected_code = apply_edits(before, solution["edits"], region, file_path)
+        corrected_code = add_imports(corrected_code, solution["new_imports"])
+    except PatchError as e:
+        fix_span.set(patched=False)
+        print(f"🐒 ScriptMonkey's patch did not apply ({e}), rewriting the code instead...")
+        before = fix_context.source
+        corrected_code = rewrite_fix(fix_context, content)
+        if corrected_code is None:
+            return None
+    else:
+        fix_span.set(patched=True, edits=len(solution["edits"]))
+    return before, corrected_code, {"problem": solution["problem"], "solution": solution["solution"]}
+
+
+def propose_verified_fix(fix_span, fix_context, content: str, exc_type, exc_traceback):
+    """
+    Requests several fixes of an error at once and keeps the first one that gets the program past the error, see
+    verify.verify_candidates. This runs the program again once per fix.
+
+    Returns:
+        tuple: The file before and after the fix and the model's explanation of it, or None if no fix applies,
+            gets past the error, or can be tested.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from .utils.ui import Spinner
+    from .verify import VerifyError, verify_candidates
+
+    count = _fix_candidates
+    with Spinner(f"🐒 ScriptMonkey is working on {count} solutions"):
+        with ThreadPoolExecutor(max_workers=count) as executor:
+            candidates = [
+                candidate
+                for candidate in executor.map(lambda _: _patch_candidate(fix_context, content), range(count))
+                if candidate is not None
+            ]
+    fix_span.set(candidates=count, applied=len(candidates))
+    if not candidates:
+        print(f"❌ None of ScriptMonkey's {count} fixes applied to '{fix_context.path}', so it was not changed.")
+        return None
+
+    try:
+        with Spinner(f"🐒 ScriptMonkey is testing {len(candidates)} fixes by running your program again"):
+            number, outcomes = verify_candidates(
+                fix_context.path, [candidate[1] for candidate in candidates], exc_type, exc_traceback, _verify_timeout
+            )
+    except VerifyError as e:
+        fix_span.set(verified=False)
+        print(f"❌ ScriptMonkey cannot test its fixes ({e}), so your code was not changed.")
+        return None
+    fix_span.set(verified=number is not None)
+    if number is None:
+        print(f"❌ None of ScriptMonkey's {len(candidates)} fixes got past the error, so your code was not changed.")
+        for candidate, outcome in zip(candidates, outcomes):
+            if outcome == "timeout":
+                result = f"still running after {_verify_timeout:g}s, inconclusive"
+            elif outcome["type"] is None:
+                result = "the program was killed or exited abnormally"
+            elif not outcome["reached"]:
+                result = f"{outcome['type']} before reaching the code that raised the error"
+            else:
+                where = f" in {outcome['function']} ({outcome['path']})" if outcome["function"] else ""
+                result = f"{outcome['type']}{where}"
+            print(f"- {candidate[2]['solution'].splitlines()[0]}: {result}")
+        return None
+    ran = "ran to the end" if outcomes[number] == "ok" else "got past the error"
+    print(f"🐒 ScriptMonkey tested {len(candidates)} fixes: fix {number + 1} {ran}.")
+    before, corrected_code, solution = candidates[number]
+    _print_solution(solution)
+    return before, corrected_code, solution
+
+
+def _patch_candidate(fix_context, content: str):
+    """Requests one candidate fix and applies it to the file, or returns None if its patch does not apply."""
+    from .utils.code_context import add_imports
+    from .utils.patching import PatchError, apply_edits
+    from .openai_client.basemodels import ScriptMonkeyPatchResponse
+
+    # The same request is sent once per candidate, so the cache must not answer them all with the same fix
+    solution = chatgpt_json(
+        instructions=default_prompts.fix_error_patch,
+        content=content,
+        response_format=ScriptMonkeyPatchResponse,
+        use_cache=False,
+    )
+    window = fix_context.target
+    region = (window.start, window.end) if window is not None else None
+    before = read_file(fix_context.path)
+    try:
+        corrected_code = apply_edits(before, solution["edits"], region, fix_context.path)
+        corrected_code = add_imports(corrected_code, solution["new_imports"])
+    except PatchError:
+        return None
+    return before, corrected_code, {"problem": solution["problem"], "solution": solution["solution"]}
+
+
+def _reuse_fix(entry: dict, fix_context) -> bool:
+    """
+    Applies a fix another process stored, unless the file already has it. The file is written at most once: by
+    the process that requested the fix, or here if the file is still as it was before the fix.
+
+    Returns:
+        bool: False if the file changed since, so the fix does not apply.
+    """
+    from .utils.patching import write_file_atomic
+    from .utils.fix_store import content_hash
+
+    current = content_hash(read_file(fix_context.path))
+    if current not in (entry["before_hash"], entry["after_hash"]):
+        return False
+    _print_solution(entry["solution"], reused=True)
+    if current == entry["after_hash"]:
+        print(f"🐒 ScriptMonkey already fixed this error in: '{fix_context.path}'. Restart to run the fixed code.")
+    else:
+        write_file_atomic(fix_context.path, entry["after_content"])
+        _print_fixed(fix_context)
+    return True
+
+
+def _print_solution(solution: dict, reused: bool = False) -> None:
+    source = " (fix from another process)" if reused else ""
+    print(f"\n🐒 ScriptMonkey Fixed It{source}:\nProblem:\n{solution['problem']}\n")
     print(f"Suggested Solution:\n{solution['solution']}\n")
 
+
+def _print_fixed(fix_context) -> None:
+    window = fix_context.target
+    if window is None:
+        print(f"🐒 ScriptMonkey automatically fixed your code at: '{fix_context.path}'.")
+    else:
+        lines = f"lines {window.start}-{window.end}"
+        print(f"🐒 ScriptMonkey automatically fixed {window.name} ({lines}) in: '{fix_context.path}'.")
+
+
+def rewrite_fix(fix_context, content: str):
+    """
+    Asks for the complete corrected code, the whole file or the definition that raised the error, for when a
+    patch does not apply.
+
+    Args:
+        fix_context (FixContext): The code that raised the error.
+        content (str): The fix request, as sent for the patch.
+
+    Returns:
+        str: The new content of the file, or None if the corrected code cannot be spliced into it.
+    """
+    import ast
+    from .utils.ui import Spinner
+    from .utils.code_context import splice, add_imports
+    from .openai_client.basemodels import ScriptMonkeyResponse, ScriptMonkeyWindowResponse
+
+    window = fix_context.target
+    if window is None:
+        instructions, response_format = default_prompts.fix_error, ScriptMonkeyResponse
+    else:
+        instructions, response_format = default_prompts.fix_error_window, ScriptMonkeyWindowResponse
+
+    with Spinner("🐒 ScriptMonkey is working on a solution"):
+        solution = chatgpt_json(instructions=instructions, content=content, response_format=response_format)
+
     corrected_code = solution["corrected_code"].replace("```python", "").replace("```", "")
-    write_file(file_path, corrected_code)
-    print(f"🐒 ScriptMonkey automatically fixed your code at: '{file_path}'.")
+    if window is None:
+        return corrected_code
+    corrected_code = add_imports(splice(fix_context.source, window, corrected_code), solution["new_imports"])
+    try:
+        ast.parse(corrected_code)
+    except SyntaxError as e:
+        lines = f"lines {window.start}-{window.end}"
+        print(f"❌ ScriptMonkey could not apply its fix to {lines} of '{fix_context.path}': {e}")
+        print(f"Corrected code:\n{solution['corrected_code']}")
+        return None
+    return corrected_code
+
+
+def run(
+    max_context_tokens: int = None,
+    mode: str = "blocking",
+    candidates: int = None,
+    verify_timeout: float = None,
+    verify: bool = False,
+):
+    """
+    Installs ScriptMonkey's exception handler, which fixes the code that raised an uncaught exception.
+
+    Args:
+        max_context_tokens (int, optional): Token budget for the code sent with a fix. Files that fit are sent
+            whole; for larger ones only the code around the error is. Defaults to SCRIPTMONKEY_FIX_CONTEXT_TOKENS,
+            or 6000.
+        mode (str, optional): "blocking" fixes an uncaught exception of the main thread before the process exits,
+            and writes the fix to the file. "background" captures the exceptions of threads, asyncio tasks and
+            `concurrent.futures` executors as well, and has a detached worker process write the fixes as patches
+            to `.scriptmonkey/fixes/`, so a long-running service never waits for the API. Defaults to "blocking".
+        candidates (int, optional): In blocking mode, the number of fixes requested at once. More than one needs
+            `verify=True`. Defaults to SCRIPTMONKEY_FIX_CANDIDATES, or 1.
+        verify_timeout (float, optional): Seconds each test run may take; a run still going by then is
+            inconclusive. Defaults to SCRIPTMONKEY_VERIFY_TIMEOUT, or 30.
+        verify (bool, optional): Allows ScriptMonkey to test the candidate fixes by running your whole program
+            again, once per fix, in a temporary copy of its directory. The program's side effects, such as network
+            requests and database writes, happen again. The first fix that gets past the error is written.
+            Defaults to False.
+    """
+    global _fix_context_tokens, _background_fixer, _fix_candidates, _verify_timeout
+    from .verify import VERIFYING_ENV, DEFAULT_CANDIDATES, DEFAULT_VERIFY_TIMEOUT
+
+    if mode not in ("blocking", "background"):
+        raise ValueError(f"Unknown mode {mode!r}, expected 'blocking' or 'background'")
+    if os.getenv(VERIFYING_ENV):
+        # A copy of the program testing a fix: its errors are the outcome of the test
+        return
+    if max_context_tokens is not None:
+        _fix_context_tokens = max_context_tokens
+    _fix_candidates = max(1, candidates or int(os.getenv("SCRIPTMONKEY_FIX_CANDIDATES", DEFAULT_CANDIDATES)))
+    if _fix_candidates > 1 and not verify:
+        raise ValueError(
+            "Testing several fixes runs your program again once per fix, side effects included; "
+            "pass verify=True to allow it"
+        )
+    _verify_timeout = verify_timeout or float(os.getenv("SCRIPTMONKEY_VERIFY_TIMEOUT", DEFAULT_VERIFY_TIMEOUT))
+    # SCRIPTMONKEY_TRACE=trace.jsonl records the spans of every fix
+    trace_path = os.getenv("SCRIPTMONKEY_TRACE")
+    if trace_path:
+        enable_tracing(trace_path)
+    if mode == "blocking":
+        sys.excepthook = scriptmonkey_exception_handler
+    elif _background_fixer is None:
+        from .fix_worker import BackgroundFixer
+
+        _background_fixer = BackgroundFixer(max_context_tokens=max_context_tokens)
+        _background_fixer.install()
+
+
+def stop():
+    """Uninstalls what run() installed: the exception handler, and in background mode the hooks of every source."""
+    global _background_fixer
+    if sys.excepthook is scriptmonkey_exception_handler:
+        sys.excepthook = sys.__excepthook__
+    if _background_fixer is not None:
+        _background_fixer.uninstall()
+        _background_fixer = None
 
 
-def run():
-    sys.excepthook = scriptmonkey_exception_handler
+def print_cache_stats():
+    stats = (get_cache() or enable_cache()).stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = f"{stats['hits'] / lookups:.0%}" if lookups else "n/a"
+    print(f"🐒 ScriptMonkey response cache: {stats['path']}")
+    print(f"Entries: {stats['entries']}")
+    print(f"Size: {stats['bytes'] / 1024 / 1024:.2f} MB of {stats['max_bytes'] / 1024 / 1024:.0f} MB")
+    print(f"Hits: {stats['hits']}, Misses: {stats['misses']} (hit rate: {hit_rate})")
 
 
 def handle_no_prompt():
@@ -73,6 +417,98 @@ def handle_no_prompt():
     exit()
 
 
+@traced("build")
+def run_build(
+    project_description: str,
+    base_directory: str = "./generated_project",
+    max_workers: int = 1,
+    routing: bool = True,
+    planning: str = "single",
+) -> list:
+    """
+    Builds a project from its description: the blueprint, every file, and the README.
+
+    The stages overlap: a new blueprint is streamed and its files are generated as soon as their entries arrive,
+    and the README is written while the files are still being generated.
+
+    Args:
+        project_description (str): A high-level description of the project's purpose and goals.
+        base_directory (str, optional): Directory the project is written to. Defaults to "./generated_project".
+        max_workers (int, optional): Number of files generated in parallel. Defaults to 1.
+        routing (bool, optional): Whether trivial files come from local templates and simple files from the small
+            model (see scriptmonkey.routing). Defaults to True.
+        planning (str, optional): How a new blueprint is planned: in a single request ("single"), or as an outline
+            whose packages are detailed in parallel ("hierarchical"). Defaults to "single".
+
+    Returns:
+        list: The paths of the files that could not be generated.
+    """
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+    from .agents import build_project, build_project_streaming, generate_readme, print_api_usage
+
+    print(f"Project Description: {project_description}")
+    usage = get_usage()
+    manifest = BuildManifest(base_directory)
+    readme_path = os.path.join(base_directory, "README.md")
+    readme = {}
+
+    with ThreadPoolExecutor(max_workers=1) as readme_executor:
+
+        def start_readme(project_structure):
+            # The README only needs the final blueprint, not the generated files
+            readme["entry"] = {"path": README_KEY, "blueprint": project_structure}
+            if manifest.status(readme["entry"], readme_path) in NEEDS_BUILD:
+                readme["future"] = readme_executor.submit(
+                    contextvars.copy_context().run, generate_readme, project_description, project_structure
+                )
+
+        # Steps 1 and 2: Generate the project structure and create its directories and files, reusing the
+        # blueprint of an interrupted build
+        project_structure = manifest.get_blueprint(project_description)
+        if project_structure is None:
+            print(f"\n🐒 ScriptMonkey is planning the project and coding each file as soon as it is planned...")
+            project_structure, failed_files = build_project_streaming(
+                project_description,
+                base_directory=base_directory,
+                max_workers=max_workers,
+                manifest=manifest,
+                on_blueprint=start_readme,
+                routing=routing,
+                planning=planning,
+                skip_readme=True,
+            )
+        else:
+            print(f"\n🐒 ScriptMonkey is resuming the previous build with its project blueprint:")
+            pprint(project_structure)
+            start_readme(project_structure)
+            print(f"\n🐒 ScriptMonkey is coding...")
+            failed_files = build_project(
+                project_structure_response=project_structure,
+                project_description=project_description,
+                base_directory=base_directory,
+                max_workers=max_workers,
+                manifest=manifest,
+                routing=routing,
+                skip_readme=True,
+            )
+        if failed_files:
+            print(f"\n❌ ScriptMonkey could not generate {len(failed_files)} file(s): {', '.join(failed_files)}")
+        print("\nProject structure creation complete.")
+
+        # Step 3: Write the README.md generated from the project description and structure
+        if "future" not in readme:
+            print(f"README.md is already up to date, skipping: '{readme_path}'")
+        else:
+            readme_content = readme["future"].result()
+            with open(readme_path, "w") as readme_file:
+                readme_file.write(readme_content)
+            manifest.mark(readme["entry"], DONE, content=readme_content)
+            print(f"🐒 ScriptMonkey wrote a README.md file at: '{readme_path}'")
+    print_api_usage(usage)
+    return failed_files
+
+
 def main():
     parser = argparse.ArgumentParser(description="ScriptMonkey - Generate Python projects and fix code.")
     parser.add_argument("--ask", nargs="?", const=True, help="Ask a question to ChatGPT", type=str)
@@ -82,10 +518,78 @@ def main():
     parser.add_argument(
         "--copy", help="Copy the content of the specified files to the clipboard", action="store_true"
     )  # New --copy flag
+    parser.add_argument(
+        "--jobs", "-j", help="Number of project files to generate in parallel", type=int, default=1
+    )
+    parser.add_argument(
+        "--max-context-tokens",
+        help=f"Token budget for the files and tree sent with --ask (default: {DEFAULT_MAX_CONTEXT_TOKENS}, 0 for no limit)",
+        type=int,
+        default=DEFAULT_MAX_CONTEXT_TOKENS,
+    )
+    parser.add_argument(
+        "--no-stream", help="Wait for the complete answer to --ask instead of streaming it", action="store_true"
+    )
+    parser.add_argument("--cache", help="Answer repeated requests from the local response cache", action="store_true")
+    parser.add_argument(
+        "--no-cache", help="Do not use the response cache, even if SCRIPTMONKEY_CACHE enables it", action="store_true"
+    )
+    parser.add_argument("--cache-stats", help="Show statistics about the local response cache", action="store_true")
+    parser.add_argument("--base-url", help="Send requests to an OpenAI-compatible server (e.g. vLLM or Ollama)")
+    parser.add_argument("--model", help="Model to use instead of gpt-4o")
+    parser.add_argument("--small-model", help="Model for the simple files of a build instead of gpt-4o-mini")
+    parser.add_argument(
+        "--no-routing",
+        help="Generate every file of a build with the main model, without local templates or the small model",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--plan",
+        help="How to plan a build: in one request (default: single), or as an outline whose packages are planned in "
+        "parallel, for large projects (hierarchical)",
+        choices=["single", "hierarchical"],
+        default="single",
+    )
+    parser.add_argument("--trace", help="Record a trace of the run to this JSON lines file and print a summary")
     args = parser.parse_args()
 
+    if args.trace:
+        enable_tracing(args.trace)
+    try:
+        run_command(args)
+    finally:
+        if args.trace:
+            print_summary()
+            disable_tracing()
+
+
+def run_command(args):
+    """Runs the command selected by the parsed command line arguments."""
     print(f"\n- - 🐒 WELCOME TO SCRIPT MONKEY 🐒 - - -\n")
 
+    if args.cache_stats:
+        print_cache_stats()
+        return
+
+    # The cache is opt-in: a repeated request would otherwise get the same answer, e.g. the same failed fix
+    if args.no_cache:
+        disable_cache()
+    elif args.cache:
+        enable_cache()
+
+    if args.base_url:
+        set_backend(
+            OpenAICompatibleBackend(args.base_url, model=args.model or DEFAULT_MODEL, small_model=args.small_model)
+        )
+    elif args.model or args.small_model:
+        set_backend(
+            OpenAIBackend(
+                default_model=args.model or DEFAULT_MODEL,
+                structured_model=args.model or DEFAULT_STRUCTURED_MODEL,
+                small_model=args.small_model or DEFAULT_SMALL_MODEL,
+            )
+        )
+
     if args.set_api_key:
         # Handle setting the API key
         update_api_key()
@@ -93,14 +597,20 @@ def main():
 
     if args.copy:
         # Handle the --copy functionality
+        from rich.console import Console
+        from .utils.file_handler import copy_files_to_clipboard
+
         file_paths = args.files if args.files else []
         if not file_paths:
-            console.print("[bold red]❌ No files specified to copy. Use --files to specify file paths.[/bold red]")
+            Console().print("[bold red]❌ No files specified to copy. Use --files to specify file paths.[/bold red]")
             return
         include_tree = args.tree
         copy_files_to_clipboard(file_paths)
         return
 
+    from .utils.ui import cli_text_editor
+    from .agents import ask_gpt_with_files
+
     if args.ask is not None:
         # Handle the --ask functionality
         # Check if the --ask flag was used without a direct question (e.g., `--ask` alone)
@@ -113,34 +623,21 @@ def main():
 
         file_paths = args.files if args.files else []
         include_tree = args.tree
-        ask_gpt_with_files(question, file_paths, include_tree)
+        ask_gpt_with_files(
+            question,
+            file_paths,
+            include_tree,
+            stream=not args.no_stream,
+            max_context_tokens=args.max_context_tokens or None,
+        )
         return
     else:
         # Handle the build project functionality
         print(f"Opening prompt editor... ")
-        time.sleep(2)
 
-        # Step 1: Get multi-line project description from user
+        # Get multi-line project description from user
         project_description = cli_text_editor(mode="BUILD")
         if not project_description:
             handle_no_prompt()
 
-        print(f"Project Description: {project_description}")
-
-        # Step 2: Generate the project structure using OpenAI API
-        project_structure = generate_project_structure(project_description)
-        print(f"\n🐒 ScriptMonkey created a project blueprint:")
-        pprint(project_structure)
-
-        # Step 3: Create the project structure (directories and files) on the filesystem
-        print(f"\n🐒 ScriptMonkey is coding...")
-        build_project(project_structure_response=project_structure, project_description=project_description)
-        print("\nProject structure creation complete.")
-
-        # Step 4: Generate the README.md content based on the project description and structure
-        readme_content = generate_readme(project_description, project_structure)
-        readme_path = "./generated_project/README.md"
-        with open(readme_path, "w") as readme_file:
-            readme_file.write(readme_content)
-        print(f"🐒 ScriptMonkey wrote a README.md file at: '{readme_path}'")
-        return
+        run_build(project_description, max_workers=args.jobs, routing=not args.no_routing, planning=args.plan)
@@ -0,0 +1,368 @@
+import os
+import sys
+import json
+import time
+import difflib
+import weakref
+import threading
+import traceback
+import itertools
+
+from .utils.file_handler import read_file
+
+# Directory, relative to the working directory of the process, where errors are queued and fixes are written
+FIX_DIRECTORY = ".scriptmonkey"
+IDLE_TIMEOUT = 10  # Seconds the worker waits for new errors before it exits
+POLL_INTERVAL = 0.5  # Seconds between checks of the queue
+
+_job_ids = itertools.count(1)
+
+
+class BackgroundFixer:
+    """
+    Captures uncaught exceptions without blocking the process that raised them, and leaves the fixes to a detached
+    worker process (see work()).
+
+    An exception is turned into a job right away, since its traceback and local variables are only available in
+    this process: the code around the error is extracted and written to `<directory>/queue/`. That takes
+    milliseconds and no network. The worker, started on the first job, requests the fixes and writes them as
+    patches to `<directory>/fixes/`, leaving the code as it is. Each error is queued once per process.
+
+    Usage:
+        fixer = BackgroundFixer()
+        fixer.install()
+
+    Args:
+        directory (str, optional): Directory of the queue and the fixes. Defaults to ".scriptmonkey" in the working
+            directory.
+        max_context_tokens (int, optional): Token budget for the code sent with a fix. Defaults to
+            SCRIPTMONKEY_FIX_CONTEXT_TOKENS, or 6000.
+    """
+
+    def __init__(self, directory: str = FIX_DIRECTORY, max_context_tokens: int = None):
+        from .utils.code_context import DEFAULT_FIX_CONTEXT_TOKENS
+
+        self.directory = os.path.abspath(directory)
+        self.max_context_tokens = max_context_tokens
+        if max_context_tokens is None:
+            self.max_context_tokens = int(os.getenv("SCRIPTMONKEY_FIX_CONTEXT_TOKENS", DEFAULT_FIX_CONTEXT_TOKENS))
+        self.worker = None
+        self.seen = set()
+        self._installed = None  # The hooks replaced by install(), while installed
+        self._loops = []  # (weak reference to a loop, our handler, the handler it replaced)
+        self._lock = threading.Lock()
+
+    def install(self) -> None:
+        """
+        Captures the exceptions of every source: uncaught exceptions of the main thread (`sys.excepthook`) and of
+        other threads (`threading.excepthook`), exceptions of asyncio tasks and callbacks that nothing handled, and
+        exceptions of `concurrent.futures` futures that are never retrieved. Every hook calls the one it replaced.
+        Undone by uninstall().
+        """
+        import asyncio
+        import concurrent.futures
+
+        if self._installed is not None:
+            return
+        installed = self._installed = {}
+        previous_excepthook = installed["excepthook"] = sys.excepthook
+        previous_threading_excepthook = installed["threading_excepthook"] = threading.excepthook
+
+        def excepthook(exc_type, exc_value, exc_traceback):
+            self.submit(exc_type, exc_value, exc_traceback)
+            previous_excepthook(exc_type, exc_value, exc_traceback)
+
+        def threading_excepthook(args):
+            if args.exc_value is not None:
+                self.submit(args.exc_type, args.exc_value, args.exc_traceback)
+            previous_threading_excepthook(args)
+
+        sys.excepthook = installed["our_excepthook"] = excepthook
+        threading.excepthook = installed["our_threading_excepthook"] = threading_excepthook
+
+        # Loops are given the handler when they are created, and the one running now, if any, right away
+        policy = installed["policy"] = asyncio.get_event_loop_policy()
+        new_event_loop = policy.new_event_loop
+
+        def new_event_loop_with_handler():
+            loop = new_event_loop()
+            self._chain_asyncio_handler(loop)
+            return loop
+
+        policy.new_event_loop = new_event_loop_with_handler
+        try:
+            self._chain_asyncio_handler(asyncio.get_running_loop())
+        except RuntimeError:
+            pass
+
+        # The exception of a future is often handled by whoever calls result(), so it is only queued if the future
+        # is garbage collected without anyone having looked at it, like asyncio's "exception was never retrieved"
+        future_class = concurrent.futures.Future
+        installed["future_methods"] = {
+            name: getattr(future_class, name) for name in ("set_exception", "result", "exception")
+        }
+        set_exception, result, exception = installed["future_methods"].values()
+
+        def set_exception_and_watch(future, error):
+            if error is not None:
+                future._scriptmonkey_unretrieved = retrieved = {"retrieved": False}
+                weakref.finalize(future, self._submit_unretrieved, retrieved, error)
+            set_exception(future, error)
+
+        def result_and_mark(future, timeout=None):
+            _mark_retrieved(future)
+            return result(future, timeout)
+
+        def exception_and_mark(future, timeout=None):
+            _mark_retrieved(future)
+            return exception(future, timeout)
+
+        future_class.set_exception = set_exception_and_watch
+        future_class.result = result_and_mark
+        future_class.exception = exception_and_mark
+
+    def uninstall(self) -> None:
+        """Restores the hooks install() replaced, unless something else has replaced them since."""
+        import concurrent.futures
+
+        installed, self._installed = self._installed, None
+        if installed is None:
+            return
+        if sys.excepthook is installed["our_excepthook"]:
+            sys.excepthook = installed["excepthook"]
+        if threading.excepthook is installed["our_threading_excepthook"]:
+            threading.excepthook = installed["threading_excepthook"]
+        # The policy's own method is used again once the instance attribute is gone
+        installed["policy"].__dict__.pop("new_event_loop", None)
+        for loop, handler, previous in self._loops:
+            loop = loop()
+            if loop is not None and not loop.is_closed() and loop.get_exception_handler() is handler:
+                loop.set_exception_handler(previous)
+        self._loops = []
+        for name, method in installed["future_methods"].items():
+            setattr(concurrent.futures.Future, name, method)
+
+    def _chain_asyncio_handler(self, loop) -> None:
+        """Installs an exception handler on a loop that queues the exception and calls the handler it replaced."""
+        previous = loop.get_exception_handler()
+
+        def handler(loop, context):
+            exception = context.get("exception")
+            if exception is not None:
+                self.submit(type(exception), exception, exception.__traceback__)
+            if previous is not None:
+                previous(loop, context)
+            else:
+                loop.default_exception_handler(context)
+
+        loop.set_exception_handler(handler)
+        self._loops.append((weakref.ref(loop), handler, previous))
+
+    def _submit_unretrieved(self, retrieved: dict, error: BaseException) -> None:
+        if not retrieved["retrieved"]:
+            self.submit(type(error), error, error.__traceback__)
+
+    def submit(self, exc_type, exc_value, exc_traceback) -> None:
+        """
+        Queues an exception for the worker, unless it was queued already or it did not come from user code. Never
+        raises: a failure is printed, since it happens while another error is being handled.
+        """
+        if issubclass(exc_type, (KeyboardInterrupt, SystemExit)):
+            return
+        try:
+            from .utils.code_context import user_frames
+
+            frames = user_frames(exc_traceback)
+            # Keyed by where it was raised, the innermost frame: an exception re-raised elsewhere, e.g. by
+            # Future.result(), only gains outer frames
+            key = (exc_type, tuple((frame.f_code.co_filename, lineno) for frame, lineno in frames[-1:]))
+            with self._lock:
+                if not frames or key in self.seen:
+                    return
+                self.seen.add(key)
+            self._enqueue(exc_type, exc_value, exc_traceback)
+        except Exception as e:
+            print(f"❌ ScriptMonkey could not queue {exc_type.__name__} for a fix: {e}", file=sys.stderr)
+
+    def _enqueue(self, exc_type, exc_value, exc_traceback) -> None:
+        from .core import get_platform
+        from .utils.code_context import extract_fix_context
+        from .utils.fix_store import fix_fingerprint
+        from .utils.patching import write_file_atomic
+
+        fix_context = extract_fix_context(exc_traceback, self.max_context_tokens)
+        if fix_context is None:
+            return
+        error_message = "".join(traceback.format_exception(exc_type, exc_value, exc_traceback))
+        signature, fingerprint = fix_fingerprint(exc_type, exc_traceback, fix_context)
+        window = fix_context.target
+        job = {
+            "path": os.path.realpath(fix_context.path),
+            "source": fix_context.source,
+            "window": None if window is None else [window.start, window.end, window.name, window.lineno, window.text],
+            "content": f"{get_platform()}{fix_context.render()}# Error Message:\n{error_message}",
+            "error": "".join(traceback.format_exception_only(exc_type, exc_value)).strip(),
+            "signature": signature,
+            "fingerprint": fingerprint,
+            "created": time.time(),
+        }
+        queue = os.path.join(self.directory, "queue")
+        os.makedirs(queue, exist_ok=True)
+        name = f"{time.time_ns()}-{os.getpid()}-{next(_job_ids)}.json"
+        write_file_atomic(os.path.join(queue, name), json.dumps(job))
+        self._start_worker()
+
+    def _start_worker(self) -> None:
+        import subprocess
+
+        with self._lock:
+            if self.worker is not None and self.worker.poll() is None:
+                return
+            options = {}
+            if os.name == "nt":
+                options["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+            else:
+                # Its own session, so it survives the process that started it, e.g. one exiting on the error
+                options["start_new_session"] = True
+            # ScriptMonkey may have been imported from a path the worker would not search
+            package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            python_path = [package_parent] + [path for path in [os.getenv("PYTHONPATH")] if path]
+            environment = dict(os.environ, PYTHONPATH=os.pathsep.join(python_path))
+            with open(os.path.join(self.directory, "worker.log"), "a") as log:
+                self.worker = subprocess.Popen(
+                    [sys.executable, "-m", "scriptmonkey.fix_worker", self.directory],
+                    stdin=subprocess.DEVNULL,
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                    close_fds=True,
+                    env=environment,
+                    **options,
+                )
+
+
+def _mark_retrieved(future) -> None:
+    retrieved = getattr(future, "_scriptmonkey_unretrieved", None)
+    if retrieved is not None:
+        retrieved["retrieved"] = True
+
+
+def work(directory: str, idle_timeout: float = IDLE_TIMEOUT) -> None:
+    """
+    Fixes the queued errors of a directory until no new error has come in for `idle_timeout` seconds.
+
+    Jobs are taken by renaming them, so several workers can share a queue, and fixes are shared through the fix
+    store (see utils.fix_store), so an error queued by many processes is fixed once.
+    """
+    queue = os.path.join(directory, "queue")
+    idle_since = time.monotonic()
+    while time.monotonic() - idle_since < idle_timeout:
+        try:
+            names = sorted(name for name in os.listdir(queue) if name.endswith(".json"))
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            path = os.path.join(queue, name)
+            working = path[: -len(".json")] + ".working"
+            try:
+                os.rename(path, working)
+            except OSError:
+                continue  # Taken by another worker
+            try:
+                with open(working, "r") as file:
+                    fix_job(json.load(file), directory)
+            except Exception as e:
+                print(f"❌ ScriptMonkey could not fix {name}: {e}")
+            finally:
+                os.remove(working)
+            idle_since = time.monotonic()
+        if not names:
+            time.sleep(POLL_INTERVAL)
+
+
+def fix_job(job: dict, directory: str) -> str:
+    """
+    Requests the fix of a queued error and writes it as a patch to `<directory>/fixes/`.
+
+    Returns:
+        str: Path of the patch, or None if there is none: the file changed since the error, or the fix failed.
+    """
+    from .core import propose_fix
+    from .telemetry import span
+    from .utils import fix_store
+    from .utils.fix_store import get_fix_store, content_hash
+    from .utils.code_context import CodeWindow, FixContext
+
+    file_path = job["path"]
+    if os.path.exists(patch_path_for(directory, job)):
+        # Queued by another process, or by this one before it restarted
+        return patch_path_for(directory, job)
+    print(f"🐒 ScriptMonkey is fixing {job['error']} in '{file_path}'")
+    source = read_file(file_path)
+    if source != job["source"]:
+        print(f"🐒 '{file_path}' changed since the error, so it is not fixed.")
+        return None
+    fix_context = FixContext(file_path, source)
+    if job["window"] is not None:
+        fix_context.target = CodeWindow(file_path, *job["window"])
+
+    store = get_fix_store()
+    state, entry = fix_store.OWNER, None
+    if store is not None:
+        state, entry = store.claim(job["fingerprint"])
+    if state == fix_store.FAILED:
+        print("❌ ScriptMonkey could not fix this error in another process, so it did not try again.")
+        return None
+    if state == fix_store.DONE and entry["before_hash"] == content_hash(source):
+        return write_patch(directory, job, source, entry["after_content"], entry["solution"])
+
+    with span("fix", path=file_path, background=True) as fix_span:
+        try:
+            result = propose_fix(fix_span, fix_context, job["content"])
+        except BaseException:
+            if store is not None and state == fix_store.OWNER:
+                store.release(job["fingerprint"])
+            raise
+    if result is None:
+        if store is not None and state == fix_store.OWNER:
+            store.fail(job["fingerprint"])
+        return None
+    before, corrected_code, solution = result
+    if store is not None and state == fix_store.OWNER:
+        store.complete(job["fingerprint"], job["signature"], file_path, before, corrected_code, solution)
+    return write_patch(directory, job, before, corrected_code, solution)
+
+
+def patch_path_for(directory: str, job: dict) -> str:
+    """Returns the path of the patch of a job, named after the file and the fingerprint of the error."""
+    stem = os.path.splitext(os.path.basename(job["path"]))[0]
+    return os.path.join(directory, "fixes", f"{stem}-{job['fingerprint'][:12]}.patch")
+
+
+def write_patch(directory: str, job: dict, before: str, after: str, solution: dict) -> str:
+    """
+    Writes a fix as a unified diff, preceded by the error and the explanation of the fix. It applies with
+    `git apply` or `patch -p1` from the working directory of the process that raised the error.
+
+    Returns:
+        str: Path of the patch.
+    """
+    from .utils.patching import write_file_atomic
+
+    path = os.path.relpath(job["path"], os.path.dirname(directory))
+    if path.startswith(".."):
+        path = job["path"]
+    diff = difflib.unified_diff(
+        before.splitlines(keepends=True), after.splitlines(keepends=True), f"a/{path}", f"b/{path}"
+    )
+    header = (
+        f"Error: {job['error']}\n\nProblem:\n{solution['problem']}\n\nSuggested Solution:\n{solution['solution']}\n"
+    )
+    patch_path = patch_path_for(directory, job)
+    os.makedirs(os.path.dirname(patch_path), exist_ok=True)
+    write_file_atomic(patch_path, header + "\n" + "".join(diff))
+    print(f"🐒 ScriptMonkey wrote a fix for {job['error']} to: '{patch_path}'")
+    return patch_path
+
+
+if __name__ == "__main__":
+    work(sys.argv[1])
@@ -1,5 +1,30 @@
 from .prompting import DefaultPrompts
-from .client import chatgpt_json, chatgpt
+from .client import (
+    chatgpt_json,
+    chatgpt,
+    chatgpt_stream,
+    chatgpt_json_stream,
+    chatgpt_json_async,
+    chatgpt_async,
+    chatgpt_stream_async,
+    chatgpt_json_stream_async,
+    configure_http,
+    get_usage,
+    track_usage,
+)
+from .cache import enable_cache, disable_cache, get_cache
+from .ratelimit import configure_rate_limits, get_rate_limiter
+from .hedging import configure_hedging, get_hedger
+from .backends import Backend, OpenAIBackend, OpenAICompatibleBackend, get_backend, set_backend
+
+
+def __getattr__(name):
+    # The fake backend is only imported when it is used (SCRIPTMONKEY_BACKEND=fake or a benchmark)
+    if name == "FakeBackend":
+        from .fake import FakeBackend
+
+        return FakeBackend
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 default_prompts = DefaultPrompts()
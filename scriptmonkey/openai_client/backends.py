@@ -0,0 +1,518 @@
+import os
+import weakref
+import threading
+
+CONFIG_FILE = os.path.expanduser("~/.scriptmonkey_config")
+
+DEFAULT_MODEL = "gpt-4o"
+DEFAULT_STRUCTURED_MODEL = "gpt-4o-2024-08-06"
+DEFAULT_SMALL_MODEL = "gpt-4o-mini"  # Cheaper, faster model for simple files of a build
+
+# Connection pool shared by all requests of a client: keep-alive connections are reused across requests (and
+# threads), so concurrent builds do not pay for a TLS handshake per file
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 20
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_TIMEOUT = 600.0
+
+_http_settings = {
+    "max_connections": int(os.getenv("SCRIPTMONKEY_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS)),
+    "max_keepalive_connections": int(
+        os.getenv("SCRIPTMONKEY_MAX_KEEPALIVE_CONNECTIONS", DEFAULT_MAX_KEEPALIVE_CONNECTIONS)
+    ),
+    "connect_timeout": float(os.getenv("SCRIPTMONKEY_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+    "timeout": float(os.getenv("SCRIPTMONKEY_TIMEOUT", DEFAULT_TIMEOUT)),
+}
+_http_generation = 0  # Bumped by configure_http() so backends rebuild their clients
+
+
+def get_openai_api_key():
+    # Try to get the API key from environment variables
+    api_key = os.getenv("OPENAI_API_KEY")
+
+    # If not set, check the config file
+    if not api_key and os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, "r") as f:
+            api_key = f.read().strip()
+
+    # If still not set, prompt the user for it
+    if not api_key:
+        print("It looks like your OpenAI API key isn't set.")
+        api_key = input("🐒 Please paste your OpenAI API key here and press ENTER: ").strip()
+
+        # Save the key to the config file for future use
+        with open(CONFIG_FILE, "w") as f:
+            f.write(api_key)
+        print(f"Your API key has been saved to {CONFIG_FILE} for future use.")
+
+    return api_key
+
+
+def configure_http(
+    max_connections: int = None,
+    max_keepalive_connections: int = None,
+    timeout: float = None,
+    connect_timeout: float = None,
+) -> None:
+    """
+    Configures the connection pool and timeouts of the OpenAI clients. Settings that are not given keep their value.
+
+    Args:
+        max_connections (int, optional): Maximum number of concurrent connections. Defaults to
+            SCRIPTMONKEY_MAX_CONNECTIONS or 100.
+        max_keepalive_connections (int, optional): Idle connections kept open for reuse. Defaults to
+            SCRIPTMONKEY_MAX_KEEPALIVE_CONNECTIONS or 20.
+        timeout (float, optional): Seconds to wait for a response. Defaults to SCRIPTMONKEY_TIMEOUT or 600.
+        connect_timeout (float, optional): Seconds to wait for a connection. Defaults to SCRIPTMONKEY_CONNECT_TIMEOUT
+            or 5.
+    """
+    global _http_generation
+    settings = {
+        "max_connections": max_connections,
+        "max_keepalive_connections": max_keepalive_connections,
+        "timeout": timeout,
+        "connect_timeout": connect_timeout,
+    }
+    _http_settings.update({name: value for name, value in settings.items() if value is not None})
+    # Clients created from now on use the new settings
+    _http_generation += 1
+
+
+def _http_client_options(openai) -> dict:
+    # The Limits class of the HTTP library openai is built on, without depending on that library directly
+    limits_class = type(openai.DEFAULT_CONNECTION_LIMITS)
+    return {
+        "limits": limits_class(
+            max_connections=_http_settings["max_connections"],
+            max_keepalive_connections=_http_settings["max_keepalive_connections"],
+        ),
+        "timeout": openai.Timeout(_http_settings["timeout"], connect=_http_settings["connect_timeout"]),
+    }
+
+
+class Usage:
+    """Token usage of a completion."""
+
+    def __init__(self, prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens  # Prompt tokens served from the provider's prompt cache
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @classmethod
+    def from_openai(cls, usage):
+        if usage is None:
+            return None
+        details = getattr(usage, "prompt_tokens_details", None)
+        return cls(
+            prompt_tokens=usage.prompt_tokens or 0,
+            completion_tokens=usage.completion_tokens or 0,
+            cached_tokens=getattr(details, "cached_tokens", None) or 0,
+        )
+
+
+class Completion:
+    """
+    The result of a chat completion, independent of the backend that produced it.
+
+    Attributes:
+        text (str): The generated text (the raw JSON for structured outputs).
+        parsed (dict): The structured output as a dictionary, for `parse` requests.
+        usage (Usage): The token usage, if reported.
+        finish_reason (str): Why generation stopped: "stop", or "length" when max_tokens was reached.
+    """
+
+    def __init__(self, text: str = None, parsed: dict = None, usage: Usage = None, finish_reason: str = "stop"):
+        self.text = text
+        self.parsed = parsed
+        self.usage = usage
+        self.finish_reason = finish_reason
+
+
+class CompletionStream:
+    """
+    A streamed completion: iterate over it (or `async for` over it) to get the text chunk by chunk. `usage` and
+    `finish_reason` are set once the stream is exhausted.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.usage = None
+        self.finish_reason = None
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def __aiter__(self):
+        return self._chunks.__aiter__()
+
+    def close(self) -> None:
+        """Stops a synchronous stream early; the rest of the response is not read."""
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+
+
+class Backend:
+    """
+    An LLM provider behind chatgpt(), chatgpt_json() and their async and streaming variants.
+
+    Subclasses implement the requests below; rate limiting, retries and caching are handled by the caller. A
+    request that fails should raise an exception with a `status_code` attribute (like openai.APIStatusError) so the
+    rate limiter can tell transient failures apart.
+
+    Attributes:
+        name (str): Short name of the backend, shown in reports.
+        default_model (str): Model used by chatgpt() when none is given.
+        structured_model (str): Model used by chatgpt_json().
+        small_model (str): Cheaper, faster model used for the simple files of a build (see scriptmonkey.routing).
+        cache_namespace (str): Prefix of the response cache keys, so backends never share cached responses.
+        rate_limited (bool): Whether requests go through the client-side rate limiter.
+    """
+
+    name = "backend"
+    default_model = DEFAULT_MODEL
+    structured_model = DEFAULT_STRUCTURED_MODEL
+    small_model = DEFAULT_SMALL_MODEL
+    cache_namespace = ""
+    rate_limited = True
+
+    def complete(self, model: str, messages: list, max_tokens: int = None) -> Completion:
+        """Sends a chat completion request and returns the generated text."""
+        raise NotImplementedError
+
+    def parse(self, model: str, messages: list, response_format) -> Completion:
+        """Sends a structured output request and returns the parsed response as `Completion.parsed`."""
+        raise NotImplementedError
+
+    def stream(self, model: str, messages: list, max_tokens: int = None, response_format=None) -> CompletionStream:
+        """
+        Sends a streaming chat completion request. The request is sent before this returns. With a
+        `response_format`, the stream is the JSON text of a structured output, generated as it is for parse().
+        """
+        raise NotImplementedError
+
+    async def complete_async(self, model: str, messages: list, max_tokens: int = None) -> Completion:
+        raise NotImplementedError
+
+    async def parse_async(self, model: str, messages: list, response_format) -> Completion:
+        raise NotImplementedError
+
+    async def stream_async(
+        self, model: str, messages: list, max_tokens: int = None, response_format=None
+    ) -> CompletionStream:
+        raise NotImplementedError
+
+
+class OpenAIBackend(Backend):
+    """
+    The OpenAI API, through the official `openai` package.
+
+    The clients are created on first use, so importing scriptmonkey never loads openai or asks for an API key.
+    There is one sync client per backend and one async client per event loop, as async connections belong to
+    their loop; each has its own keep-alive connection pool (see configure_http()).
+
+    Args:
+        api_key (str, optional): The API key. Defaults to OPENAI_API_KEY, the config file, or a prompt.
+        base_url (str, optional): URL of the API. Defaults to OpenAI's.
+        default_model (str, optional): Model of chatgpt(). Defaults to "gpt-4o".
+        structured_model (str, optional): Model of chatgpt_json(). Defaults to "gpt-4o-2024-08-06".
+        small_model (str, optional): Model of the simple files of a build. Defaults to "gpt-4o-mini".
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        api_key: str = None,
+        base_url: str = None,
+        default_model: str = DEFAULT_MODEL,
+        structured_model: str = DEFAULT_STRUCTURED_MODEL,
+        small_model: str = DEFAULT_SMALL_MODEL,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.default_model = default_model
+        self.structured_model = structured_model
+        self.small_model = small_model
+        self._client = None
+        self._client_generation = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _get_api_key(self) -> str:
+        if self.api_key is None:
+            from dotenv import load_dotenv
+
+            # Load environment variables from the .env file if present
+            load_dotenv()
+            self.api_key = get_openai_api_key()
+        return self.api_key
+
+    @property
+    def client(self):
+        """The sync OpenAI client, loading the .env file and the API key the first time it is needed."""
+        if self._client is None or self._client_generation != _http_generation:
+            with self._lock:
+                if self._client is None or self._client_generation != _http_generation:
+                    import openai
+
+                    # Retries are handled by the shared rate limiter, which knows about every request in flight
+                    self._client = openai.OpenAI(
+                        api_key=self._get_api_key(),
+                        base_url=self.base_url,
+                        max_retries=0,
+                        http_client=openai.DefaultHttpxClient(**_http_client_options(openai)),
+                    )
+                    self._client_generation = _http_generation
+        return self._client
+
+    @property
+    def async_client(self):
+        """The AsyncOpenAI client of the running event loop, sharing one connection pool between its tasks."""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        client, generation = self._async_clients.get(loop, (None, None))
+        if client is None or generation != _http_generation:
+            with self._lock:
+                import openai
+
+                client = openai.AsyncOpenAI(
+                    api_key=self._get_api_key(),
+                    base_url=self.base_url,
+                    max_retries=0,
+                    http_client=openai.DefaultAsyncHttpxClient(**_http_client_options(openai)),
+                )
+                self._async_clients[loop] = (client, _http_generation)
+        return client
+
+    @staticmethod
+    def _completion(response) -> Completion:
+        choice = response.choices[0]
+        return Completion(
+            text=choice.message.content,
+            usage=Usage.from_openai(response.usage),
+            finish_reason=choice.finish_reason,
+        )
+
+    @staticmethod
+    def _parsed_completion(response) -> Completion:
+        completion = OpenAIBackend._completion(response)
+        completion.parsed = response.choices[0].message.parsed.model_dump()
+        return completion
+
+    def complete(self, model, messages, max_tokens=None):
+        response = self.client.chat.completions.create(model=model, max_tokens=max_tokens, messages=messages)
+        return self._completion(response)
+
+    def parse(self, model, messages, response_format):
+        response = self.client.beta.chat.completions.parse(
+            model=model, messages=messages, response_format=response_format
+        )
+        return self._parsed_completion(response)
+
+    def stream(self, model, messages, max_tokens=None, response_format=None):
+        if response_format is not None:
+            return self._stream_structured(model, messages, max_tokens, response_format)
+        response = self.client.chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        def chunks():
+            try:
+                for chunk in response:
+                    self._read_chunk(stream, chunk)
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
+            finally:
+                # Closing the connection lets the provider stop generating the rest of an abandoned response
+                response.close()
+
+        stream = CompletionStream(chunks())
+        return stream
+
+    async def complete_async(self, model, messages, max_tokens=None):
+        response = await self.async_client.chat.completions.create(
+            model=model, max_tokens=max_tokens, messages=messages
+        )
+        return self._completion(response)
+
+    async def parse_async(self, model, messages, response_format):
+        response = await self.async_client.beta.chat.completions.parse(
+            model=model, messages=messages, response_format=response_format
+        )
+        return self._parsed_completion(response)
+
+    async def stream_async(self, model, messages, max_tokens=None, response_format=None):
+        if response_format is not None:
+            return await self._stream_structured_async(model, messages, max_tokens, response_format)
+        response = await self.async_client.chat.completions.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        async def chunks():
+            async for chunk in response:
+                self._read_chunk(stream, chunk)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+
+        stream = CompletionStream(chunks())
+        return stream
+
+    def _stream_structured(self, model, messages, max_tokens, response_format):
+        manager = self.client.beta.chat.completions.stream(
+            model=model,
+            max_tokens=max_tokens,
+            messages=messages,
+            response_format=response_format,
+            stream_options={"include_usage": True},
+        )
+        events = manager.__enter__()
+
+        def chunks():
+            try:
+                for event in events:
+                    if event.type == "chunk":
+                        self._read_chunk(stream, event.chunk)
+                    elif event.type == "content.delta" and event.delta:
+                        yield event.delta
+            finally:
+                manager.__exit__(None, None, None)
+
+        stream = CompletionStream(chunks())
+        return stream
+
+    async def _stream_structured_async(self, model, messages, max_tokens, response_format):
+        manager = self.async_client.beta.chat.completions.stream(
+            model=model,
+            max_tokens=max_tokens,
+            messages=messages,
+            response_format=response_format,
+            stream_options={"include_usage": True},
+        )
+        events = await manager.__aenter__()
+
+        async def chunks():
+            try:
+                async for event in events:
+                    if event.type == "chunk":
+                        self._read_chunk(stream, event.chunk)
+                    elif event.type == "content.delta" and event.delta:
+                        yield event.delta
+            finally:
+                await manager.__aexit__(None, None, None)
+
+        stream = CompletionStream(chunks())
+        return stream
+
+    @staticmethod
+    def _read_chunk(stream: CompletionStream, chunk) -> None:
+        # The finish reason comes with the last content chunk and the usage with a final chunk without choices
+        if chunk.choices and chunk.choices[0].finish_reason:
+            stream.finish_reason = chunk.choices[0].finish_reason
+        if getattr(chunk, "usage", None) is not None:
+            stream.usage = Usage.from_openai(chunk.usage)
+
+
+class OpenAICompatibleBackend(OpenAIBackend):
+    """
+    A self-hosted server that implements the OpenAI chat completions API, such as vLLM, Ollama, LM Studio or
+    llama.cpp's server. Structured outputs require the server to support `response_format` with a JSON schema.
+
+    Args:
+        base_url (str): URL of the API, e.g. "http://localhost:8000/v1".
+        model (str): Model of chatgpt().
+        structured_model (str, optional): Model of chatgpt_json(). Defaults to `model`.
+        small_model (str, optional): Model of the simple files of a build. Defaults to `model`, as a server
+            usually serves a single model.
+        api_key (str, optional): The API key, if the server needs one. Defaults to SCRIPTMONKEY_API_KEY.
+        rate_limited (bool, optional): Whether to apply the client-side rate limits. Defaults to False.
+    """
+
+    name = "openai-compatible"
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str = DEFAULT_MODEL,
+        structured_model: str = None,
+        api_key: str = None,
+        rate_limited: bool = False,
+        small_model: str = None,
+    ):
+        # Local servers usually ignore the key, but the openai client requires one
+        api_key = api_key or os.getenv("SCRIPTMONKEY_API_KEY") or "not-needed"
+        super().__init__(api_key, base_url, model, structured_model or model, small_model or model)
+        self.cache_namespace = base_url
+        self.rate_limited = rate_limited
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _backend_from_environment() -> Backend:
+    kind = os.getenv("SCRIPTMONKEY_BACKEND", "openai").lower()
+    base_url = os.getenv("SCRIPTMONKEY_BASE_URL")
+    model = os.getenv("SCRIPTMONKEY_MODEL", DEFAULT_MODEL)
+    structured_model = os.getenv("SCRIPTMONKEY_STRUCTURED_MODEL")
+    small_model = os.getenv("SCRIPTMONKEY_SMALL_MODEL")
+
+    if kind == "fake":
+        from .fake import FakeBackend
+
+        return FakeBackend(seed=int(os.getenv("SCRIPTMONKEY_FAKE_SEED", 0)))
+    if kind not in ("openai", "openai-compatible"):
+        raise ValueError(f"Unknown SCRIPTMONKEY_BACKEND '{kind}', expected 'openai', 'openai-compatible' or 'fake'.")
+    if base_url:
+        return OpenAICompatibleBackend(
+            base_url, model=model, structured_model=structured_model, small_model=small_model
+        )
+    return OpenAIBackend(
+        default_model=model,
+        structured_model=structured_model or DEFAULT_STRUCTURED_MODEL,
+        small_model=small_model or DEFAULT_SMALL_MODEL,
+    )
+
+
+def get_backend() -> Backend:
+    """
+    Returns the active backend. Unless one was set with set_backend(), it is chosen from the environment:
+    SCRIPTMONKEY_BACKEND=fake selects the FakeBackend, SCRIPTMONKEY_BASE_URL an OpenAI-compatible server, and
+    SCRIPTMONKEY_MODEL / SCRIPTMONKEY_STRUCTURED_MODEL / SCRIPTMONKEY_SMALL_MODEL override the models. The default
+    is OpenAI.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _backend_from_environment()
+    return _backend
+
+
+def set_backend(backend: Backend) -> Backend:
+    """
+    Sets the backend used by every request, returning the previous one.
+
+    Usage:
+        set_backend(OpenAICompatibleBackend("http://localhost:11434/v1", model="llama3.1"))
+        set_backend(FakeBackend(latency=0.2, error_rate=0.05))
+    """
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
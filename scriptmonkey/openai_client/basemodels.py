@@ -19,7 +19,41 @@ class ProjectStructureResponse(BaseModel):
     files: List[ProjectFile]  # List of all files and directories in the project
 
 
+class PlannedFile(BaseModel):
+    path: str  # The full path to the file
+    purpose: str  # One sentence on what the file does and which files of other packages it uses
+
+
+class PackageOutline(BaseModel):
+    path: str  # The directory of the package, ending with '/', or '' for the files at the root of the project
+    description: str  # High-level purpose of the package
+    files: List[PlannedFile]  # The files of the package, without their functions
+
+
+class ProjectOutline(BaseModel):
+    packages: List[PackageOutline]  # The packages of the project, whose files are detailed separately
+
+
 class ScriptMonkeyResponse(BaseModel):
     problem: str  # A description of the error/problem
     solution: str  # The solution to the problem
     corrected_code: str  # The corrected version of the Python code
+
+
+class ScriptMonkeyWindowResponse(BaseModel):
+    problem: str  # A description of the error/problem
+    solution: str  # The solution to the problem
+    corrected_code: str  # The corrected version of the excerpt of the file that was sent
+    new_imports: List[str]  # Import statements the corrected code needs that the file does not have yet
+
+
+class CodeEdit(BaseModel):
+    search: str  # Lines of the original code to replace, quoted exactly, enough of them to be unique
+    replace: str  # The lines that replace them
+
+
+class ScriptMonkeyPatchResponse(BaseModel):
+    problem: str  # A description of the error/problem
+    solution: str  # The solution to the problem
+    edits: List[CodeEdit]  # The changes that fix the code, as search/replace blocks
+    new_imports: List[str]  # Import statements the edits need that the file does not have yet
@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import sqlite3
+import weakref
+import hashlib
+import threading
+
+CACHE_FILE = os.path.expanduser("~/.scriptmonkey_cache.sqlite")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MB
+DEFAULT_TTL = 30 * 24 * 60 * 60  # 30 days
+
+
+def make_cache_key(
+    model: str, messages: list, response_format=None, max_tokens=None, max_continuations: int = 0
+) -> str:
+    """
+    Builds the cache key of a chat completion request.
+
+    Args:
+        model (str): The model the request is sent to.
+        messages (list): The chat messages of the request.
+        response_format (BaseModel, optional): The Pydantic model of a structured output request.
+        max_tokens (int, optional): The max tokens of the request.
+        max_continuations (int, optional): How many times a response cut off at `max_tokens` is continued.
+
+    Returns:
+        str: A SHA-256 hex digest identifying the request.
+    """
+    schema = response_format.model_json_schema() if response_format is not None else None
+    request = {"model": model, "messages": messages, "response_format": schema, "max_tokens": max_tokens}
+    if max_continuations:
+        # Only added when set, so the keys of requests without continuations are unchanged
+        request["max_continuations"] = max_continuations
+    payload = json.dumps(request, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """A request that is currently being computed by another thread of this process."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    A persistent, size-bounded cache of LLM responses backed by SQLite.
+
+    The database runs in WAL mode so several processes can share it safely. Entries expire after `ttl` seconds and
+    the least recently used entries are evicted once the cache grows beyond `max_bytes`. Identical requests that are
+    in flight at the same time within one process (or, for async requests, within one event loop) are coalesced
+    into a single API call.
+    """
+
+    def __init__(self, path: str = CACHE_FILE, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._local = threading.local()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        # Event loop -> key -> asyncio.Future of the async requests in flight, which can only be awaited in their loop
+        self._inflight_async = weakref.WeakKeyDictionary()
+
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO stats (name, value) VALUES ('hits', 0), ('misses', 0)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so every thread gets its own
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        """Returns the cached value for a key, or None if it is missing or expired."""
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+
+        if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+            if row is not None:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            conn.execute("UPDATE stats SET value = value + 1 WHERE name = 'misses'")
+            return None
+
+        conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        conn.execute("UPDATE stats SET value = value + 1 WHERE name = 'hits'")
+        return json.loads(row[0])
+
+    def set(self, key: str, value) -> None:
+        """Stores a JSON-serializable value and evicts old entries if the cache is over its limits."""
+        conn = self._connection()
+        now = time.time()
+        data = json.dumps(value)
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data.encode("utf-8")), now, now),
+        )
+        self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        if self.ttl is not None:
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Drop the least recently used entries until the cache fits again
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed, created"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def get_or_compute(self, key: str, compute):
+        """
+        Returns the cached value for a key, calling `compute()` and caching its result on a miss.
+
+        Concurrent calls for the same key within this process wait for the first one instead of repeating it.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._inflight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            self.set(key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    async def get_or_compute_async(self, key: str, compute):
+        """
+        Like get_or_compute(), for a `compute` coroutine function. Concurrent calls for the same key in the same
+        event loop await the first one. The SQLite reads and writes run in a worker thread, so a slow disk or a
+        lock held by another process never blocks the event loop.
+        """
+        import asyncio
+
+        value = await asyncio.to_thread(self.get, key)
+        if value is not None:
+            return value
+
+        loop = asyncio.get_running_loop()
+        with self._inflight_lock:
+            flights = self._inflight_async.setdefault(loop, {})
+        while key in flights:
+            flight = flights[key]
+            try:
+                # Shielded, so a caller that is cancelled does not cancel the request the others are waiting for
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # The first caller was cancelled: the next one in line sends the request
+
+        flight = flights[key] = loop.create_future()
+        try:
+            value = await compute()
+            await asyncio.to_thread(self.set, key, value)
+            flight.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            # Retrieved here, so asyncio does not warn about it when no other caller was waiting
+            flight.exception()
+            raise
+        finally:
+            flights.pop(key, None)
+
+    def stats(self) -> dict:
+        """Returns the number of entries, their total size and the hit/miss counters of the cache."""
+        conn = self._connection()
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        counters = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+        }
+
+    def clear(self) -> None:
+        """Removes every cached response and resets the counters."""
+        conn = self._connection()
+        conn.execute("DELETE FROM responses")
+        conn.execute("UPDATE stats SET value = 0")
+
+
+# The cache is opt-in: it is only used once enabled, either in code or with SCRIPTMONKEY_CACHE=1
+_cache = None
+_cache_disabled = False
+_cache_lock = threading.Lock()
+
+
+def enable_cache(path: str = None, max_bytes: int = None, ttl: float = None) -> ResponseCache:
+    """
+    Enables the on-disk response cache for every chatgpt() and chatgpt_json() call.
+
+    Args:
+        path (str, optional): Location of the SQLite database. Defaults to SCRIPTMONKEY_CACHE_PATH or
+            "~/.scriptmonkey_cache.sqlite".
+        max_bytes (int, optional): Size cap of the cache. Defaults to SCRIPTMONKEY_CACHE_MAX_BYTES or 256 MB.
+        ttl (float, optional): Seconds after which entries expire. Defaults to SCRIPTMONKEY_CACHE_TTL or 30 days.
+
+    Returns:
+        ResponseCache: The enabled cache.
+    """
+    global _cache, _cache_disabled
+    # 0 is a valid size cap or ttl, so only None falls back to the defaults
+    if path is None:
+        path = os.getenv("SCRIPTMONKEY_CACHE_PATH", CACHE_FILE)
+    if max_bytes is None:
+        max_bytes = int(os.getenv("SCRIPTMONKEY_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+    if ttl is None:
+        ttl = float(os.getenv("SCRIPTMONKEY_CACHE_TTL", DEFAULT_TTL))
+    with _cache_lock:
+        _cache = ResponseCache(path=path, max_bytes=max_bytes, ttl=ttl)
+        _cache_disabled = False
+        return _cache
+
+
+def disable_cache() -> None:
+    """Disables the response cache, including one enabled through the environment."""
+    global _cache, _cache_disabled
+    with _cache_lock:
+        _cache = None
+        _cache_disabled = True
+
+
+def get_cache():
+    """Returns the active ResponseCache, or None if caching is disabled."""
+    if _cache is None and not _cache_disabled and os.getenv("SCRIPTMONKEY_CACHE", "").lower() in ("1", "true", "yes"):
+        return enable_cache()
+    return _cache
+
+
+def cached_completion(
+    model: str, messages: list, compute, response_format=None, max_tokens=None, max_continuations=0
+):
+    """
+    Returns the cached result of a request if the cache is enabled, otherwise (or on a miss) calls `compute()`. A
+    `compute()` that raises is not cached.
+    """
+    cache = get_cache()
+    if cache is None:
+        return compute()
+    key = make_cache_key(model, messages, response_format, max_tokens, max_continuations)
+    return cache.get_or_compute(key, compute)
+
+
+async def cached_completion_async(
+    model: str, messages: list, compute, response_format=None, max_tokens=None, max_continuations=0
+):
+    """
+    Like cached_completion(), for a `compute` coroutine function (see ResponseCache.get_or_compute_async).
+    """
+    cache = get_cache()
+    if cache is None:
+        return await compute()
+    key = make_cache_key(model, messages, response_format, max_tokens, max_continuations)
+    return await cache.get_or_compute_async(key, compute)
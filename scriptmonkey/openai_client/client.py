@@ -1,84 +1,639 @@
-import os
+import json
+import threading
+import contextlib
+import contextvars
+from typing import TYPE_CHECKING
 
-from dotenv import load_dotenv
-from pydantic import BaseModel
-import openai
+from .cache import cached_completion, cached_completion_async, get_cache, make_cache_key
+from .ratelimit import estimate_tokens, get_rate_limiter
+from .hedging import HedgeCancelled, get_hedger
+from .backends import CONFIG_FILE, Completion, OpenAIBackend, configure_http, get_backend, get_openai_api_key, set_backend
+from ..telemetry import span
 
-CONFIG_FILE = os.path.expanduser("~/.scriptmonkey_config")
+if TYPE_CHECKING:
+    from pydantic import BaseModel
 
-# Load environment variables from the .env file if present
-load_dotenv()
+_openai_backend = None
 
+# Token usage of every API call of the process, whether or not it is traced
+_usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+_usage_lock = threading.Lock()
+# The usage counters of the track_usage() blocks the current context is in
+_usage_meters = contextvars.ContextVar("scriptmonkey_usage_meters", default=())
 
-def get_openai_api_key():
-    # Try to get the API key from environment variables
-    api_key = os.getenv("OPENAI_API_KEY")
+# Sent after a response that was cut off at max_tokens
+CONTINUE_PROMPT = (
+    "Your response was cut off. Continue exactly where it stopped, without repeating anything and without any "
+    "introduction or code fence."
+)
 
-    # If not set, check the config file
-    if not api_key and os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as f:
-            api_key = f.read().strip()
 
-    # If still not set, prompt the user for it
-    if not api_key:
-        print("It looks like your OpenAI API key isn't set.")
-        api_key = input("🐒 Please paste your OpenAI API key here and press ENTER: ").strip()
+def get_client():
+    """Returns the sync OpenAI client of the active backend (or of a default OpenAI backend if it is not OpenAI)."""
+    global _openai_backend
+    backend = get_backend()
+    if not isinstance(backend, OpenAIBackend):
+        _openai_backend = _openai_backend or OpenAIBackend()
+        backend = _openai_backend
+    return backend.client
 
-        # Save the key to the config file for future use
-        with open(CONFIG_FILE, "w") as f:
-            f.write(api_key)
-        print(f"Your API key has been saved to {CONFIG_FILE} for future use.")
 
-    return api_key
+def __getattr__(name):
+    # Keep the former module-level `client` and `OPENAI_API_KEY` attributes available, created lazily
+    if name == "client":
+        return get_client()
+    if name == "OPENAI_API_KEY":
+        return get_client().api_key
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-# Get the OpenAI API key using the function
-OPENAI_API_KEY = get_openai_api_key()
+def _cache_model(backend, model: str) -> str:
+    # Responses of different backends never share cache entries
+    return f"{backend.cache_namespace}/{model}" if backend.cache_namespace else model
 
-# Initialize the OpenAI client with the obtained API key
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
 
+def _record_completion(trace_span, completion) -> None:
+    """Records an API call and its token usage in the span of an LLM request and in the usage totals."""
+    trace_span.set(finish_reason=completion.finish_reason)
+    trace_span.add("llm_calls")
+    usage = completion.usage
+    with _usage_lock:
+        for counters in (_usage,) + _usage_meters.get():
+            counters["requests"] += 1
+            if usage is not None:
+                counters["prompt_tokens"] += usage.prompt_tokens
+                counters["completion_tokens"] += usage.completion_tokens
+                counters["cached_tokens"] += usage.cached_tokens
+    if usage is not None:
+        trace_span.add("prompt_tokens", usage.prompt_tokens)
+        trace_span.add("completion_tokens", usage.completion_tokens)
+        trace_span.add("cached_tokens", usage.cached_tokens)
 
-def chatgpt_json(instructions: str, content: str, response_format: BaseModel) -> dict:
+
+def get_usage() -> dict:
+    """
+    Returns the token usage of the API calls made so far by this process, as reported by the provider. Responses
+    served from the local response cache are not included.
+
+    Returns:
+        dict: The number of `requests`, and their `prompt_tokens`, `completion_tokens` and `cached_tokens` (the
+            prompt tokens the provider served from its prompt cache, which are cheaper and faster).
+    """
+    with _usage_lock:
+        return dict(_usage)
+
+
+@contextlib.contextmanager
+def track_usage():
+    """
+    Measures the token usage of the API calls made inside the block, as reported by the provider: the system
+    message and the continuations of a response included, while responses served from the local response cache
+    count for nothing. Blocks can be nested, and threads and tasks started in the block count towards it if they
+    run in a copy of its context.
+
+    Usage:
+        with track_usage() as usage:
+            chatgpt(prompt)
+        print(usage["prompt_tokens"], usage["completion_tokens"])
+
+    Yields:
+        dict: The counters, like get_usage(), updated as the calls complete.
+    """
+    meter = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    token = _usage_meters.set(_usage_meters.get() + (meter,))
+    try:
+        yield meter
+    finally:
+        _usage_meters.reset(token)
+
+
+def _prompt_messages(prompt: str, system: str = None) -> list:
+    # The system message comes first, so a system message shared by many requests is a prompt prefix the provider
+    # can cache
+    system_messages = [] if system is None else [{"role": "system", "content": system}]
+    return system_messages + [{"role": "user", "content": prompt}]
+
+
+class _TruncatedResponse(Exception):
+    """Carries a response that is still cut off after its continuations past the response cache, uncached."""
+
+    def __init__(self, text: str):
+        super().__init__("the response was cut off at max_tokens")
+        self.text = text
+
+
+def _hedge_admission(backend, model: str, messages: list, max_tokens):
+    """
+    Returns the check the hedger makes before it sends a second copy of a request: the copy is only sent if the
+    rate limits have room for it right away, and it is counted against them like any request.
+    """
+    return lambda: get_rate_limiter().try_reserve(model, messages, max_tokens, throttle=backend.rate_limited)
+
+
+def _complete_unless_cancelled(backend, model: str, messages: list, max_tokens, cancelled):
+    """
+    Sends a completion request for the hedger. A copy that may lose is streamed, so it can stop reading as soon as
+    the other copy has won (`cancelled` is set) instead of running to the end.
+    """
+    if cancelled is None:
+        return backend.complete(model, messages, max_tokens)
+    stream = backend.stream(model, messages, max_tokens)
+    chunks = []
+    try:
+        for chunk in stream:
+            if cancelled.is_set():
+                raise HedgeCancelled()
+            chunks.append(chunk)
+    finally:
+        stream.close()
+    return Completion("".join(chunks), usage=stream.usage, finish_reason=stream.finish_reason)
+
+
+def _continuation_messages(messages: list, text: str) -> list:
+    # The cut-off response goes back as the assistant's turn, so the model picks up exactly where it stopped
+    return messages + [
+        {"role": "assistant", "content": text},
+        {"role": "user", "content": CONTINUE_PROMPT},
+    ]
+
+
+def chatgpt_json(
+    instructions: str, content: str, response_format: "BaseModel", model: str = None, use_cache: bool = True
+) -> dict:
     """This function is used to return content from OpenAI Chat Completions API as a structured dictionary response.
 
     Args:
         instructions (str): Instructions for the LLM (how the LLM should process the input content).
         content (str): Information that the LLM is supposed to process.
         response_format (BaseModel): The output format defined by a Pydantic Basemodel.
+        model (str, optional): Model to use. Defaults to the backend's structured model ("gpt-4o-2024-08-06").
+        use_cache (bool, optional): Whether the response cache may answer the request and store its response. Pass
+            False for requests sent several times to get different answers. Defaults to True.
+
+    Requests go to the active backend (see `backends.get_backend`). Identical requests are answered from the
+    on-disk response cache when it is enabled. Requests are rate limited and transient errors retried (see
+    `ratelimit.RateLimiter`).
 
     Returns:
         dict: The structured output response from the LLM.
     """
-    completion = client.beta.chat.completions.parse(
-        model="gpt-4o-2024-08-06",
-        messages=[
-            {"role": "system", "content": instructions},
-            {"role": "user", "content": content},
-        ],
-        response_format=response_format,
-    )
+    backend = get_backend()
+    model = model or backend.structured_model
+    messages = [
+        {"role": "system", "content": instructions},
+        {"role": "user", "content": content},
+    ]
+
+    with span("llm", request="chatgpt_json", backend=backend.name, model=model, cache_hit=True) as trace_span:
+
+        def request():
+            trace_span.set(cache_hit=False)
+            completion = get_rate_limiter().call(
+                model,
+                messages,
+                lambda: backend.parse(model, messages, response_format),
+                throttle=backend.rate_limited,
+            )
+            _record_completion(trace_span, completion)
+            return completion.parsed
 
-    structured_response = completion.choices[0].message.parsed
-    return structured_response.model_dump()
+        if not use_cache:
+            return request()
+        return cached_completion(_cache_model(backend, model), messages, request, response_format=response_format)
 
 
-def chatgpt(prompt: str, model="gpt-4o", max_tokens=None):
+def chatgpt(
+    prompt: str,
+    model=None,
+    max_tokens=None,
+    system: str = None,
+    max_continuations: int = 0,
+    with_finish_reason: bool = False,
+):
     """Function for generating responses to text prompts with OpenAI's ChatGPT API
 
     Args:
         prompt (str): The instructions for ChatGPT to respond to
-        model (str, optional): ChatGPT model to use. Defaults to "gpt-4o".
+        model (str, optional): ChatGPT model to use. Defaults to the backend's default model ("gpt-4o").
             - List of Available Models: https://platform.openai.com/docs/models/continuous-model-upgrades
         max_tokens (int, optional): Optional, the max tokens to be returned by response. Defaults to no limit (i.e. None).
+        system (str, optional): A system message sent before the prompt. Put the content shared by many requests
+            here, so the provider can serve it from its prompt cache. Defaults to None.
+        max_continuations (int, optional): How many times a response cut off at `max_tokens` is continued by
+            another request, each with the same limit. Defaults to 0.
+        with_finish_reason (bool, optional): Whether to also return why the response ended. Defaults to False.
+
+    Requests go to the active backend (see `backends.get_backend`). Identical requests are answered from the
+    on-disk response cache when it is enabled. Requests are rate limited and transient errors retried (see
+    `ratelimit.RateLimiter`), and sent a second time when they are much slower than usual (see
+    `hedging.Hedger`).
+
+    Returns:
+        str: Returns the response to the prompt as a string value. With `with_finish_reason`, a tuple of the
+            response and "length" if it is still cut off after its continuations, or "stop".
+    """
+    backend = get_backend()
+    model = model or backend.default_model
+    messages = _prompt_messages(prompt, system)
+
+    with span("llm", request="chatgpt", backend=backend.name, model=model, cache_hit=True) as trace_span:
+
+        def request():
+            trace_span.set(cache_hit=False)
+            text = ""
+            request_messages = messages
+            for continuation in range(max_continuations + 1):
+                admit = _hedge_admission(backend, model, request_messages, max_tokens)
+                completion = get_rate_limiter().call(
+                    model,
+                    request_messages,
+                    lambda: get_hedger().call(
+                        model,
+                        lambda cancelled: _complete_unless_cancelled(
+                            backend, model, request_messages, max_tokens, cancelled
+                        ),
+                        admit=admit,
+                        max_tokens=max_tokens,
+                    ),
+                    max_tokens=max_tokens,
+                    throttle=backend.rate_limited,
+                )
+                _record_completion(trace_span, completion)
+                text += completion.text
+                if completion.finish_reason != "length":
+                    return text
+                if continuation == max_continuations:
+                    trace_span.set(truncated=True)
+                    raise _TruncatedResponse(text)
+                trace_span.add("continuations")
+                request_messages = _continuation_messages(messages, text)
+
+        # The cache holds the whole response, continuations included, and never a response that was cut off
+        try:
+            text = cached_completion(
+                _cache_model(backend, model), messages, request, None, max_tokens, max_continuations
+            )
+            finish_reason = "stop"
+        except _TruncatedResponse as truncated:
+            text, finish_reason = truncated.text, "length"
+        return (text, finish_reason) if with_finish_reason else text
+
+
+def chatgpt_stream(prompt: str, model=None, max_tokens=None, system: str = None):
+    """Function for streaming responses to text prompts with OpenAI's ChatGPT API
+
+    Args:
+        prompt (str): The instructions for ChatGPT to respond to
+        model (str, optional): ChatGPT model to use. Defaults to the backend's default model ("gpt-4o").
+        max_tokens (int, optional): Optional, the max tokens to be returned by response. Defaults to no limit (i.e. None).
+        system (str, optional): A system message sent before the prompt. Put the content shared by many requests
+            here, so the provider can serve it from its prompt cache. Defaults to None.
+
+    When the response cache is enabled, a cached response is yielded as a single chunk and a fully streamed
+    response is stored in the cache, unless it was cut off at `max_tokens`. Opening the stream is rate limited and
+    retried like chatgpt(); a stream that fails midway is not retried.
+
+    Yields:
+        str: The response text, chunk by chunk, as it is generated
+    """
+    backend = get_backend()
+    model = model or backend.default_model
+    messages = _prompt_messages(prompt, system)
+    # The span is not made current: the generator is suspended at every chunk and the caller's spans must not
+    # nest in it
+    trace_span = span("llm", request="chatgpt_stream", backend=backend.name, model=model, cache_hit=True)
+    cache = get_cache()
+    if cache is not None:
+        key = make_cache_key(_cache_model(backend, model), messages, max_tokens=max_tokens)
+        cached_response = cache.get(key)
+        if cached_response is not None:
+            trace_span.end()
+            yield cached_response
+            return
+
+    trace_span.set(cache_hit=False)
+    try:
+        stream = get_rate_limiter().call(
+            model,
+            messages,
+            lambda: backend.stream(model, messages, max_tokens),
+            max_tokens=max_tokens,
+            throttle=backend.rate_limited,
+            trace_span=trace_span,
+        )
+        chunks = []
+        for chunk in stream:
+            trace_span.mark_first_token()
+            chunks.append(chunk)
+            yield chunk
+    except GeneratorExit:
+        # The caller stopped reading the stream
+        trace_span.end()
+        raise
+    except BaseException as e:
+        trace_span.end(e)
+        raise
+    get_rate_limiter().for_model(model).settle(estimate_tokens(model, messages, max_tokens), stream)
+    _record_completion(trace_span, stream)
+    trace_span.end()
+
+    # Like chatgpt(), a response cut off at max_tokens is not cached
+    if cache is not None and stream.finish_reason != "length":
+        cache.set(key, "".join(chunks))
+
+
+def chatgpt_json_stream(instructions: str, content: str, response_format: "BaseModel", model: str = None):
+    """Function for streaming a structured output, e.g. to use the first items of a long list before the rest.
+
+    Args:
+        instructions (str): Instructions for the LLM (how the LLM should process the input content).
+        content (str): Information that the LLM is supposed to process.
+        response_format (BaseModel): The output format defined by a Pydantic Basemodel.
+        model (str, optional): Model to use. Defaults to the backend's structured model ("gpt-4o-2024-08-06").
+
+    The response shares its cache entry with chatgpt_json(): a cached response is yielded as a single chunk, and a
+    fully streamed response is validated and stored in the cache, unless it was cut off. Opening the stream is rate
+    limited and retried like chatgpt_json(); a stream that fails midway is not retried.
+
+    Yields:
+        str: The JSON text of the response, chunk by chunk, as it is generated
+    """
+    backend = get_backend()
+    model = model or backend.structured_model
+    messages = [
+        {"role": "system", "content": instructions},
+        {"role": "user", "content": content},
+    ]
+    # The span is not made current: the generator is suspended at every chunk and the caller's spans must not
+    # nest in it
+    trace_span = span("llm", request="chatgpt_json_stream", backend=backend.name, model=model, cache_hit=True)
+    cache = get_cache()
+    if cache is not None:
+        key = make_cache_key(_cache_model(backend, model), messages, response_format=response_format)
+        cached_response = cache.get(key)
+        if cached_response is not None:
+            trace_span.end()
+            yield json.dumps(cached_response)
+            return
+
+    trace_span.set(cache_hit=False)
+    try:
+        stream = get_rate_limiter().call(
+            model,
+            messages,
+            lambda: backend.stream(model, messages, response_format=response_format),
+            throttle=backend.rate_limited,
+            trace_span=trace_span,
+        )
+        chunks = []
+        for chunk in stream:
+            trace_span.mark_first_token()
+            chunks.append(chunk)
+            yield chunk
+    except GeneratorExit:
+        # The caller stopped reading the stream
+        trace_span.end()
+        raise
+    except BaseException as e:
+        trace_span.end(e)
+        raise
+    get_rate_limiter().for_model(model).settle(estimate_tokens(model, messages), stream)
+    _record_completion(trace_span, stream)
+    trace_span.end()
+
+    # Like chatgpt(), a response cut off at max_tokens is not cached
+    if cache is not None and stream.finish_reason != "length":
+        cache.set(key, response_format.model_validate_json("".join(chunks)).model_dump())
+
+
+async def chatgpt_json_async(
+    instructions: str, content: str, response_format: "BaseModel", model: str = None, use_cache: bool = True
+) -> dict:
+    """Async version of chatgpt_json(), which does not block the event loop.
+
+    Args:
+        instructions (str): Instructions for the LLM (how the LLM should process the input content).
+        content (str): Information that the LLM is supposed to process.
+        response_format (BaseModel): The output format defined by a Pydantic Basemodel.
+        model (str, optional): Model to use. Defaults to the backend's structured model ("gpt-4o-2024-08-06").
+        use_cache (bool, optional): Whether the response cache may answer the request, like in chatgpt_json().
+            Defaults to True.
+
+    Returns:
+        dict: The structured output response from the LLM.
+    """
+    backend = get_backend()
+    model = model or backend.structured_model
+    messages = [
+        {"role": "system", "content": instructions},
+        {"role": "user", "content": content},
+    ]
+
+    with span("llm", request="chatgpt_json", backend=backend.name, model=model, cache_hit=True) as trace_span:
+
+        async def request():
+            trace_span.set(cache_hit=False)
+            completion = await get_rate_limiter().call_async(
+                model,
+                messages,
+                lambda: backend.parse_async(model, messages, response_format),
+                throttle=backend.rate_limited,
+            )
+            _record_completion(trace_span, completion)
+            return completion.parsed
+
+        if not use_cache:
+            return await request()
+        return await cached_completion_async(
+            _cache_model(backend, model), messages, request, response_format=response_format
+        )
+
+
+async def chatgpt_async(
+    prompt: str,
+    model=None,
+    max_tokens=None,
+    system: str = None,
+    max_continuations: int = 0,
+    with_finish_reason: bool = False,
+):
+    """Async version of chatgpt(), which does not block the event loop.
+
+    Args:
+        prompt (str): The instructions for ChatGPT to respond to
+        model (str, optional): ChatGPT model to use. Defaults to the backend's default model ("gpt-4o").
+        max_tokens (int, optional): Optional, the max tokens to be returned by response. Defaults to no limit (i.e. None).
+        system (str, optional): A system message sent before the prompt. Put the content shared by many requests
+            here, so the provider can serve it from its prompt cache. Defaults to None.
+        max_continuations (int, optional): How many times a response cut off at `max_tokens` is continued by
+            another request, each with the same limit. Defaults to 0.
+        with_finish_reason (bool, optional): Whether to also return why the response ended. Defaults to False.
 
     Returns:
-        str: Returns the response to the prompt as a string value
-    """
-    completion = client.chat.completions.create(
-        model=model,
-        max_tokens=max_tokens,
-        messages=[{"role": "user", "content": prompt}],
-    )
-    response = completion.choices[0].message.content
-    return response
+        str: Returns the response to the prompt as a string value, or a tuple with the finish reason like chatgpt()
+    """
+    backend = get_backend()
+    model = model or backend.default_model
+    messages = _prompt_messages(prompt, system)
+
+    with span("llm", request="chatgpt", backend=backend.name, model=model, cache_hit=True) as trace_span:
+
+        async def request():
+            trace_span.set(cache_hit=False)
+            text = ""
+            request_messages = messages
+            for continuation in range(max_continuations + 1):
+                admit = _hedge_admission(backend, model, request_messages, max_tokens)
+                completion = await get_rate_limiter().call_async(
+                    model,
+                    request_messages,
+                    lambda: get_hedger().call_async(
+                        model,
+                        lambda: backend.complete_async(model, request_messages, max_tokens),
+                        admit=admit,
+                        max_tokens=max_tokens,
+                    ),
+                    max_tokens=max_tokens,
+                    throttle=backend.rate_limited,
+                )
+                _record_completion(trace_span, completion)
+                text += completion.text
+                if completion.finish_reason != "length":
+                    return text
+                if continuation == max_continuations:
+                    trace_span.set(truncated=True)
+                    raise _TruncatedResponse(text)
+                trace_span.add("continuations")
+                request_messages = _continuation_messages(messages, text)
+
+        try:
+            text = await cached_completion_async(
+                _cache_model(backend, model), messages, request, None, max_tokens, max_continuations
+            )
+            finish_reason = "stop"
+        except _TruncatedResponse as truncated:
+            text, finish_reason = truncated.text, "length"
+        return (text, finish_reason) if with_finish_reason else text
+
+
+async def chatgpt_json_stream_async(
+    instructions: str, content: str, response_format: "BaseModel", model: str = None
+):
+    """Async version of chatgpt_json_stream(), for use with `async for`.
+
+    Args:
+        instructions (str): Instructions for the LLM (how the LLM should process the input content).
+        content (str): Information that the LLM is supposed to process.
+        response_format (BaseModel): The output format defined by a Pydantic Basemodel.
+        model (str, optional): Model to use. Defaults to the backend's structured model ("gpt-4o-2024-08-06").
+
+    Yields:
+        str: The JSON text of the response, chunk by chunk, as it is generated
+    """
+    import asyncio
+
+    backend = get_backend()
+    model = model or backend.structured_model
+    messages = [
+        {"role": "system", "content": instructions},
+        {"role": "user", "content": content},
+    ]
+    trace_span = span("llm", request="chatgpt_json_stream", backend=backend.name, model=model, cache_hit=True)
+    cache = get_cache()
+    if cache is not None:
+        key = make_cache_key(_cache_model(backend, model), messages, response_format=response_format)
+        cached_response = await asyncio.to_thread(cache.get, key)
+        if cached_response is not None:
+            trace_span.end()
+            yield json.dumps(cached_response)
+            return
+
+    trace_span.set(cache_hit=False)
+    try:
+        stream = await get_rate_limiter().call_async(
+            model,
+            messages,
+            lambda: backend.stream_async(model, messages, response_format=response_format),
+            throttle=backend.rate_limited,
+            trace_span=trace_span,
+        )
+        chunks = []
+        async for chunk in stream:
+            trace_span.mark_first_token()
+            chunks.append(chunk)
+            yield chunk
+    except GeneratorExit:
+        # The caller stopped reading the stream
+        trace_span.end()
+        raise
+    except BaseException as e:
+        trace_span.end(e)
+        raise
+    get_rate_limiter().for_model(model).settle(estimate_tokens(model, messages), stream)
+    _record_completion(trace_span, stream)
+    trace_span.end()
+
+    # Like chatgpt(), a response cut off at max_tokens is not cached
+    if cache is not None and stream.finish_reason != "length":
+        await asyncio.to_thread(cache.set, key, response_format.model_validate_json("".join(chunks)).model_dump())
+
+
+async def chatgpt_stream_async(prompt: str, model=None, max_tokens=None, system: str = None):
+    """Async version of chatgpt_stream(), for use with `async for`.
+
+    Args:
+        prompt (str): The instructions for ChatGPT to respond to
+        model (str, optional): ChatGPT model to use. Defaults to the backend's default model ("gpt-4o").
+        max_tokens (int, optional): Optional, the max tokens to be returned by response. Defaults to no limit (i.e. None).
+        system (str, optional): A system message sent before the prompt. Put the content shared by many requests
+            here, so the provider can serve it from its prompt cache. Defaults to None.
+
+    Yields:
+        str: The response text, chunk by chunk, as it is generated
+    """
+    import asyncio
+
+    backend = get_backend()
+    model = model or backend.default_model
+    messages = _prompt_messages(prompt, system)
+    # The span is not made current: the generator is suspended at every chunk and the caller's spans must not
+    # nest in it
+    trace_span = span("llm", request="chatgpt_stream", backend=backend.name, model=model, cache_hit=True)
+    cache = get_cache()
+    if cache is not None:
+        key = make_cache_key(_cache_model(backend, model), messages, max_tokens=max_tokens)
+        cached_response = await asyncio.to_thread(cache.get, key)
+        if cached_response is not None:
+            trace_span.end()
+            yield cached_response
+            return
+
+    trace_span.set(cache_hit=False)
+    try:
+        stream = await get_rate_limiter().call_async(
+            model,
+            messages,
+            lambda: backend.stream_async(model, messages, max_tokens),
+            max_tokens=max_tokens,
+            throttle=backend.rate_limited,
+            trace_span=trace_span,
+        )
+        chunks = []
+        async for chunk in stream:
+            trace_span.mark_first_token()
+            chunks.append(chunk)
+            yield chunk
+    except GeneratorExit:
+        # The caller stopped reading the stream
+        trace_span.end()
+        raise
+    except BaseException as e:
+        trace_span.end(e)
+        raise
+    get_rate_limiter().for_model(model).settle(estimate_tokens(model, messages, max_tokens), stream)
+    _record_completion(trace_span, stream)
+    trace_span.end()
+
+    # Like chatgpt(), a response cut off at max_tokens is not cached
+    if cache is not None and stream.finish_reason != "length":
+        await asyncio.to_thread(cache.set, key, "".join(chunks))
@@ -0,0 +1,539 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+import typing
+
+from .backends import Backend, Completion, CompletionStream, Usage
+from ..utils.tokens import count_tokens
+
+# Layers of the synthetic projects returned for project structure requests
+LAYERS = ["models", "repositories", "services", "routes", "utils"]
+NON_CODE_FILES = [
+    ("requirements.txt", "Python dependencies of the project."),
+    (".gitignore", "Files and directories ignored by git."),
+    ("config/settings.yaml", "Application settings for development and production."),
+    ("templates/base.html", "Base HTML template shared by all pages."),
+    ("static/css/style.css", "Stylesheet of the web interface."),
+]
+# How much faster than the default model a model answers, in both latency and generation speed
+DEFAULT_SPEEDUPS = {"gpt-4o-mini": 2.0}
+# Prompt caching like OpenAI's: the longest previously seen prompt prefix of at least 1024 tokens is cached, in
+# blocks of about 128 tokens, and cached tokens are processed faster
+PROMPT_CACHE_BLOCK_CHARS = 512
+PROMPT_CACHE_MIN_TOKENS = 1024
+CACHED_LATENCY_SAVING = 0.5  # Share of the time to first token saved on a fully cached prompt
+# Requests whose attempts are counted, so a retried request gets a new draw; the oldest are forgotten
+MAX_TRACKED_REQUESTS = 10_000
+
+# The parts of the prompts that the built-in responders read their data from
+_FUNCTION_SPEC = re.compile(r"^- (\w+): ", re.MULTILINE)
+_ORIGINAL_CODE = re.compile(r"# Original Code[^\n]*:\n```\n(.*?)\n```", re.DOTALL)
+_PACKAGE_TO_DETAIL = re.compile(r"# Package to Detail\n(.+)")
+_OUTLINE_PACKAGE = re.compile(r"^## (.+?): ", re.MULTILINE)
+_OUTLINE_FILE = re.compile(r"^- (\S+): (.*)$", re.MULTILINE)
+
+
+def synthetic_blueprint(num_files: int, functions_per_file: int = 4, seed: int = 0) -> dict:
+    """
+    Builds a blueprint with roughly `num_files` files, like what `generate_project_structure` returns for a layered
+    web application: packages of modules whose descriptions reference the modules they use, plus `__init__.py`
+    files and non-code files.
+
+    Args:
+        num_files (int): Number of files (directories are added on top).
+        functions_per_file (int, optional): Functions of each code module. Defaults to 4.
+        seed (int, optional): Seed of the random generator, so blueprints are reproducible. Defaults to 0.
+
+    Returns:
+        dict: A blueprint in the `ProjectStructureResponse` format.
+    """
+    rng = random.Random(seed)
+    files = [{"path": "app/", "description": "Main application package.", "functions": None}]
+    files += [{"path": f"app/{layer}/", "description": f"The {layer} layer.", "functions": None} for layer in LAYERS]
+    files += [
+        {"path": f"app/{layer}/__init__.py", "description": f"Marks {layer} as a package.", "functions": []}
+        for layer in LAYERS
+    ]
+    for path, description in NON_CODE_FILES:
+        files.append({"path": path, "description": description, "functions": []})
+
+    modules = []
+    index = 0
+    while len(files) < num_files:
+        layer = LAYERS[index % len(LAYERS)]
+        name = f"{layer[:-1] if layer.endswith('s') else layer}_{index // len(LAYERS)}"
+        module = f"app.{layer}.{name}"
+
+        # Modules use a few modules of the lower layers
+        layer_index = LAYERS.index(layer)
+        candidates = [other for other in modules if LAYERS.index(other.split(".")[1]) < layer_index]
+        uses = rng.sample(candidates, min(len(candidates), rng.randint(1, 3))) if candidates else []
+        description = f"Implements the {name.replace('_', ' ')} {layer} logic."
+        if uses:
+            description += " Uses " + ", ".join(uses) + "."
+
+        functions = []
+        for f in range(functions_per_file):
+            functions.append(
+                {
+                    "function_name": f"{name}_operation_{f}",
+                    "description": f"Performs operation {f} of {name}, validating its input and handling errors.",
+                    "inputs": ["payload: dict", "session: Session"],
+                    "outputs": ["result: dict"],
+                }
+            )
+        files.append({"path": module.replace(".", "/") + ".py", "description": description, "functions": functions})
+        modules.append(module)
+        index += 1
+
+    files.append(
+        {
+            "path": "app/main.py",
+            "description": "Entry point that creates the application and registers the routes.",
+            "functions": [
+                {
+                    "function_name": "create_app",
+                    "description": "Creates and configures the application.",
+                    "inputs": [],
+                    "outputs": ["app: Flask"],
+                }
+            ],
+        }
+    )
+    return {"files": files}
+
+
+def synthetic_outline(num_files: int, seed: int = 0) -> dict:
+    """
+    Returns the outline of the synthetic blueprint of `num_files` files (see synthetic_blueprint), in the
+    `ProjectOutline` format: its files grouped by directory, without functions.
+    """
+    descriptions = {}
+    packages = {}
+    for project_file in synthetic_blueprint(num_files, seed=seed)["files"]:
+        if project_file["path"].endswith("/"):
+            descriptions[project_file["path"]] = project_file["description"]
+            continue
+        directory = project_file["path"].rpartition("/")[0]
+        path = f"{directory}/" if directory else ""
+        packages.setdefault(path, []).append({"path": project_file["path"], "purpose": project_file["description"]})
+    return {
+        "packages": [
+            {"path": path, "description": descriptions.get(path, "Files of the project."), "files": files}
+            for path, files in packages.items()
+        ]
+    }
+
+
+def synthetic_package(package: dict, functions_per_file: int = 4) -> dict:
+    """
+    Details a package of an outline (see synthetic_outline), like a package request of the hierarchical planner:
+    the files the outline lists in it, with functions for the Python modules.
+
+    Args:
+        package (dict): The package, with the `path` and `purpose` of its `files`.
+        functions_per_file (int, optional): Functions of each Python module. Defaults to 4.
+    """
+    files = []
+    for planned in package["files"]:
+        name, extension = os.path.splitext(os.path.basename(planned["path"]))
+        functions = []
+        if extension == ".py" and name != "__init__":
+            functions = [
+                {
+                    "function_name": f"{name}_operation_{f}",
+                    "description": f"Performs operation {f} of {name}, validating its input and handling errors.",
+                    "inputs": ["payload: dict", "session: Session"],
+                    "outputs": ["result: dict"],
+                }
+                for f in range(functions_per_file)
+            ]
+        files.append({"path": planned["path"], "description": planned["purpose"], "functions": functions})
+    return {"files": files}
+
+
+class FakeAPIError(Exception):
+    """A simulated API failure, shaped like openai.APIStatusError so it is retried like a real one."""
+
+    class _Response:
+        def __init__(self, headers: dict):
+            self.headers = headers
+
+    def __init__(self, status_code: int, retry_after: float = None):
+        super().__init__(f"Error code: {status_code} (simulated by FakeBackend)")
+        self.status_code = status_code
+        headers = {} if retry_after is None else {"retry-after-ms": str(int(retry_after * 1000))}
+        self.response = self._Response(headers)
+
+
+def _fake_code(names: list, target_tokens: int, rng: random.Random) -> str:
+    """Python code that defines the functions `names`, padded to `target_tokens`."""
+    lines = ["import os", "import json", ""]
+    for name in names:
+        lines += ["", f"def {name}(*args, **kwargs):", f'    """Generated {name}."""', "    return None"]
+
+    tokens = count_tokens("\n".join(lines))
+    helper = 0
+    while tokens < target_tokens:
+        function = f"\ndef _helper_{helper}(value):\n    return value + {rng.randint(0, 1000)}\n"
+        lines.append(function)
+        tokens += count_tokens(function)
+        helper += 1
+    return "\n".join(lines) + "\n"
+
+
+def _fake_text(target_tokens: int, rng: random.Random) -> str:
+    """A Markdown answer with a code block, about `target_tokens` long."""
+    words = "monkey banana script module function value error fix code project file tree".split()
+    # Common English words are about one token each
+    paragraph = [rng.choice(words) for _ in range(max(1, target_tokens - 20))]
+    return " ".join(paragraph) + ".\n\n```python\nprint('ScriptMonkey')\n```\n"
+
+
+def _fake_value(annotation, field_name: str, rng: random.Random):
+    """A value of a type annotation, for the fields of structured outputs without a dedicated generator."""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin is typing.Union:
+        return _fake_value(next(arg for arg in args if arg is not type(None)), field_name, rng)
+    if origin in (list, typing.List):
+        return [_fake_value(args[0] if args else str, field_name, rng) for _ in range(rng.randint(1, 3))]
+    if hasattr(annotation, "model_fields"):
+        return fake_model(annotation, rng)
+    if annotation is bool:
+        return rng.random() < 0.5
+    if annotation is int:
+        return rng.randint(0, 100)
+    if annotation is float:
+        return rng.random()
+    return f"Fake {field_name.replace('_', ' ')} {rng.randint(0, 999)}"
+
+
+def fake_model(response_format, rng: random.Random) -> dict:
+    """Returns a dictionary of made-up values that validates against a Pydantic model."""
+    return {
+        field_name: _fake_value(field.annotation, field_name, rng)
+        for field_name, field in response_format.model_fields.items()
+    }
+
+
+def request_kind(messages: list, response_format=None):
+    """
+    Tells what a request of ScriptMonkey is for, from its response format and its instructions: "blueprint",
+    "outline", "package", "fix", "readme", "code", or None for any other request, such as a question.
+    """
+    from ..agents import BUILD_SYSTEM_PROMPT, README_INSTRUCTIONS
+    from ..planner import PACKAGE_INSTRUCTIONS
+
+    system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+    if response_format is not None:
+        name = response_format.__name__
+        if name == "ProjectStructureResponse":
+            return "package" if system == PACKAGE_INSTRUCTIONS else "blueprint"
+        if name == "ProjectOutline":
+            return "outline"
+        if name in ("ScriptMonkeyResponse", "ScriptMonkeyWindowResponse", "ScriptMonkeyPatchResponse"):
+            return "fix"
+        return None
+    if system.startswith(BUILD_SYSTEM_PROMPT):
+        return "readme" if messages[-1]["content"].startswith(README_INSTRUCTIONS) else "code"
+    return None
+
+
+def _fake_fix(messages: list, response_format, rng: random.Random, target_tokens: int) -> dict:
+    """A fix that leaves the code unchanged: the code itself, or an edit that replaces its first line by itself."""
+    match = _ORIGINAL_CODE.search(messages[-1]["content"])
+    code = match.group(1) if match else ""
+    lines = [line for line in code.splitlines() if line.strip()]
+    fix = {
+        "problem": "Simulated problem found by the fake backend.",
+        "solution": "Simulated solution: the code is left unchanged.",
+        "corrected_code": code,
+        "edits": [{"search": lines[0], "replace": lines[0]}] if lines else [],
+        "new_imports": [],
+    }
+    return {name: value for name, value in fix.items() if name in response_format.model_fields}
+
+
+class FakeBackend(Backend):
+    """
+    An in-process backend that simulates the OpenAI API without any network access, to load-test and benchmark the
+    build pipeline for free.
+
+    Responses are deterministic for a given seed and request. Each request waits for a time to first token drawn
+    from a log-normal distribution, then for its completion tokens at `tokens_per_second`, so concurrency and
+    scheduling behave like against the real API. A fraction `error_rate` of the requests fail with a 429, 500 or
+    503 error. Structured outputs are valid instances of the requested Pydantic model. Prompt prefixes that were
+    sent before are reported as cached tokens and shorten the time to first token, like OpenAI's prompt caching.
+
+    Responses depend on what a request is for, which is told from its response format and instructions (see
+    request_kind). Each kind has a responder, called as `responder(messages, response_format, rng, target_tokens)`;
+    it returns the structured output as a dict (`target_tokens` is then None), or the text of about `target_tokens`
+    tokens when `response_format` is None. Blueprints and outlines are synthetic but realistic projects, code
+    defines the functions its prompt asks for and fixes leave the code unchanged, so they can be fed through the
+    rest of the pipeline. Other requests get text, or made-up values of the requested model.
+
+    Args:
+        latency (float, optional): Median seconds to the first token. Defaults to 0.5.
+        latency_sigma (float, optional): Sigma of the log-normal latency; 0 makes it constant. Defaults to 0.5.
+        tokens_per_second (float, optional): Generation speed; None for instant generation. Defaults to 80.
+        completion_tokens (int, optional): Median length of text completions. Defaults to 400.
+        error_rate (float, optional): Fraction of requests that fail. Defaults to 0.
+        retry_after (float, optional): Retry-After sent with simulated 429 errors. Defaults to 0.5.
+        seed (int, optional): Seed of the simulation. Defaults to 0.
+        project_files (int, optional): Files of the generated project structures. Defaults to 30.
+        rate_limited (bool, optional): Whether to apply the client-side rate limits. Defaults to False.
+        speedups (dict, optional): Model -> how many times faster it is than the default model. Defaults to
+            {"gpt-4o-mini": 2.0}.
+        straggler_rate (float, optional): Fraction of requests that are stragglers, as when the provider puts a
+            request on an overloaded server. Defaults to 0.
+        straggler_factor (float, optional): How many times slower a straggler is. Defaults to 5.
+        responders (dict, optional): Kind of request -> responder, replacing or adding to the built-in ones.
+            Defaults to None.
+
+    Usage:
+        set_backend(FakeBackend(latency=0.2, tokens_per_second=100, error_rate=0.05))
+    """
+
+    name = "fake"
+    cache_namespace = "fake"
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        latency_sigma: float = 0.5,
+        tokens_per_second: float = 80,
+        completion_tokens: int = 400,
+        error_rate: float = 0.0,
+        retry_after: float = 0.5,
+        seed: int = 0,
+        project_files: int = 30,
+        rate_limited: bool = False,
+        speedups: dict = None,
+        straggler_rate: float = 0.0,
+        straggler_factor: float = 5.0,
+        responders: dict = None,
+    ):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.project_files = project_files
+        self.rate_limited = rate_limited
+        self.speedups = DEFAULT_SPEEDUPS if speedups is None else speedups
+        self.straggler_rate = straggler_rate
+        self.straggler_factor = straggler_factor
+        self.cache_namespace = f"fake-{seed}"
+        self.responders = {
+            "blueprint": self._blueprint,
+            "outline": self._outline,
+            "package": self._package,
+            "code": self._code,
+            "fix": _fake_fix,
+        }
+        self.responders.update(responders or {})
+        self._attempts = {}
+        self._prompt_prefixes = set()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Resets the request, error, token and simulated time counters (the simulated prompt cache is kept)."""
+        with self._lock:
+            self.stats = {
+                "requests": 0,
+                "errors": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cached_tokens": 0,
+                "simulated_seconds": 0.0,
+            }
+
+    def _plan(self, model: str, messages: list, max_tokens=None, response_format=None):
+        """Decides the outcome of a request: (delays, error, completion)."""
+        payload = json.dumps([self.seed, model, messages, max_tokens], sort_keys=True)
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        with self._lock:
+            # Every attempt of a request gets its own latency and error draw, so a failed request can succeed when
+            # retried, while the content only depends on the request
+            attempt = self._attempts[key] = self._attempts.pop(key, -1) + 1
+            if len(self._attempts) > MAX_TRACKED_REQUESTS:
+                del self._attempts[next(iter(self._attempts))]
+        rng = random.Random(f"{key}:{attempt}")
+        content_rng = random.Random(key)
+
+        speedup = self.speedups.get(model, 1.0)
+        first_token = self.latency * rng.lognormvariate(0, self.latency_sigma) if self.latency_sigma else self.latency
+        first_token /= speedup
+        prompt = "\n".join(message["content"] for message in messages)
+        prompt_tokens = count_tokens(prompt, model)
+
+        if rng.random() < self.error_rate:
+            status_code = rng.choice((429, 500, 503))
+            error = FakeAPIError(status_code, self.retry_after if status_code == 429 else None)
+            self._record(prompt_tokens=0, completion_tokens=0, seconds=first_token, error=True)
+            return [first_token], error, None
+
+        cached_tokens = self._cached_tokens(model, prompt)
+        first_token *= 1 - CACHED_LATENCY_SAVING * cached_tokens / max(1, prompt_tokens)
+        finish_reason = "stop"
+        responder = self.responders.get(request_kind(messages, response_format))
+        if response_format is not None:
+            parsed = responder(messages, response_format, content_rng, None) if responder else None
+            parsed = fake_model(response_format, content_rng) if parsed is None else parsed
+            text = json.dumps(parsed)
+        else:
+            parsed = None
+            target = max(1, int(self.completion_tokens * content_rng.lognormvariate(0, 0.5)))
+            if max_tokens is not None and target > max_tokens:
+                target, finish_reason = max_tokens, "length"
+            text = responder(messages, None, content_rng, target) if responder else _fake_text(target, content_rng)
+        completion_tokens = count_tokens(text, model)
+
+        generation = completion_tokens / (self.tokens_per_second * speedup) if self.tokens_per_second else 0.0
+        if self.straggler_rate and rng.random() < self.straggler_rate:
+            first_token *= self.straggler_factor
+            generation *= self.straggler_factor
+        self._record(prompt_tokens, completion_tokens, first_token + generation, cached_tokens=cached_tokens)
+        usage = Usage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=cached_tokens)
+        return [first_token, generation], None, Completion(text, parsed, usage, finish_reason)
+
+    def _blueprint(self, messages: list, response_format, rng: random.Random, target_tokens: int) -> dict:
+        return synthetic_blueprint(self.project_files, seed=rng.randint(0, 2**31))
+
+    def _outline(self, messages: list, response_format, rng: random.Random, target_tokens: int) -> dict:
+        return synthetic_outline(self.project_files, seed=rng.randint(0, 2**31))
+
+    def _package(self, messages: list, response_format, rng: random.Random, target_tokens: int) -> dict:
+        # The package to detail comes last, after the outline with the files of every package
+        content = messages[-1]["content"]
+        label = _PACKAGE_TO_DETAIL.search(content).group(1).strip()
+        outline = content.split("# Package to Detail", 1)[0]
+        sections = _OUTLINE_PACKAGE.split(outline)[1:]
+        files = []
+        for section_label, section in zip(sections[::2], sections[1::2]):
+            if section_label == label:
+                files = [{"path": path, "purpose": purpose} for path, purpose in _OUTLINE_FILE.findall(section)]
+        return synthetic_package({"path": label, "files": files})
+
+    def _code(self, messages: list, response_format, rng: random.Random, target_tokens: int) -> str:
+        _, _, functions = messages[-1]["content"].partition("\n\nFunctions:\n")
+        return _fake_code(_FUNCTION_SPEC.findall(functions), target_tokens, rng)
+
+    def _cached_tokens(self, model: str, prompt: str) -> int:
+        """Returns how many tokens of a prompt's prefix were sent before, and remembers its prefixes."""
+        digest = hashlib.sha256(model.encode("utf-8"))
+        prefixes = []
+        for start in range(0, len(prompt) - PROMPT_CACHE_BLOCK_CHARS + 1, PROMPT_CACHE_BLOCK_CHARS):
+            digest.update(prompt[start : start + PROMPT_CACHE_BLOCK_CHARS].encode("utf-8"))
+            prefixes.append(digest.hexdigest())
+        with self._lock:
+            blocks = 0
+            while blocks < len(prefixes) and prefixes[blocks] in self._prompt_prefixes:
+                blocks += 1
+            self._prompt_prefixes.update(prefixes)
+        if not blocks:
+            return 0
+        cached_tokens = count_tokens(prompt[: blocks * PROMPT_CACHE_BLOCK_CHARS], model)
+        return cached_tokens if cached_tokens >= PROMPT_CACHE_MIN_TOKENS else 0
+
+    def _record(
+        self, prompt_tokens: int, completion_tokens: int, seconds: float, error: bool = False, cached_tokens: int = 0
+    ) -> None:
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["errors"] += int(error)
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+            self.stats["cached_tokens"] += cached_tokens
+            self.stats["simulated_seconds"] += seconds
+
+    def complete(self, model, messages, max_tokens=None):
+        delays, error, completion = self._plan(model, messages, max_tokens)
+        time.sleep(sum(delays))
+        if error is not None:
+            raise error
+        return completion
+
+    def parse(self, model, messages, response_format):
+        delays, error, completion = self._plan(model, messages, response_format=response_format)
+        time.sleep(sum(delays))
+        if error is not None:
+            raise error
+        return completion
+
+    @staticmethod
+    def _stream_pieces(completion: Completion, response_format) -> int:
+        # Long structured outputs arrive in many small chunks, like from the real API, so they can be parsed
+        # incrementally
+        if response_format is None:
+            return 20
+        return max(20, completion.usage.completion_tokens // 10)
+
+    @staticmethod
+    def _split(text: str, pieces: int) -> list:
+        size = max(1, -(-len(text) // pieces))
+        return [text[i : i + size] for i in range(0, len(text), size)]
+
+    def stream(self, model, messages, max_tokens=None, response_format=None):
+        delays, error, completion = self._plan(model, messages, max_tokens, response_format)
+        time.sleep(delays[0])
+        if error is not None:
+            raise error
+
+        chunks = self._split(completion.text, self._stream_pieces(completion, response_format))
+
+        def generate():
+            for chunk in chunks:
+                time.sleep(delays[1] / len(chunks))
+                yield chunk
+            stream.usage = completion.usage
+            stream.finish_reason = completion.finish_reason
+
+        stream = CompletionStream(generate())
+        return stream
+
+    async def complete_async(self, model, messages, max_tokens=None):
+        import asyncio
+
+        delays, error, completion = self._plan(model, messages, max_tokens)
+        await asyncio.sleep(sum(delays))
+        if error is not None:
+            raise error
+        return completion
+
+    async def parse_async(self, model, messages, response_format):
+        import asyncio
+
+        delays, error, completion = self._plan(model, messages, response_format=response_format)
+        await asyncio.sleep(sum(delays))
+        if error is not None:
+            raise error
+        return completion
+
+    async def stream_async(self, model, messages, max_tokens=None, response_format=None):
+        import asyncio
+
+        delays, error, completion = self._plan(model, messages, max_tokens, response_format)
+        await asyncio.sleep(delays[0])
+        if error is not None:
+            raise error
+
+        chunks = self._split(completion.text, self._stream_pieces(completion, response_format))
+
+        async def generate():
+            for chunk in chunks:
+                await asyncio.sleep(delays[1] / len(chunks))
+                yield chunk
+            stream.usage = completion.usage
+            stream.finish_reason = completion.finish_reason
+
+        stream = CompletionStream(generate())
+        return stream
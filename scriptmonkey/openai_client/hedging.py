@@ -0,0 +1,220 @@
+import os
+import time
+import queue
+import threading
+import contextvars
+from collections import deque
+
+from ..telemetry import current_span
+
+# Hedging is opt-in, since every hedged request is paid for twice: turn it on with configure_hedging() or
+# SCRIPTMONKEY_HEDGE=on. A request still running after this percentile of its model's recent latencies (per token of
+# max_tokens) is then sent a second time; SCRIPTMONKEY_HEDGE_PERCENTILE=90 changes the percentile.
+DEFAULT_HEDGE_PERCENTILE = 95
+MIN_SAMPLES = 10  # Latencies of a model needed before its requests are hedged
+MAX_SAMPLES = 500  # Only the most recent latencies count, so the delay follows the provider's current speed
+
+
+class HedgeCancelled(Exception):
+    """Raised by a request that stopped because the other copy of a hedged request finished first."""
+
+
+class Hedger:
+    """
+    Hedges requests against stragglers: a request that takes longer than a high percentile of its model's recent
+    latencies is sent again, and whichever copy finishes first is used.
+
+    The time a request takes grows with the length of its output, so latencies are compared per token of the
+    request's `max_tokens`: a file with a large output cap gets a proportionally longer delay, rather than being
+    hedged every time because it is long. Requests without `max_tokens` are never hedged. At the 95th percentile
+    about one request in twenty is sent twice. Latencies are kept per model for the successful requests of this
+    process, and a model is only hedged once it has MIN_SAMPLES of them.
+
+    The second copy counts against the rate limits like any request, and is not sent when they have no room for it
+    right away. The copy that loses is cancelled: a coroutine is cancelled, and a synchronous request is passed a
+    `threading.Event` that is set when the other copy wins, so it can stop reading its response (see call()).
+
+    Usage:
+        hedger = get_hedger()
+        completion = hedger.call("gpt-4o", lambda cancelled: backend.complete(model, messages), max_tokens=1200)
+
+    Args:
+        percentile (float, optional): Latency percentile after which a request is hedged, or None to turn hedging
+            off. Defaults to None.
+    """
+
+    def __init__(self, percentile: float = None):
+        self.percentile = percentile
+        # Requests sent twice, how often the second copy finished first, and the copies the rate limits held back
+        self.stats = {"hedged": 0, "won": 0, "throttled": 0}
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float, max_tokens: int) -> None:
+        """Records the latency of a successful request with an output cap of `max_tokens`."""
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=MAX_SAMPLES)).append(seconds / max_tokens)
+
+    def delay(self, model: str, max_tokens: int = None):
+        """Returns the seconds after which a request to a model is hedged, or None if it is not hedged."""
+        if self.percentile is None or not max_tokens:
+            return None
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * self.percentile / 100))] * max_tokens
+
+    def _timed(self, model: str, request, cancelled, max_tokens):
+        started = time.perf_counter()
+        result = request(cancelled)
+        if max_tokens and self.percentile is not None:
+            self.record(model, time.perf_counter() - started, max_tokens)
+        return result
+
+    async def _timed_async(self, model: str, request, max_tokens):
+        started = time.perf_counter()
+        result = await request()
+        if max_tokens and self.percentile is not None:
+            self.record(model, time.perf_counter() - started, max_tokens)
+        return result
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+        if stat == "hedged":
+            current_span().set(hedged=True)
+
+    def call(self, model: str, request, admit=None, max_tokens: int = None):
+        """
+        Sends a request, and a second copy if it is slower than the hedge delay of its model.
+
+        The copies run in threads only when the request may be hedged; otherwise it runs in the calling thread.
+
+        Args:
+            model (str): The model the request is sent to.
+            request (callable): Sends the request and returns the completion. Called as `request(cancelled)`:
+                `cancelled` is None when the request is not hedged, otherwise a `threading.Event` that is set once
+                the other copy has won. The request should then stop, e.g. close its response stream, and raise
+                HedgeCancelled.
+            admit (callable, optional): Called before the second copy is sent; it is only sent if this returns
+                True, e.g. when the rate limits have room for it (see RateLimiter.try_reserve). Defaults to None.
+            max_tokens (int, optional): The output cap of the request, which scales its hedge delay. Requests
+                without one are not hedged. Defaults to None.
+
+        Returns:
+            The completion of the copy that finished first. If it failed, the other copy's.
+        """
+        delay = self.delay(model, max_tokens)
+        if delay is None:
+            return self._timed(model, request, None, max_tokens)
+
+        outcomes = queue.Queue()
+        cancelled = [threading.Event(), threading.Event()]
+
+        def attempt(number):
+            try:
+                outcomes.put((number, self._timed(model, request, cancelled[number], max_tokens), None))
+            except BaseException as e:
+                outcomes.put((number, None, e))
+
+        def start(number):
+            # Each copy runs in a copy of the caller's context, so its spans nest in the caller's
+            threading.Thread(target=contextvars.copy_context().run, args=(attempt, number), daemon=True).start()
+
+        start(0)
+        try:
+            number, result, error = outcomes.get(timeout=delay)
+            copies = 1
+        except queue.Empty:
+            if admit is not None and not admit():
+                self._count("throttled")
+                number, result, error = outcomes.get()
+                if error is not None:
+                    raise error
+                return result
+            self._count("hedged")
+            start(1)
+            number, result, error = outcomes.get()
+            copies = 2
+        if error is not None and copies == 2:
+            number, result, error = outcomes.get()
+        if error is not None:
+            raise error
+        # The other copy stops at its next chunk, so its output is not paid for
+        cancelled[1 - number].set()
+        if number == 1:
+            self._count("won")
+        return result
+
+    async def call_async(self, model: str, request, admit=None, max_tokens: int = None):
+        """
+        Like call(), for a `request` that takes no argument and returns an awaitable. The copy that loses is
+        cancelled.
+        """
+        import asyncio
+
+        delay = self.delay(model, max_tokens)
+        if delay is None:
+            return await self._timed_async(model, request, max_tokens)
+
+        first = asyncio.ensure_future(self._timed_async(model, request, max_tokens))
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except BaseException:
+            first.cancel()
+            raise
+        if done:
+            return first.result()
+        if admit is not None and not admit():
+            self._count("throttled")
+            return await first
+
+        self._count("hedged")
+        second = asyncio.ensure_future(self._timed_async(model, request, max_tokens))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._count("won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def _percentile_from_environment():
+    if os.getenv("SCRIPTMONKEY_HEDGE", "").lower() not in ("on", "1", "true", "yes"):
+        return None
+    return float(os.getenv("SCRIPTMONKEY_HEDGE_PERCENTILE", DEFAULT_HEDGE_PERCENTILE))
+
+
+_hedger = None
+_hedger_lock = threading.Lock()
+
+
+def get_hedger() -> Hedger:
+    """Returns the process-wide Hedger."""
+    global _hedger
+    if _hedger is None:
+        with _hedger_lock:
+            if _hedger is None:
+                _hedger = Hedger(_percentile_from_environment())
+    return _hedger
+
+
+def configure_hedging(percentile: float = DEFAULT_HEDGE_PERCENTILE) -> None:
+    """
+    Turns hedging on: sets the latency percentile after which a request is sent a second time.
+
+    Args:
+        percentile (float, optional): The percentile, e.g. 90 to hedge more requests, or None to turn hedging off.
+            Defaults to 95.
+    """
+    get_hedger().percentile = percentile
@@ -10,3 +10,5 @@ def load_prompt(path: str) -> str:
 class DefaultPrompts:
     def __init__(self):
         self.fix_error = load_prompt(path="./prompts/fix_error.txt")
+        self.fix_error_patch = load_prompt(path="./prompts/fix_error_patch.txt")
+        self.fix_error_window = load_prompt(path="./prompts/fix_error_window.txt")
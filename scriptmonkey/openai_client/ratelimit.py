@@ -0,0 +1,357 @@
+import os
+import time
+import random
+import threading
+
+from ..utils.tokens import count_tokens
+from ..telemetry import current_span
+
+# Client-side limits are opt-in: the limits of an account depend on its usage tier, so requests are only throttled
+# for the models given limits with configure_rate_limits() or SCRIPTMONKEY_RATE_LIMITS="gpt-4o=500:30000". Without
+# them, requests are sent right away and only the server's 429s and Retry-After hold them back.
+# SCRIPTMONKEY_RATE_LIMITS=tier1 applies the limits of OpenAI's usage tier 1 (requests and tokens per minute).
+TIER_1_RATE_LIMITS = {
+    "gpt-4o": (500, 30_000),
+    "gpt-4o-2024-08-06": (500, 30_000),
+    "gpt-4o-mini": (500, 200_000),
+}
+RATE_LIMIT_PRESETS = {"tier1": TIER_1_RATE_LIMITS}
+
+# Completion tokens assumed for a request without max_tokens, until the actual usage is known
+DEFAULT_COMPLETION_TOKENS = 1024
+
+DEFAULT_MAX_RETRIES = 6
+BASE_DELAY = 1.0  # Seconds before the first retry, doubled on every attempt
+MAX_DELAY = 60.0
+
+# 408 Request Timeout, 409 Conflict, 429 Too Many Requests and 5xx errors are transient
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError", "ConnectionError", "TimeoutError"}
+
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously up to its capacity.
+
+    Callers reserve capacity up front and are told how long to wait before they may proceed, so the bucket never
+    blocks while holding its lock and can be shared by threads and asyncio tasks alike. The level may go negative:
+    every reservation queues up behind the previous ones.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Takes `amount` from the bucket and returns the seconds to wait before using it."""
+        # A single request larger than the bucket could never fit, so it only waits for a full bucket
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_second)
+            self.updated = now
+            self.level -= amount
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.refill_per_second
+
+    def try_reserve(self, amount: float) -> bool:
+        """Takes `amount` from the bucket if it is available right away, and returns whether it did."""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_second)
+            self.updated = now
+            if self.level < amount:
+                return False
+            self.level -= amount
+            return True
+
+    def refund(self, amount: float) -> None:
+        """Gives back capacity that was reserved but not used (or takes more, for a negative amount)."""
+        with self._lock:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class ModelLimiter:
+    """
+    The requests-per-minute and tokens-per-minute buckets of one model. A limit that is not configured (None) has
+    no bucket: only pauses after 429s hold its requests back.
+    """
+
+    def __init__(self, requests_per_minute: int = None, tokens_per_minute: int = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60) if tokens_per_minute else None
+        self.blocked_until = 0.0
+
+    def reserve(self, tokens: int) -> float:
+        """Reserves one request and `tokens` tokens, returning the seconds to wait before sending the request."""
+        delay = self.blocked_until - time.monotonic()
+        if self.requests:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        return max(0.0, delay)
+
+    def try_reserve(self, tokens: int) -> bool:
+        """Reserves one request and `tokens` tokens if the limits have room for them right away."""
+        if self.blocked_until > time.monotonic():
+            return False
+        if self.requests and not self.requests.try_reserve(1):
+            return False
+        if self.tokens and not self.tokens.try_reserve(tokens):
+            if self.requests:
+                self.requests.refund(1)
+            return False
+        return True
+
+    def pause(self, seconds: float) -> None:
+        """Holds back every request to this model for `seconds`, e.g. after the server answered 429."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def settle(self, estimated_tokens: int, completion) -> None:
+        """Corrects the token bucket with the actual usage reported in a completion, if any."""
+        usage = getattr(completion, "usage", None)
+        total_tokens = getattr(usage, "total_tokens", None)
+        if self.tokens and total_tokens is not None:
+            self.tokens.refund(estimated_tokens - total_tokens)
+
+
+def _parse_rate_limits(value: str) -> dict:
+    limits = {}
+    for item in value.split(","):
+        if item.strip().lower() in RATE_LIMIT_PRESETS:
+            limits.update(RATE_LIMIT_PRESETS[item.strip().lower()])
+            continue
+        if not item.strip():
+            continue
+        model, _, numbers = item.partition("=")
+        requests_per_minute, _, tokens_per_minute = numbers.partition(":")
+        try:
+            # A limit that is left out, like the tokens in "gpt-4o=500", is not enforced
+            limit = (_parse_limit(requests_per_minute), _parse_limit(tokens_per_minute))
+        except ValueError:
+            limit = None
+        if not model.strip() or limit is None or limit == (None, None):
+            print(f"❌ ScriptMonkey ignored the rate limit {item.strip()!r}, expected model=requests:tokens")
+            continue
+        limits[model.strip()] = limit
+    return limits
+
+
+def _parse_limit(value: str):
+    limit = int(value) if value.strip() else None
+    if limit is not None and limit <= 0:
+        raise ValueError(value)
+    return limit
+
+
+def is_retryable(error: Exception) -> bool:
+    """Returns True for rate limit, timeout, connection and server errors, which are worth retrying."""
+    # Running out of credits is also reported as a 429, but retrying will not help
+    if getattr(error, "code", None) == "insufficient_quota":
+        return False
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def get_retry_after(error: Exception):
+    """Returns the delay in seconds requested by the server through the Retry-After headers of an error, or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    # Retry-After may also be an HTTP date
+    import email.utils
+
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after=None) -> float:
+    """The delay before retry number `attempt` (0-based): exponential with full jitter, but at least Retry-After."""
+    delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2**attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def estimate_tokens(model: str, messages: list, max_tokens=None) -> int:
+    """Estimates the tokens a request counts against the tokens-per-minute limit: its prompt plus its completion."""
+    prompt_tokens = sum(count_tokens(message["content"], model) + 4 for message in messages)
+    return prompt_tokens + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+class RateLimiter:
+    """
+    A client-side rate limiter shared by every request to the API.
+
+    Requests wait for room in the requests-per-minute and tokens-per-minute buckets of their model before they are
+    sent, so parallel builds run close to the account's limits without tripping them. The buckets are opt-in: a
+    model without configured limits is not throttled up front (see TIER_1_RATE_LIMITS). Transient failures are
+    retried with exponential backoff and jitter; when the server sends Retry-After, the whole model is paused for
+    that long.
+
+    Usage:
+        limiter = get_rate_limiter()
+        completion = limiter.call("gpt-4o", messages, lambda: client.chat.completions.create(...))
+    """
+
+    def __init__(self, limits: dict = None, max_retries: int = None):
+        self.limits = {}
+        self.limits.update(_parse_rate_limits(os.getenv("SCRIPTMONKEY_RATE_LIMITS", "")))
+        self.limits.update(limits or {})
+        if max_retries is None:
+            max_retries = int(os.getenv("SCRIPTMONKEY_MAX_RETRIES", DEFAULT_MAX_RETRIES))
+        self.max_retries = max_retries
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def configure(self, model: str, requests_per_minute: int = None, tokens_per_minute: int = None) -> None:
+        """Sets the limits of a model. Limits that are not given keep their current value."""
+        with self._lock:
+            current = self.limits.get(model, (None, None))
+            self.limits[model] = (requests_per_minute or current[0], tokens_per_minute or current[1])
+            self._models.pop(model, None)
+
+    def for_model(self, model: str) -> ModelLimiter:
+        """Returns the buckets of a model, created on first use."""
+        with self._lock:
+            limiter = self._models.get(model)
+            if limiter is None:
+                limiter = self._models[model] = ModelLimiter(*self.limits.get(model, (None, None)))
+            return limiter
+
+    def try_reserve(self, model: str, messages: list, max_tokens=None, throttle: bool = True) -> bool:
+        """
+        Reserves room for a request that is only worth sending if it can go right away, such as the second copy of
+        a hedged request. Returns whether it may be sent; it is then counted against the limits like any request.
+        """
+        if not throttle:
+            return True
+        return self.for_model(model).try_reserve(estimate_tokens(model, messages, max_tokens))
+
+    def _handle_error(self, limiter: ModelLimiter, error: Exception, attempt: int) -> float:
+        if attempt >= self.max_retries or not is_retryable(error):
+            raise error
+        retry_after = get_retry_after(error)
+        delay = backoff_delay(attempt, retry_after)
+        if retry_after is not None or getattr(error, "status_code", None) == 429:
+            # The limit is shared by every request to the model, so they all back off
+            limiter.pause(delay)
+        return delay
+
+    def call(self, model: str, messages: list, request, max_tokens=None, throttle: bool = True, trace_span=None):
+        """
+        Sends a request once the model's limits allow it, retrying transient failures.
+
+        Args:
+            model (str): The model the request is sent to.
+            messages (list): The chat messages of the request, used to estimate its tokens.
+            request (callable): Sends the request and returns the completion.
+            max_tokens (int, optional): The max tokens of the request.
+            throttle (bool, optional): Whether to enforce the model's limits, or only retry. Defaults to True.
+            trace_span (Span, optional): Span that records the retries and the time spent waiting. Defaults to the
+                current span.
+
+        Returns:
+            The completion returned by `request`.
+        """
+        limiter = self.for_model(model)
+        estimated_tokens = estimate_tokens(model, messages, max_tokens)
+        trace_span = trace_span or current_span()
+        attempt = 0
+        while True:
+            if throttle:
+                delay = limiter.reserve(estimated_tokens)
+                if delay > 0:
+                    trace_span.add("throttled_seconds", delay)
+                    time.sleep(delay)
+            try:
+                completion = request()
+            except Exception as e:
+                delay = self._handle_error(limiter, e, attempt)
+                trace_span.add("retries")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            limiter.settle(estimated_tokens, completion)
+            return completion
+
+    async def call_async(
+        self, model: str, messages: list, request, max_tokens=None, throttle: bool = True, trace_span=None
+    ):
+        """Like call(), for a `request` that returns an awaitable. Waiting does not block the event loop."""
+        import asyncio
+
+        limiter = self.for_model(model)
+        estimated_tokens = estimate_tokens(model, messages, max_tokens)
+        trace_span = trace_span or current_span()
+        attempt = 0
+        while True:
+            if throttle:
+                delay = limiter.reserve(estimated_tokens)
+                if delay > 0:
+                    trace_span.add("throttled_seconds", delay)
+                    await asyncio.sleep(delay)
+            try:
+                completion = await request()
+            except Exception as e:
+                delay = self._handle_error(limiter, e, attempt)
+                trace_span.add("retries")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            limiter.settle(estimated_tokens, completion)
+            return completion
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Returns the process-wide RateLimiter."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+def configure_rate_limits(model: str, requests_per_minute: int = None, tokens_per_minute: int = None) -> None:
+    """
+    Sets the requests-per-minute and tokens-per-minute limits enforced for a model, to match the usage tier of the
+    account. Models are not throttled on the client side until their limits are set.
+
+    Args:
+        model (str): The model name, e.g. "gpt-4o".
+        requests_per_minute (int, optional): Requests per minute. Defaults to the current limit, if any.
+        tokens_per_minute (int, optional): Tokens per minute. Defaults to the current limit, if any.
+    """
+    get_rate_limiter().configure(model, requests_per_minute, tokens_per_minute)
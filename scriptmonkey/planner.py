@@ -0,0 +1,250 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .telemetry import span
+from .openai_client.client import chatgpt_json
+from .openai_client.basemodels import ProjectFile, ProjectOutline, ProjectStructureResponse
+
+# How the blueprint of a build is planned
+SINGLE = "single"  # One request for the whole blueprint, streamed (see agents.stream_project_structure)
+# An outline of the packages, then one request per package, in parallel. It costs an extra round trip, so it is
+# only used when asked for, for projects with more files than fit in a single response
+HIERARCHICAL = "hierarchical"
+PLANNERS = [SINGLE, HIERARCHICAL]
+DEFAULT_PLANNING_WORKERS = 8  # Packages detailed in parallel
+ROOT_LABEL = "(project root)"  # How the package of the files at the root of the project is named in prompts
+
+OUTLINE_INSTRUCTIONS = (
+    "Outline the packages of a multi-level application. The project will be placed directly inside a folder named 'generated_project'."
+    "\n- Do NOT include 'generated_project/' as part of the paths. All paths should be relative to the root of the project directory."
+    "\n- Group the files of the project into packages: the directories of related files, e.g. 'app/models/'. The path of a package ends with a '/'. Use an empty path for the package of the files at the root of the project, such as 'requirements.txt'."
+    "\n- For each package, include a 'description' that explains its purpose, and its 'files'."
+    "\n- For each file, include its full relative 'path' and a one-sentence 'purpose' that names the files of other packages it uses."
+    "\n- List every file of the project exactly once, in the package of its directory. Do not list functions: each package is detailed separately."
+    "\n- Do not include any extra explanations, commentary, or introductory text. Only provide the structured data as requested."
+)
+
+PACKAGE_INSTRUCTIONS = (
+    "Detail one package of a multi-level application. The description of the project and the outline of all its packages come first, then the package to detail."
+    "\n- Provide the files of this package only, with the full relative paths of the outline. You may add files the package needs that the outline missed, inside the package's directory."
+    "\n- For each file, include a 'description' that explains its purpose. Refer to the files of other packages by their paths in the outline."
+    "\n- If the file is a Python code file, also include a 'functions' list. For each function, include:"
+    "\n  - 'function_name': The name of the function."
+    "\n  - 'description': A description of what the function does."
+    "\n  - 'inputs': A list of the function's expected inputs, including data types."
+    "\n  - 'outputs': A list of the function's expected outputs, including data types."
+    "\n- Do not include any extra explanations, commentary, or introductory text. Only provide the structured data as requested."
+)
+
+
+def normalize_path(path: str) -> str:
+    """Returns a blueprint path relative to the project root, without a leading './' or '/'."""
+    path = path.strip().replace("\\", "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return path.lstrip("/")
+
+
+def package_label(path: str) -> str:
+    return path or ROOT_LABEL
+
+
+def render_outline(packages: list) -> str:
+    """Renders the outline for the prompts of the packages, one line per package and file."""
+    lines = []
+    for package in packages:
+        lines.append(f"## {package_label(package['path'])}: {package['description']}")
+        lines += [f"- {planned['path']}: {planned['purpose']}" for planned in package["files"]]
+    return "\n".join(lines)
+
+
+def generate_outline(description: str) -> list:
+    """
+    Generates the outline of a project: its packages and their files, without functions.
+
+    Returns:
+        list: The packages, as dicts with a normalized `path` (a directory ending with '/', or '' for the root),
+            a `description` and the `files` planned in them. Packages listed twice are merged.
+    """
+    with span("outline"):
+        outline = chatgpt_json(instructions=OUTLINE_INSTRUCTIONS, content=description, response_format=ProjectOutline)
+    outline = ProjectOutline.model_validate(outline).model_dump()
+
+    packages = {}
+    for package in outline["packages"]:
+        path = normalize_path(package["path"])
+        if path and not path.endswith("/"):
+            path += "/"
+        merged = packages.setdefault(path, {"path": path, "description": package["description"], "files": []})
+        merged["files"] += [dict(planned, path=normalize_path(planned["path"])) for planned in package["files"]]
+    return list(packages.values())
+
+
+def expand_package(description: str, outline: str, package: dict) -> list:
+    """
+    Details the files of one package, with their functions, given the outline of the whole project.
+
+    The description and the outline are the same for every package and come first in the prompt, so the provider
+    can serve them from its prompt cache.
+
+    Returns:
+        list: The entries of the package, in the `ProjectFile` format.
+    """
+    content = f"{description}\n\n# Project Outline\n{outline}\n\n# Package to Detail\n{package_label(package['path'])}"
+    with span("package", path=package["path"], planned_files=len(package["files"])):
+        structure = chatgpt_json(
+            instructions=PACKAGE_INSTRUCTIONS, content=content, response_format=ProjectStructureResponse
+        )
+    return ProjectStructureResponse.model_validate(structure).model_dump()["files"]
+
+
+class OutlineMerger:
+    """
+    Merges the expansions of the packages of an outline into the entries of one blueprint, package by package.
+
+    Every file belongs to exactly one package: the one whose outline lists it, or for a file the outline does not
+    list, the package with the longest path that contains it. The files an expansion gives for other packages are
+    dropped, so a file planned twice is described once, by its own package. Planned files an expansion left out
+    are added with their purpose from the outline, and every directory is added before its first file.
+
+    Usage:
+        merger = OutlineMerger(packages)
+        for package in packages:
+            for project_file in merger.merge(package, expand_package(description, outline, package)):
+                ...
+
+    Args:
+        packages (list): The packages of the outline, from generate_outline().
+    """
+
+    def __init__(self, packages: list):
+        self.packages = {package["path"]: package for package in packages}
+        self.owners = {}
+        for package in packages:
+            for planned in package["files"]:
+                self.owners.setdefault(planned["path"], package["path"])
+        self.seen = set()
+
+    def owner(self, path: str):
+        """Returns the path of the package a file belongs to, or None if no package contains it."""
+        if path in self.owners:
+            return self.owners[path]
+        containing = [package for package in self.packages if path.startswith(package)]
+        return max(containing, key=len, default=None)
+
+    def merge(self, package: dict, expansion: list) -> list:
+        """Returns the new blueprint entries of a package, given its expansion."""
+        files = {}
+        for project_file in expansion:
+            path = normalize_path(project_file["path"])
+            # Directories are derived from the files
+            if path and not path.endswith("/") and self.owner(path) == package["path"]:
+                files.setdefault(path, dict(project_file, path=path))
+        for planned in package["files"]:
+            if planned["path"] not in files and self.owner(planned["path"]) == package["path"]:
+                files[planned["path"]] = {"path": planned["path"], "description": planned["purpose"], "functions": None}
+
+        entries = []
+        for path, project_file in files.items():
+            if path in self.seen:
+                continue
+            entries += self._directories(path)
+            self.seen.add(path)
+            entries.append(ProjectFile.model_validate(project_file).model_dump())
+        return entries
+
+    def _directories(self, path: str) -> list:
+        entries = []
+        parts = path.split("/")[:-1]
+        for depth in range(1, len(parts) + 1):
+            directory = "/".join(parts[:depth]) + "/"
+            if directory in self.seen:
+                continue
+            self.seen.add(directory)
+            package = self.packages.get(directory)
+            description = package["description"] if package else f"Directory of the '{parts[depth - 1]}' files."
+            entries.append({"path": directory, "description": description, "functions": None})
+        return entries
+
+
+def expand_outline(description: str, max_workers: int = DEFAULT_PLANNING_WORKERS):
+    """
+    Generates the outline of a project, then details its packages in parallel requests.
+
+    Yields:
+        tuple: The packages of the outline (see generate_outline), then `(package, expansion)` for every package,
+            in the order the requests finish.
+    """
+    # Ended explicitly like the span of agents.stream_project_structure(). The requests run in copies of a context in
+    # which it is the current span, so their spans nest in it.
+    trace_span = span("blueprint", planner=HIERARCHICAL)
+    context = contextvars.copy_context()
+    context.run(trace_span.__enter__)
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        packages = context.copy().run(generate_outline, description)
+        trace_span.set(packages=len(packages))
+        yield packages
+        outline = render_outline(packages)
+        futures = {
+            executor.submit(context.copy().run, expand_package, description, outline, package): package
+            for package in packages
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    except GeneratorExit:
+        trace_span.end()
+        raise
+    except BaseException as e:
+        trace_span.end(e)
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    trace_span.end()
+
+
+def stream_hierarchical_structure(description: str, max_workers: int = DEFAULT_PLANNING_WORKERS):
+    """
+    Plans a project in three steps, so the size of its blueprint is not capped by a single response: an outline of
+    its packages, the files and functions of every package in parallel requests, and the merge of the packages
+    into one blueprint (see OutlineMerger).
+
+    Like agents.stream_project_structure(), yields the entries of the blueprint as they become available: those of
+    a package as soon as it is detailed, so files can be generated while other packages are still being planned.
+    The complete blueprint is validated as a `ProjectStructureResponse` once every package is merged.
+
+    Args:
+        description (str): The description of the project.
+        max_workers (int, optional): Packages detailed in parallel. Defaults to 8.
+
+    Yields:
+        dict: A blueprint entry, with the path, description and functions of a file or directory.
+    """
+    stages = expand_outline(description, max_workers)
+    packages = next(stages)
+    print(f"🐒 ScriptMonkey outlined {len(packages)} package(s) and is planning their files in parallel...")
+    merger = OutlineMerger(packages)
+    entries = []
+    for package, expansion in stages:
+        for project_file in merger.merge(package, expansion):
+            entries.append(project_file)
+            yield project_file
+    ProjectStructureResponse.model_validate({"files": entries})
+
+
+def generate_hierarchical_structure(description: str, max_workers: int = DEFAULT_PLANNING_WORKERS) -> dict:
+    """
+    Plans a project like stream_hierarchical_structure() and returns its blueprint, with the packages in the order
+    of the outline.
+
+    Returns:
+        dict: The blueprint, in the `ProjectStructureResponse` format.
+    """
+    stages = expand_outline(description, max_workers)
+    packages = next(stages)
+    expansions = {package["path"]: expansion for package, expansion in stages}
+    merger = OutlineMerger(packages)
+    entries = []
+    for package in packages:
+        entries += merger.merge(package, expansions[package["path"]])
+    return ProjectStructureResponse.model_validate({"files": entries}).model_dump()
@@ -0,0 +1,162 @@
+import os
+import threading
+
+from .scheduler import CONFIG, ENTRY_POINT, PACKAGE, REQUIREMENTS, file_role
+from .templates import template_for
+from .openai_client.backends import get_backend
+
+# Tiers a file of a build can be generated with, from cheapest to most capable
+TEMPLATE = "template"  # Produced locally without an API call, see scriptmonkey.templates
+SMALL = "small"  # The backend's small model, e.g. gpt-4o-mini
+LARGE = "large"  # The backend's default model, e.g. gpt-4o
+TIERS = [TEMPLATE, SMALL, LARGE]
+
+# Formats that are simple to write, as opposed to program code
+SIMPLE_EXTENSIONS = {".txt", ".md", ".rst", ".css", ".html", ".csv", ".gitignore", ".dockerignore", ".gitattributes"}
+# Python modules with at most this many functions and a description this short go to the small model
+MAX_SMALL_FUNCTIONS = 1
+MAX_SMALL_DESCRIPTION_CHARS = 300
+
+# Completion token caps of generated files, so a runaway response cannot hold up a build. A file cut off at its cap
+# is continued once with the same cap. The caps also count against the tokens-per-minute limit while a request runs.
+BASE_OUTPUT_TOKENS = 1200
+OUTPUT_TOKENS_PER_FUNCTION = 400
+SIMPLE_OUTPUT_TOKENS = 1500  # Configuration and other non-code formats
+MAX_OUTPUT_TOKENS = 8000
+OUTPUT_CONTINUATIONS = 1
+
+
+def route_file(project_file: dict) -> str:
+    """
+    Chooses how a blueprint file is generated: trivial files come from a local template, simple files (configuration
+    and other non-code formats, package `__init__.py` files, and Python modules with at most one function and a
+    short description) go to the small model, and everything else, including every entry point, to the default
+    model.
+
+    Returns:
+        str: TEMPLATE, SMALL or LARGE.
+    """
+    if template_for(project_file) is not None:
+        return TEMPLATE
+    path = project_file["path"]
+    role = file_role(path)
+    if role == ENTRY_POINT:
+        return LARGE
+    if role in (CONFIG, PACKAGE, REQUIREMENTS):
+        return SMALL
+    name = os.path.basename(path)
+    extension = os.path.splitext(name)[1] or (name if name.startswith(".") else "")
+    if extension in SIMPLE_EXTENSIONS:
+        return SMALL
+    if (
+        extension == ".py"
+        and len(project_file.get("functions") or []) <= MAX_SMALL_FUNCTIONS
+        and len(project_file.get("description") or "") <= MAX_SMALL_DESCRIPTION_CHARS
+    ):
+        return SMALL
+    return LARGE
+
+
+def output_limit(project_file: dict) -> int:
+    """
+    Returns the completion token cap of a blueprint file: a fixed cap for configuration and other non-code files,
+    and for code a base plus an allowance for every function the blueprint lists.
+    """
+    path = project_file["path"]
+    name = os.path.basename(path)
+    extension = os.path.splitext(name)[1] or (name if name.startswith(".") else "")
+    if file_role(path) in (CONFIG, REQUIREMENTS) or extension in SIMPLE_EXTENSIONS:
+        return SIMPLE_OUTPUT_TOKENS
+    functions = len(project_file.get("functions") or [])
+    return min(MAX_OUTPUT_TOKENS, BASE_OUTPUT_TOKENS + OUTPUT_TOKENS_PER_FUNCTION * functions)
+
+
+class Router:
+    """
+    Routes the files of a build to a tier (see route_file) and reports, per tier, how many files it generated and
+    the time and tokens they took.
+
+    Args:
+        enabled (bool, optional): Whether to route files; when False every file goes to the default model.
+            Defaults to True.
+
+    Usage:
+        router = Router()
+        tier = router.route(project_file)
+        model = router.model_for(tier)
+        ...
+        with track_usage() as usage:
+            ...
+        router.record(tier, model, seconds, usage)
+        router.print_report()
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.rows = {}  # (tier, model) -> files, seconds, and prompt, cached and completion tokens
+        self._lock = threading.Lock()
+
+    def route(self, project_file: dict) -> str:
+        """Returns the tier a file is generated with: TEMPLATE, SMALL or LARGE."""
+        return route_file(project_file) if self.enabled else LARGE
+
+    @staticmethod
+    def model_for(tier: str) -> str:
+        """Returns the model of a tier on the active backend, or None for TEMPLATE."""
+        if tier == TEMPLATE:
+            return None
+        backend = get_backend()
+        return backend.small_model if tier == SMALL else backend.default_model
+
+    def record(self, tier: str, model: str, seconds: float, usage: dict = None) -> None:
+        """
+        Records a generated file.
+
+        Args:
+            tier (str): The tier it was generated with.
+            model (str): The model it was generated with, None for a template.
+            seconds (float): Time it took to generate.
+            usage (dict, optional): The token usage of its API calls, from openai_client.track_usage(). Defaults
+                to None, for a template.
+        """
+        usage = usage or {}
+        with self._lock:
+            row = self.rows.setdefault(
+                (tier, model), {"files": 0, "seconds": 0.0, "prompt": 0, "cached": 0, "completion": 0}
+            )
+            row["files"] += 1
+            row["seconds"] += seconds
+            row["prompt"] += usage.get("prompt_tokens", 0)
+            row["cached"] += usage.get("cached_tokens", 0)
+            row["completion"] += usage.get("completion_tokens", 0)
+
+    def print_report(self) -> None:
+        """Prints how many files each tier generated and what they cost, if any file was generated."""
+        from rich.table import Table
+        from rich.console import Console
+
+        if not self.rows:
+            return
+        table = Table(title="🐒 ScriptMonkey Model Routing", title_justify="left")
+        for column in ("Tier", "Model", "Files", "Total (s)", "Mean (s)", "Prompt", "Cached", "Completion"):
+            table.add_column(column, justify="left" if column in ("Tier", "Model") else "right")
+        for (tier, model), row in sorted(self.rows.items(), key=lambda item: TIERS.index(item[0][0])):
+            table.add_row(
+                tier,
+                model or "(local)",
+                str(row["files"]),
+                f"{row['seconds']:.2f}",
+                f"{row['seconds'] / row['files']:.2f}",
+                str(row["prompt"]),
+                str(row["cached"]),
+                str(row["completion"]),
+            )
+        Console().print(table)
+
+        templates = sum(row["files"] for (tier, _), row in self.rows.items() if tier == TEMPLATE)
+        small = sum(row["files"] for (tier, _), row in self.rows.items() if tier == SMALL)
+        if templates or small:
+            print(
+                f"🐒 ScriptMonkey wrote {templates} file(s) from local templates without an API call and sent "
+                f"{small} simple file(s) to the small model."
+            )
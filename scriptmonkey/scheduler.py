@@ -0,0 +1,301 @@
+import os
+import threading
+import contextvars
+from concurrent.futures import Future
+
+from .blueprint import BlueprintIndex
+from .utils.tokens import count_tokens
+from .utils.manifest import NEEDS_BUILD
+from .utils.signatures import file_signatures
+
+# Roles of a file in the project, which decide where it goes in the generation order
+CONFIG = "config"  # Settings and constants: used by other files, generated first
+ENTRY_POINT = "entry-point"  # Ties the project together: generated last, after everything it uses
+PACKAGE = "package"  # An __init__.py: generated after the modules of its package, which it re-exports
+REQUIREMENTS = "requirements"  # Lists the packages the code imports: generated after every Python file
+MODULE = "module"
+
+CONFIG_EXTENSIONS = {".yaml", ".yml", ".toml", ".ini", ".cfg", ".env", ".json"}
+CONFIG_STEMS = {"config", "settings", "constants", "conf"}
+ENTRY_POINT_NAMES = {"main.py", "__main__.py", "app.py", "manage.py", "wsgi.py", "asgi.py", "cli.py", "run.py"}
+
+# Token cap for the signatures of generated dependencies included in each per-file prompt
+DEFAULT_SIGNATURE_TOKENS = 1500
+
+
+def file_role(path: str) -> str:
+    """Returns the role of a file in the project: CONFIG, ENTRY_POINT, PACKAGE, REQUIREMENTS or MODULE."""
+    name = os.path.basename(path.rstrip("/"))
+    stem, extension = os.path.splitext(name)
+    if name == "__init__.py":
+        return PACKAGE
+    if name == "requirements.txt":
+        return REQUIREMENTS
+    if name in ENTRY_POINT_NAMES:
+        return ENTRY_POINT
+    if extension in CONFIG_EXTENSIONS or name.startswith(".env") or stem.lower() in CONFIG_STEMS:
+        return CONFIG
+    return MODULE
+
+
+def file_dependencies(index: BlueprintIndex, path: str, candidates: set) -> set:
+    """
+    Returns the files, among `candidates`, that a file should be generated after: the files it likely imports
+    according to the blueprint, adjusted for the roles of the files. Configuration files depend on nothing,
+    nothing depends on an entry point, a package's `__init__.py` depends on the modules of the package, and those
+    modules do not depend on it in return. `requirements.txt` depends on every Python file.
+    """
+    role = file_role(path)
+    if role == CONFIG:
+        return set()
+    if role == REQUIREMENTS:
+        return {other for other in candidates if other.endswith(".py")}
+    directory = os.path.dirname(path)
+    dependencies = set()
+    for other in index.imports.get(path, ()):
+        if other not in candidates:
+            continue
+        other_role = file_role(other)
+        if other_role in (ENTRY_POINT, REQUIREMENTS):
+            continue
+        package = os.path.dirname(other)
+        if other_role == PACKAGE and (not package or directory == package or directory.startswith(package + "/")):
+            # The __init__.py of its own package (or of an enclosing one)
+            continue
+        dependencies.add(other)
+    if role == PACKAGE:
+        dependencies.update(
+            other
+            for other in candidates
+            if other != path
+            and other.endswith(".py")
+            and os.path.dirname(other) == directory
+            and file_role(other) not in (ENTRY_POINT, PACKAGE)
+        )
+    return dependencies
+
+
+def break_cycles(graph: dict, order: list) -> dict:
+    """
+    Turns a dependency graph into a DAG by dropping the edges that close a cycle, found by a depth-first search
+    in blueprint order, so mutually dependent files are generated in the order the blueprint lists them.
+
+    Args:
+        graph (dict): The dependencies of every file.
+        order (list): The files in blueprint order.
+
+    Returns:
+        dict: The dependencies of every file, without cycles.
+    """
+    position = {path: number for number, path in enumerate(order)}
+    acyclic = {path: set(dependencies) for path, dependencies in graph.items()}
+    visiting, visited = set(), set()
+    for root in order:
+        if root in visited:
+            continue
+        visiting.add(root)
+        stack = [(root, iter(sorted(acyclic[root], key=position.get)))]
+        while stack:
+            path, dependencies = stack[-1]
+            for dependency in dependencies:
+                if dependency in visiting:
+                    acyclic[path].discard(dependency)
+                elif dependency not in visited:
+                    visiting.add(dependency)
+                    stack.append((dependency, iter(sorted(acyclic[dependency], key=position.get))))
+                    break
+            else:
+                stack.pop()
+                visiting.discard(path)
+                visited.add(path)
+    return acyclic
+
+
+def dependency_levels(graph: dict, order: list) -> list:
+    """
+    Groups the files of a DAG into topological levels: the files of a level only depend on files of earlier
+    levels, so each level can be generated concurrently.
+
+    Returns:
+        list: The levels, each a list of paths in blueprint order.
+    """
+    level = {}
+    remaining = list(order)
+    while remaining:
+        ready = [path for path in remaining if all(dependency in level for dependency in graph[path])]
+        for path in ready:
+            level[path] = 1 + max((level[dependency] for dependency in graph[path]), default=-1)
+        remaining = [path for path in remaining if path not in level]
+    levels = [[] for _ in range(max(level.values(), default=-1) + 1)]
+    for path in order:
+        levels[level[path]].append(path)
+    return levels
+
+
+class BuildScheduler:
+    """
+    Generates the files of a blueprint on a thread pool in dependency order.
+
+    A file is started as soon as the files it depends on (see file_dependencies) are finished, so independent
+    files run concurrently while each file is written after the code it uses. Its prompt then includes the
+    signatures of the dependencies that were actually generated, not just their blueprint descriptions.
+
+    Entries can be added while the blueprint is still streaming. Until finish_blueprint() is called, a file only
+    waits for the files listed before it, and entry points and `requirements.txt` wait for the complete blueprint.
+    For a blueprint that is already complete, pass it as `project_files`: nothing starts before finish_blueprint().
+
+    Usage:
+        scheduler = BuildScheduler(executor, build_file, project_description, base_directory, manifest)
+        for project_file in project_files:
+            scheduler.add(project_file)
+        scheduler.finish_blueprint()
+        for file_path, future, status in scheduler.pending:
+            ...
+
+    Args:
+        executor (Executor): The thread pool the files are generated on.
+        build_file (callable): Called as `build_file(project_file, file_path, overview, context)` to generate,
+            write and return the content of a file, where `overview` is the context shared by every file (see
+            BlueprintIndex.overview) and `context` the context specific to the file.
+        project_description (str): A high-level description of the project's purpose and goals.
+        base_directory (str): Directory the project is written to.
+        manifest (BuildManifest): The build manifest, which decides which files need to be generated.
+        project_files (list, optional): The complete blueprint, if it is known up front. Defaults to None.
+        max_signature_tokens (int, optional): Token cap for the signatures of the dependencies in each prompt.
+            Defaults to 1500.
+    """
+
+    def __init__(
+        self,
+        executor,
+        build_file,
+        project_description: str,
+        base_directory: str,
+        manifest,
+        project_files: list = None,
+        max_signature_tokens: int = DEFAULT_SIGNATURE_TOKENS,
+    ):
+        self.executor = executor
+        self.build_file = build_file
+        self.base_directory = base_directory
+        self.manifest = manifest
+        self.max_signature_tokens = max_signature_tokens
+        self.streaming = project_files is None
+        self.index = BlueprintIndex(project_description, project_files or [])
+        self.pending = []  # (file path, future or None, manifest status or None for a directory), in blueprint order
+        self.levels = []  # The dependency levels, once the blueprint is final
+        self.entries = {}  # Blueprint path -> (entry, file path) of every file
+        self.dependencies = {}  # Blueprint path -> the files it was scheduled after
+        self.waiting = {}  # Blueprint path -> unfinished dependencies (None: not decided yet) of queued files
+        self.finished = set()
+        self.futures = {}
+        self.signatures = {}
+        self.lock = threading.RLock()
+
+    def add(self, project_file: dict) -> None:
+        """Adds a blueprint entry: creates a directory, or queues a file that needs to be (re)built."""
+        path = project_file["path"]
+        file_path = os.path.join(self.base_directory, path.lstrip("/"))
+        with self.lock:
+            if self.streaming:
+                self.index.add(project_file)
+
+            # Check if it's a directory or file (directories end with '/')
+            if file_path.endswith("/"):
+                os.makedirs(file_path, exist_ok=True)
+                self.pending.append((file_path, None, None))
+                return
+
+            self.entries[path] = (project_file, file_path)
+            status = self.manifest.status(project_file, file_path)
+            if status not in NEEDS_BUILD:
+                self.finished.add(path)
+                self.pending.append((file_path, None, status))
+                return
+
+            self.futures[path] = Future()
+            self.pending.append((file_path, self.futures[path], status))
+            self.waiting[path] = None
+            if self.streaming and file_role(path) not in (ENTRY_POINT, REQUIREMENTS):
+                # Only the files listed before it are known, which keeps the order acyclic
+                self._wait_for(path, file_dependencies(self.index, path, set(self.entries) - {path}))
+                self._release()
+
+    def finish_blueprint(self) -> None:
+        """Schedules the files that are still waiting with the dependencies of the complete blueprint."""
+        with self.lock:
+            order = list(self.entries)
+            graph = break_cycles({path: file_dependencies(self.index, path, set(order)) for path in order}, order)
+            self.levels = dependency_levels(graph, order)
+            for path in self.waiting:
+                self._wait_for(path, graph[path])
+            self._release()
+
+    def _wait_for(self, path: str, dependencies: set) -> None:
+        self.dependencies[path] = dependencies
+        self.waiting[path] = dependencies - self.finished
+
+    def _release(self) -> None:
+        """Starts every queued file whose dependencies are finished."""
+        for path in [path for path, waiting in self.waiting.items() if waiting is not None and not waiting]:
+            del self.waiting[path]
+            project_file, file_path = self.entries[path]
+            context = self.index.related_context(project_file) + self._dependency_context(path)
+            # Each file runs in a copy of the current context, so its spans nest in the caller's
+            self.executor.submit(contextvars.copy_context().run, self._run, path, self.index.overview(), context)
+
+    def _run(self, path: str, overview: str, context: str) -> None:
+        project_file, file_path = self.entries[path]
+        try:
+            content = self.build_file(project_file, file_path, overview, context)
+        except BaseException as e:
+            self._finish(path, None)
+            self.futures[path].set_exception(e)
+            return
+        self._finish(path, content)
+        self.futures[path].set_result(content)
+
+    def _finish(self, path: str, content: str) -> None:
+        signatures = file_signatures(path, content) if content is not None else None
+        with self.lock:
+            self.finished.add(path)
+            if signatures:
+                self.signatures[path] = signatures
+            for waiting in self.waiting.values():
+                if waiting:
+                    waiting.discard(path)
+            self._release()
+
+    def _signatures_of(self, path: str) -> str:
+        if path not in self.signatures and path not in self.futures:
+            # Up to date from a previous build, or written by hand: summarize it from disk
+            try:
+                with open(self.entries[path][1], "r") as file:
+                    self.signatures[path] = file_signatures(path, file.read())
+            except (OSError, UnicodeDecodeError):
+                self.signatures[path] = ""
+        return self.signatures.get(path, "")
+
+    def _dependency_context(self, path: str) -> str:
+        """The signatures of the generated dependencies of a file, most relevant first, within the token cap."""
+        dependencies = self.dependencies.get(path, set())
+        parts = []
+        remaining = self.max_signature_tokens
+        for dependency in self.index.related_files(path):
+            if dependency not in dependencies:
+                continue
+            signatures = self._signatures_of(dependency)
+            if not signatures:
+                continue
+            part = f"## {dependency}\n```\n{signatures}\n```\n"
+            tokens = count_tokens(part)
+            if tokens > remaining:
+                continue
+            parts.append(part)
+            remaining -= tokens
+        if not parts:
+            return ""
+        return (
+            "\nCode already written for the files this file depends on (signatures only; use these exact names):\n"
+            + "".join(parts)
+        )
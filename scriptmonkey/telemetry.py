@@ -0,0 +1,284 @@
+import json
+import time
+import functools
+import itertools
+import threading
+import contextvars
+
+# Counters that are added up from every span into its parents, so a stage reports the tokens of its LLM calls
+ROLLUP_COUNTERS = ("prompt_tokens", "completion_tokens", "cached_tokens", "retries", "llm_calls")
+
+_current_span = contextvars.ContextVar("scriptmonkey_span", default=None)
+_span_ids = itertools.count(1)
+
+_enabled = False
+_collect = False  # Whether finished spans are kept for the summary
+_hooks = []
+_spans = []
+_trace_file = None
+_lock = threading.Lock()
+
+
+class Span:
+    """
+    A timed stage of a ScriptMonkey run, such as the blueprint, the generation of one file or an LLM call.
+
+    Attributes:
+        name (str): The stage, e.g. "blueprint", "file", "readme", "tree", "read_file", "render", "fix" or "llm".
+        span_id (int): Identifier of the span, unique within the process.
+        parent_id (int): Identifier of the enclosing span, or None.
+        start (float): Start time as a UNIX timestamp.
+        duration (float): Wall time in seconds, once the span has ended.
+        attributes (dict): Details such as the path, the model, `time_to_first_token`, the token counters
+            (`prompt_tokens`, `completion_tokens`, `cached_tokens`), `retries` and `error`.
+    """
+
+    def __init__(self, name: str, parent, attributes: dict):
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.parent = parent
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.time()
+        self.duration = None
+        self.attributes = attributes
+        self._started = time.perf_counter()
+        self._token = None
+        self._lock = threading.Lock()
+
+    def set(self, **attributes) -> None:
+        """Sets attributes of the span."""
+        self.attributes.update(attributes)
+
+    def add(self, name: str, value=1) -> None:
+        """Adds to a numeric attribute of the span, e.g. `span.add("retries")`."""
+        with self._lock:
+            self.attributes[name] = self.attributes.get(name, 0) + value
+
+    def mark_first_token(self) -> None:
+        """Records the time to first token, the first time it is called."""
+        if "time_to_first_token" not in self.attributes:
+            self.attributes["time_to_first_token"] = time.perf_counter() - self._started
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            **self.attributes,
+        }
+
+    def end(self, error: BaseException = None) -> None:
+        """
+        Ends the span. Spans used with `with` end on exit; spans that outlive a block, like the span of a stream
+        that is consumed by a generator, are ended explicitly.
+        """
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.attributes["error"] = f"{type(error).__name__}: {error}"
+        if self.parent is not None:
+            for counter in ROLLUP_COUNTERS:
+                if counter in self.attributes:
+                    self.parent.add(counter, self.attributes[counter])
+        _finish(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        _current_span.reset(self._token)
+        self.end(exc_value)
+        return False
+
+
+class _NoopSpan:
+    """Stands in for a span while tracing is disabled, so instrumented code costs next to nothing."""
+
+    name = None
+    attributes = {}
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, name, value=1):
+        pass
+
+    def mark_first_token(self):
+        pass
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes):
+    """
+    Returns a context manager that records a span around a stage of the run, nested in the current span.
+
+    Usage:
+        with span("file", path=file_path) as current:
+            ...
+            current.set(model="gpt-4o")
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, _current_span.get(), attributes)
+
+
+def traced(name: str):
+    """Decorator that records a span named `name` around every call of a function."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Span(name, _current_span.get(), {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def current_span():
+    """Returns the innermost active span, or a no-op span if there is none."""
+    current = _current_span.get()
+    return current if current is not None else _NOOP_SPAN
+
+
+def _finish(finished: Span) -> None:
+    with _lock:
+        if _collect:
+            _spans.append(finished)
+        if _trace_file is not None:
+            _trace_file.write(json.dumps(finished.to_dict(), default=str) + "\n")
+            _trace_file.flush()
+        hooks = list(_hooks)
+    for hook in hooks:
+        try:
+            hook(finished)
+        except Exception:
+            # A broken metrics exporter must never break a run
+            pass
+
+
+def enable_tracing(path: str = None) -> None:
+    """
+    Starts recording spans, keeping them in memory for the summary and writing them as JSON lines to `path`.
+
+    Args:
+        path (str, optional): File the spans are appended to, one JSON object per line. Defaults to None.
+    """
+    global _enabled, _collect, _trace_file
+    with _lock:
+        if _trace_file is not None:
+            _trace_file.close()
+        _trace_file = open(path, "w") if path else None
+        _spans.clear()
+        _enabled = _collect = True
+
+
+def disable_tracing() -> None:
+    """Stops recording spans and closes the trace file. Span hooks keep tracing enabled."""
+    global _enabled, _collect, _trace_file
+    with _lock:
+        if _trace_file is not None:
+            _trace_file.close()
+            _trace_file = None
+        _collect = False
+        _enabled = bool(_hooks)
+
+
+def add_span_hook(hook) -> None:
+    """
+    Calls `hook(span)` for every finished span, e.g. to forward spans to a metrics system. Adding a hook enables
+    tracing, without keeping spans in memory. Exceptions raised by hooks are ignored.
+    """
+    global _enabled
+    with _lock:
+        _hooks.append(hook)
+        _enabled = True
+
+
+def remove_span_hook(hook) -> None:
+    """Removes a hook added with add_span_hook()."""
+    global _enabled
+    with _lock:
+        _hooks.remove(hook)
+        _enabled = bool(_hooks) or _collect
+
+
+def get_spans() -> list:
+    """Returns the spans recorded since tracing was enabled, in the order they finished."""
+    with _lock:
+        return list(_spans)
+
+
+def summarize(spans: list) -> list:
+    """
+    Aggregates spans by name.
+
+    Returns:
+        list: One dict per span name, in order of first appearance, with the number of spans, their total and
+            mean wall time, their token counters and retries (including those of nested spans), and the mean time
+            to first token.
+    """
+    rows = {}
+    for finished in spans:
+        row = rows.setdefault(finished.name, {"name": finished.name, "count": 0, "seconds": 0.0, "errors": 0})
+        row["count"] += 1
+        row["seconds"] += finished.duration or 0.0
+        row["errors"] += int("error" in finished.attributes)
+        for counter in ROLLUP_COUNTERS:
+            if counter in finished.attributes:
+                row[counter] = row.get(counter, 0) + finished.attributes[counter]
+        ttft = finished.attributes.get("time_to_first_token")
+        if ttft is not None:
+            row["ttft_total"] = row.get("ttft_total", 0.0) + ttft
+            row["ttft_count"] = row.get("ttft_count", 0) + 1
+    for row in rows.values():
+        row["mean_seconds"] = row["seconds"] / row["count"]
+        if row.get("ttft_count"):
+            row["mean_time_to_first_token"] = row.pop("ttft_total") / row.pop("ttft_count")
+    return list(rows.values())
+
+
+def print_summary(spans: list = None) -> None:
+    """Prints a table of the time and tokens spent in each stage of the run."""
+    from rich.table import Table
+    from rich.console import Console
+
+    spans = get_spans() if spans is None else spans
+    if not spans:
+        return
+    table = Table(title="🐒 ScriptMonkey Trace Summary", title_justify="left")
+    for column in ("Stage", "Count", "Total (s)", "Mean (s)", "TTFT (s)", "Prompt", "Completion", "Cached", "Retries"):
+        table.add_column(column, justify="left" if column == "Stage" else "right")
+
+    for row in summarize(spans):
+        ttft = row.get("mean_time_to_first_token")
+        table.add_row(
+            row["name"] + (f" ({row['errors']} failed)" if row["errors"] else ""),
+            str(row["count"]),
+            f"{row['seconds']:.2f}",
+            f"{row['mean_seconds']:.2f}",
+            f"{ttft:.2f}" if ttft is not None else "",
+            str(row.get("prompt_tokens", "")),
+            str(row.get("completion_tokens", "")),
+            str(row.get("cached_tokens", "")),
+            str(row.get("retries", "")),
+        )
+    Console().print(table)
@@ -0,0 +1,207 @@
+import os
+import re
+import ast
+import sys
+import datetime
+
+from .utils.file_handler import read_file
+
+# Files produced locally, without an API call
+GITIGNORE = "gitignore"
+LICENSE = "license"
+PACKAGE = "package"
+REQUIREMENTS = "requirements"
+
+# A package __init__.py is left empty unless its description asks for content like this
+PACKAGE_CONTENT = re.compile(r"\b(?:import|export|expos|re-export|__all__|version|register|available)", re.IGNORECASE)
+# Licenses other than MIT are not generated locally
+OTHER_LICENSES = re.compile(r"\b(?:apache|gpl|bsd|mpl|mozilla|unlicense|proprietary|creative commons)", re.IGNORECASE)
+
+# Import names whose package on PyPI is named differently
+PACKAGE_NAMES = {
+    "PIL": "Pillow",
+    "bs4": "beautifulsoup4",
+    "cv2": "opencv-python",
+    "dateutil": "python-dateutil",
+    "docx": "python-docx",
+    "dotenv": "python-dotenv",
+    "flask_sqlalchemy": "Flask-SQLAlchemy",
+    "jose": "python-jose",
+    "jwt": "PyJWT",
+    "magic": "python-magic",
+    "multipart": "python-multipart",
+    "serial": "pyserial",
+    "sklearn": "scikit-learn",
+    "skimage": "scikit-image",
+    "telegram": "python-telegram-bot",
+    "yaml": "PyYAML",
+    "MySQLdb": "mysqlclient",
+    "psycopg2": "psycopg2-binary",
+    "win32api": "pywin32",
+    "Crypto": "pycryptodome",
+    "OpenSSL": "pyOpenSSL",
+}
+
+GITIGNORE_CONTENT = """# Byte-compiled files
+__pycache__/
+*.py[cod]
+*$py.class
+
+# Distribution and packaging
+build/
+dist/
+*.egg-info/
+.eggs/
+
+# Virtual environments
+.venv/
+venv/
+env/
+
+# Environment variables and secrets
+.env
+.env.*
+
+# Test, coverage and type checking caches
+.pytest_cache/
+.mypy_cache/
+.coverage
+htmlcov/
+
+# Logs and local databases
+*.log
+*.sqlite3
+*.db
+
+# Editors and operating systems
+.vscode/
+.idea/
+.DS_Store
+"""
+
+MIT_LICENSE_CONTENT = """MIT License
+
+Copyright (c) {year} {holder}
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+def template_for(project_file: dict) -> str:
+    """
+    Returns the template that produces a blueprint file locally, if it is trivial enough for one: an
+    `__init__.py` that only marks a package, a `.gitignore`, an MIT `LICENSE`, or a `requirements.txt`, which is
+    derived from the imports of the generated code.
+
+    Returns:
+        str: GITIGNORE, LICENSE, PACKAGE or REQUIREMENTS, or None if the file needs a model.
+    """
+    name = os.path.basename(project_file["path"])
+    description = project_file.get("description") or ""
+    if name == "__init__.py":
+        if not project_file.get("functions") and not PACKAGE_CONTENT.search(description):
+            return PACKAGE
+    elif name == ".gitignore":
+        return GITIGNORE
+    elif name in ("LICENSE", "LICENSE.txt", "LICENSE.md"):
+        if not OTHER_LICENSES.search(description):
+            return LICENSE
+    elif name == "requirements.txt":
+        return REQUIREMENTS
+    return None
+
+
+def render_template(template: str, project_file: dict, base_directory: str, project_files: list) -> str:
+    """
+    Produces the content of a file from its template (see template_for).
+
+    Args:
+        template (str): The template of the file.
+        project_file (dict): The blueprint entry of the file.
+        base_directory (str): Directory the project is written to, where the generated code is read from.
+        project_files (list): The blueprint entries of the project.
+
+    Returns:
+        str: The content of the file.
+    """
+    if template == PACKAGE:
+        return ""
+    if template == GITIGNORE:
+        return GITIGNORE_CONTENT
+    if template == LICENSE:
+        return MIT_LICENSE_CONTENT.format(year=datetime.date.today().year, holder="The Project Authors")
+    return requirements(base_directory, project_files)
+
+
+def requirements(base_directory: str, project_files: list) -> str:
+    """
+    Lists the third-party packages imported by the Python files of a project, one per line: imports of the
+    standard library and of the project's own modules are left out, and import names are mapped to package
+    names where they differ (e.g. `yaml` to `PyYAML`).
+
+    Python files that cannot be read, e.g. because they failed to generate, are skipped, so a build that failed
+    some files still gets the requirements of the others.
+
+    Returns:
+        str: The content of `requirements.txt`.
+    """
+    paths = [project_file["path"].strip("/") for project_file in project_files]
+    # Any file or directory name of the project can be imported as a top-level module, depending on sys.path
+    local = {os.path.splitext(part)[0] for path in paths for part in path.split("/")}
+
+    packages = set()
+    for path in paths:
+        if not path.endswith(".py"):
+            continue
+        try:
+            tree = ast.parse(read_file(os.path.join(base_directory, path)))
+        except (OSError, UnicodeDecodeError, SyntaxError):
+            continue
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                top = name.split(".")[0]
+                if top not in local and not _is_standard_library(top):
+                    packages.add(PACKAGE_NAMES.get(top, top))
+    return "".join(f"{package}\n" for package in sorted(packages, key=str.lower))
+
+
+def _is_standard_library(name: str) -> bool:
+    if name == "__future__" or name in sys.builtin_module_names:
+        return True
+    if hasattr(sys, "stdlib_module_names"):
+        return name in sys.stdlib_module_names
+    # Before Python 3.10: a module is in the standard library if it is installed with it
+    import sysconfig
+    import importlib.util
+
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return False
+    if spec is None or not spec.origin:
+        return False
+    standard = os.path.realpath(sysconfig.get_paths()["stdlib"])
+    origin = os.path.realpath(spec.origin)
+    return origin.startswith(standard + os.sep) and "site-packages" not in origin
@@ -0,0 +1,371 @@
+import os
+import ast
+import reprlib
+import sysconfig
+
+from .tokens import count_tokens
+from .file_handler import read_file
+
+# Files up to this size are sent whole; beyond it only the code around the error is, so a fix takes about as long
+# for a 5000-line module as for a 50-line script
+DEFAULT_FIX_CONTEXT_TOKENS = 6_000
+
+MAX_REPR_CHARS = 200  # Longest repr of a local variable
+MAX_LOCALS = 25  # Most local variables shown per frame
+WINDOW_LINES = 60  # Lines kept around the failing line when its definition alone does not fit the budget
+MAX_ASSIGNMENT_LINES = 6  # Longer module-level assignments are shortened to their first line
+
+_SCRIPTMONKEY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_LIBRARY_DIRS = tuple(
+    os.path.abspath(path) + os.sep
+    for path in {sysconfig.get_paths().get(name) for name in ("stdlib", "platstdlib", "purelib", "platlib")}
+    if path
+)
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+class CodeWindow:
+    """A range of lines of a file around a traceback frame, usually the function or class that encloses it."""
+
+    def __init__(self, path: str, start: int, end: int, name: str, lineno: int, text: str):
+        self.path = path
+        self.start = start  # First line, 1-based
+        self.end = end  # Last line, inclusive
+        self.name = name  # Qualified name of the enclosing definition, or "<module>"
+        self.lineno = lineno  # The line the frame was executing
+        self.text = text
+
+
+class FixContext:
+    """
+    What the exception handler sends to the model about the code that raised an exception.
+
+    Attributes:
+        path (str): The file to fix, the one of the innermost traceback frame in user code.
+        source (str): The content of that file.
+        target (CodeWindow): The part of the file to fix, or None when the whole file is sent.
+        frames (list): CodeWindows of the other user-code frames of the traceback, sent as read-only context.
+        module_context (str): The imports and module-level names the windows use.
+        local_variables (str): The size-capped reprs of the local variables of every user-code frame.
+        tokens (int): Tokens of the code, names and variables that are sent.
+    """
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.source = source
+        self.target = None
+        self.frames = []
+        self.module_context = ""
+        self.local_variables = ""
+        self.tokens = 0
+
+    def render(self) -> str:
+        """Formats the context as the sections of a fix request."""
+        if self.target is None:
+            parts = [f"# Original Code:\n```\n{self.source}\n```\n\n"]
+        else:
+            parts = [
+                f"# Original Code (lines {self.target.start}-{self.target.end} of {self.path}, "
+                f"in {self.target.name}):\n```\n{self.target.text.rstrip()}\n```\n\n"
+            ]
+            if self.module_context:
+                parts.append(
+                    f"# Imports and Module-Level Names Used by This Code:\n```\n{self.module_context}\n```\n\n"
+                )
+        for window in self.frames:
+            parts.append(
+                f"# Calling Code (lines {window.start}-{window.end} of {window.path}, in {window.name}, "
+                f"read only):\n```\n{window.text.rstrip()}\n```\n\n"
+            )
+        if self.local_variables:
+            parts.append(f"# Local Variables:\n{self.local_variables}\n\n")
+        return "".join(parts)
+
+
+def is_user_file(path: str) -> bool:
+    """Whether a traceback frame belongs to the user's code rather than to Python, an installed package or us."""
+    if not path or path.startswith("<") or not os.path.isfile(path):
+        return False
+    path = os.path.abspath(path)
+    if path.startswith(_SCRIPTMONKEY_DIR + os.sep):
+        return False
+    parts = path.split(os.sep)
+    if "site-packages" in parts or "dist-packages" in parts:
+        return False
+    return not path.startswith(_LIBRARY_DIRS)
+
+
+def user_frames(exc_traceback) -> list:
+    """Returns the (frame, lineno) pairs of a traceback that are in user code, innermost last."""
+    frames = []
+    while exc_traceback is not None:
+        frame = exc_traceback.tb_frame
+        if is_user_file(frame.f_code.co_filename):
+            frames.append((frame, exc_traceback.tb_lineno))
+        exc_traceback = exc_traceback.tb_next
+    return frames
+
+
+def _definition_start(node) -> int:
+    # Decorators belong to the definition they decorate
+    return min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+
+
+def enclosing_definition(tree: ast.Module, lineno: int):
+    """
+    Finds the innermost function, or else class, that contains a line.
+
+    Returns:
+        tuple: (node, qualified name), or (None, "<module>") for a line at module level.
+    """
+    found, names = None, []
+    body = tree.body
+    while True:
+        for node in body:
+            if isinstance(node, _DEFINITIONS) and _definition_start(node) <= lineno <= node.end_lineno:
+                found = node
+                names.append(node.name)
+                body = node.body
+                break
+        else:
+            break
+    return found, ".".join(names) or "<module>"
+
+
+def _module_statement(tree: ast.Module, lineno: int):
+    for node in tree.body:
+        if _definition_start(node) <= lineno <= node.end_lineno:
+            return node
+    return None
+
+
+def frame_window(path: str, lines: list, tree: ast.Module, lineno: int, max_lines: int = None) -> CodeWindow:
+    """
+    Returns the definition enclosing a line, or the module-level statement it belongs to. A window longer than
+    `max_lines` is narrowed to the lines around `lineno`.
+    """
+    start = end = lineno
+    name = "<module>"
+    if tree is not None:
+        node, name = enclosing_definition(tree, lineno)
+        if node is None:
+            node = _module_statement(tree, lineno)
+        if node is not None:
+            start, end = _definition_start(node), node.end_lineno
+    if max_lines is not None and end - start + 1 > max_lines:
+        start = max(start, lineno - max_lines // 2)
+        end = min(end, start + max_lines - 1)
+    return CodeWindow(path, start, end, name, lineno, "".join(lines[start - 1 : end]))
+
+
+def _names_used(tree: ast.Module, windows: list) -> set:
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and any(w.start <= node.lineno <= w.end for w in windows):
+            names.add(node.id)
+    return names
+
+
+def _bound_names(node) -> set:
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return {(alias.asname or alias.name).split(".")[0] for alias in node.names}
+    if isinstance(node, _DEFINITIONS):
+        return {node.name}
+    targets = node.targets if isinstance(node, ast.Assign) else [getattr(node, "target", None)]
+    return {n.id for target in targets if target is not None for n in ast.walk(target) if isinstance(n, ast.Name)}
+
+
+def module_context(tree: ast.Module, lines: list, windows: list) -> str:
+    """
+    Returns the module-level statements that bind the names used in the windows: imports and assignments in full
+    (long assignments shortened), functions and classes by their signature line only.
+    """
+    used = _names_used(tree, windows)
+    parts = []
+    for node in tree.body:
+        start = _definition_start(node)
+        if any(w.start <= start and node.end_lineno <= w.end for w in windows):
+            continue  # Already sent
+        is_future = isinstance(node, ast.ImportFrom) and node.module == "__future__"
+        if not is_future and not _bound_names(node) & used:
+            continue
+        if isinstance(node, _DEFINITIONS):
+            end = node.body[0].lineno - 1 if node.body[0].lineno > node.lineno else node.lineno
+            parts.append("".join(lines[start - 1 : end]).rstrip() + " ...\n")
+        elif node.end_lineno - start + 1 > MAX_ASSIGNMENT_LINES:
+            parts.append(lines[start - 1].rstrip() + " ...\n")
+        else:
+            parts.append("".join(lines[start - 1 : node.end_lineno]))
+    return "".join(parts).rstrip()
+
+
+_repr = reprlib.Repr()
+_repr.maxstring = 120
+_repr.maxother = 120
+_repr.maxlist = _repr.maxtuple = _repr.maxset = _repr.maxdict = 8
+_repr.maxlevel = 3
+
+
+def format_locals(frame_locals: dict) -> str:
+    """Formats the local variables of a frame as `name = repr` lines, skipping modules, functions and classes."""
+    lines = []
+    for name, value in frame_locals.items():
+        if name.startswith("__") or isinstance(value, type) or callable(value) or type(value).__name__ == "module":
+            continue
+        if len(lines) == MAX_LOCALS:
+            lines.append(f"... {len(frame_locals) - MAX_LOCALS} more")
+            break
+        try:
+            text = _repr.repr(value)
+        except Exception as e:
+            text = f"<repr failed: {type(e).__name__}>"
+        if len(text) > MAX_REPR_CHARS:
+            text = text[: MAX_REPR_CHARS - 3] + "..."
+        lines.append(f"{name} = {text}")
+    return "\n".join(lines)
+
+
+def extract_fix_context(exc_traceback, max_tokens: int = DEFAULT_FIX_CONTEXT_TOKENS, model: str = "gpt-4o"):
+    """
+    Collects the code an exception fix needs within a token budget.
+
+    The file to fix is the one of the innermost traceback frame in user code. If it fits the budget it is sent
+    whole, as before. Otherwise the context is assembled by priority until the budget is used up: the definition
+    enclosing the failing line (narrowed to the lines around it if it is too long on its own), the imports and
+    module-level names it uses, the local variables of the traceback frames, and the definitions of the calling
+    frames, innermost first.
+
+    Args:
+        exc_traceback (traceback): The traceback of the exception.
+        max_tokens (int, optional): Token budget for the code, names and variables. Defaults to 6000; None sends
+            the whole file.
+        model (str, optional): The model whose tokenizer is used for counting. Defaults to "gpt-4o".
+
+    Returns:
+        FixContext: The context, or None if the traceback has no frame in a readable file.
+    """
+    frames = user_frames(exc_traceback)
+    if not frames:
+        # Fall back to the innermost frame, wherever it is
+        while exc_traceback is not None and exc_traceback.tb_next is not None:
+            exc_traceback = exc_traceback.tb_next
+        if exc_traceback is None or not os.path.isfile(exc_traceback.tb_frame.f_code.co_filename):
+            return None
+        frames = [(exc_traceback.tb_frame, exc_traceback.tb_lineno)]
+
+    path = frames[-1][0].f_code.co_filename
+    source = read_file(path)
+    context = FixContext(path, source)
+
+    local_parts = []
+    for frame, lineno in reversed(frames):
+        formatted = format_locals(frame.f_locals) if frame.f_code.co_name != "<module>" else ""
+        if formatted:
+            local_parts.append(f"## {frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{lineno})")
+            local_parts.append(formatted)
+    local_variables = "\n".join(local_parts)
+
+    source_tokens = count_tokens(source, model)
+    if max_tokens is None or source_tokens <= max_tokens:
+        context.local_variables = local_variables
+        context.tokens = source_tokens + count_tokens(local_variables, model)
+        return context
+
+    sources = {path: source}
+    trees = {}
+
+    def parsed(file_path):
+        if file_path not in trees:
+            if file_path not in sources:
+                sources[file_path] = read_file(file_path)
+            try:
+                trees[file_path] = ast.parse(sources[file_path])
+            except SyntaxError:
+                trees[file_path] = None
+        return sources[file_path].splitlines(keepends=True), trees[file_path]
+
+    lines, tree = parsed(path)
+    lineno = frames[-1][1]
+    max_lines = None
+    while True:
+        target = frame_window(path, lines, tree, lineno, max_lines)
+        tokens = count_tokens(target.text, model)
+        # The target must leave room for the rest; narrow it until it does
+        if tokens <= max_tokens // 2 or target.end - target.start < 10:
+            break
+        max_lines = (target.end - target.start + 1) // 2 if max_lines is None else max_lines // 2
+    context.target = target
+    remaining = max_tokens - tokens
+
+    if tree is not None:
+        names = module_context(tree, lines, [target])
+        cost = count_tokens(names, model)
+        if cost <= remaining:
+            context.module_context = names
+            remaining -= cost
+
+    cost = count_tokens(local_variables, model)
+    if cost <= remaining:
+        context.local_variables = local_variables
+        remaining -= cost
+
+    seen = {(path, target.start, target.end)}
+    for frame, frame_lineno in reversed(frames[:-1]):
+        frame_path = frame.f_code.co_filename
+        if frame_path == path and target.start <= frame_lineno <= target.end:
+            continue
+        frame_lines, frame_tree = parsed(frame_path)
+        window = frame_window(frame_path, frame_lines, frame_tree, frame_lineno, WINDOW_LINES)
+        cost = count_tokens(window.text, model)
+        if (frame_path, window.start, window.end) in seen or cost > remaining:
+            continue
+        seen.add((frame_path, window.start, window.end))
+        context.frames.append(window)
+        remaining -= cost
+
+    context.tokens = max_tokens - remaining
+    return context
+
+
+def splice(source: str, window: CodeWindow, corrected_code: str) -> str:
+    """
+    Replaces the lines of a window with corrected code, re-indenting it to the indentation of the window.
+
+    Returns:
+        str: The new content of the file.
+    """
+    lines = source.splitlines(keepends=True)
+    original_indent = _indentation(window.text)
+    corrected_lines = corrected_code.strip("\n").splitlines()
+    corrected_indent = _indentation(corrected_code)
+    reindented = []
+    for line in corrected_lines:
+        if line.strip() and line.startswith(corrected_indent):
+            line = original_indent + line[len(corrected_indent) :]
+        reindented.append(line.rstrip() + "\n")
+    return "".join(lines[: window.start - 1] + reindented + lines[window.end :])
+
+
+def _indentation(code: str) -> str:
+    for line in code.splitlines():
+        if line.strip():
+            return line[: len(line) - len(line.lstrip())]
+    return ""
+
+
+def add_imports(source: str, imports: list) -> str:
+    """Adds import statements after the last top-level import of a module, skipping those it already has."""
+    lines = source.splitlines(keepends=True)
+    existing = {line.strip() for line in lines}
+    new = [statement.strip() + "\n" for statement in imports if statement.strip()]
+    new = [statement for statement in dict.fromkeys(new) if statement.strip() not in existing]
+    if not new:
+        return source
+    position = 0
+    try:
+        for node in ast.parse(source).body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                position = node.end_lineno
+    except SyntaxError:
+        pass
+    return "".join(lines[:position] + new + lines[position:])
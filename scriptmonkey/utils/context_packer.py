@@ -0,0 +1,221 @@
+import os
+import re
+
+from .tokens import count_tokens
+
+# Leaves room for the question, the instructions and the answer in gpt-4o's 128k context window
+DEFAULT_MAX_CONTEXT_TOKENS = 100_000
+
+# Packing status of a file
+FULL = "full"
+TRUNCATED = "truncated"
+OMITTED = "omitted"
+
+MIN_SECTION_LINES = 8
+MAX_SECTION_LINES = 120
+MARKER_TOKENS = 16  # Budget reserved for the elision marker that may follow a section
+
+# Words that carry no signal about which part of a file is relevant
+_STOPWORDS = set(
+    (
+        "the and for are but not you all any can had her was one our out has have how its may new now see way "
+        "who did get let put say she too use that with this from they will would there their what about which "
+        "when make like just into than then them these some could other does your where why should file files "
+        "code function please help explain here also want need work works working using used each more most"
+    ).split()
+)
+_WORD_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_PYTHON_BOUNDARY = re.compile(r"(?:async\s+def|def|class)\s|@")
+
+
+class FileSection:
+    """A contiguous range of lines of a file that is kept or elided as a whole."""
+
+    def __init__(self, start: int, end: int, text: str):
+        self.start = start  # First line, 0-based
+        self.end = end  # Line after the last one
+        self.text = text
+        self.tokens = 0
+        self.score = 0.0
+
+
+class PackedFile:
+    """The content of a file as it is sent to the model, with its token accounting."""
+
+    def __init__(self, path: str, content: str, tokens: int, packed_content: str, packed_tokens: int, status: str):
+        self.path = path
+        self.content = content
+        self.tokens = tokens
+        self.packed_content = packed_content
+        self.packed_tokens = packed_tokens
+        self.status = status
+
+
+def extract_keywords(question: str) -> set:
+    """Returns the lower-cased identifiers and words of a question that are useful to rank file sections."""
+    keywords = set()
+    for word in _WORD_PATTERN.findall(question):
+        if len(word) >= 3 and word.lower() not in _STOPWORDS:
+            keywords.add(word.lower())
+    return keywords
+
+
+def split_sections(path: str, content: str) -> list:
+    """
+    Splits a file into sections at natural boundaries: top-level definitions for Python files, blank lines for
+    everything else. Sections have between MIN_SECTION_LINES and MAX_SECTION_LINES lines where possible.
+    """
+    lines = content.splitlines(keepends=True)
+    is_python = path.endswith(".py")
+
+    sections = []
+    start = 0
+    for index in range(1, len(lines) + 1):
+        if index < len(lines):
+            length = index - start
+            if length >= MAX_SECTION_LINES:
+                boundary = True
+            elif length < MIN_SECTION_LINES:
+                boundary = False
+            elif is_python:
+                # Start a section at each top-level definition, keeping decorators with their function
+                boundary = bool(_PYTHON_BOUNDARY.match(lines[index])) and not lines[index - 1].startswith("@")
+            else:
+                boundary = not lines[index - 1].strip() and bool(lines[index].strip())
+            if not boundary:
+                continue
+        sections.append(FileSection(start, index, "".join(lines[start:index])))
+        start = index
+    return sections
+
+
+def _score_section(text: str, keyword_pattern, definition_pattern) -> float:
+    if keyword_pattern is None:
+        return 0.0
+    score = float(len(keyword_pattern.findall(text)))
+    # A definition of a symbol mentioned in the question is worth much more than a mere reference
+    score += 10.0 * len(definition_pattern.findall(text))
+    return score
+
+
+def pack_files(
+    question: str, files: list, max_tokens: int = DEFAULT_MAX_CONTEXT_TOKENS, model: str = "gpt-4o"
+) -> list:
+    """
+    Fits the content of files into a token budget, keeping the parts that are most relevant to a question.
+
+    When everything fits, the files are returned unchanged. Otherwise every file is split into sections, sections
+    are ranked by how often they mention (and whether they define) the identifiers and words of the question, with
+    files named in the question ranked first, and the best sections are kept until the budget is used up. Elided
+    regions are replaced with explicit "... [N lines elided] ..." markers.
+
+    Args:
+        question (str): The question the files are context for.
+        files (list): (path, content) tuples, in the order the user provided them.
+        max_tokens (int, optional): Token budget for all file contents, None for no limit. Defaults to 100000.
+        model (str, optional): The model whose tokenizer is used for counting. Defaults to "gpt-4o".
+
+    Returns:
+        list: A PackedFile for every input file, in the same order.
+    """
+    tokens = [count_tokens(content, model) for _, content in files]
+    if max_tokens is None or sum(tokens) <= max_tokens:
+        return [
+            PackedFile(path, content, count, content, count, FULL)
+            for (path, content), count in zip(files, tokens)
+        ]
+
+    keywords = extract_keywords(question)
+    keyword_pattern = None
+    definition_pattern = None
+    if keywords:
+        alternatives = "|".join(re.escape(keyword) for keyword in sorted(keywords))
+        keyword_pattern = re.compile(rf"\b(?:{alternatives})\b", re.IGNORECASE)
+        definition_pattern = re.compile(
+            rf"\b(?:def|class|function|func|fn|interface|struct|type|const|let|var)\s+(?:{alternatives})\b",
+            re.IGNORECASE,
+        )
+
+    # Files named in the question come first, then the others in the order they were given
+    lowered_question = question.lower()
+
+    def mentioned(path):
+        return os.path.basename(path).lower() in lowered_question or path.lower() in lowered_question
+
+    priorities = sorted(range(len(files)), key=lambda index: (not mentioned(files[index][0]), index))
+
+    file_sections = []
+    for path, content in files:
+        sections = split_sections(path, content)
+        bonus = 2.0 if mentioned(path) else 1.0
+        for section in sections:
+            section.tokens = count_tokens(section.text, model)
+            section.score = bonus * _score_section(section.text, keyword_pattern, definition_pattern)
+        file_sections.append(sections)
+
+    remaining = max_tokens
+    selected = set()
+
+    def select(file_index, section_index):
+        nonlocal remaining
+        section = file_sections[file_index][section_index]
+        cost = section.tokens + MARKER_TOKENS
+        if (file_index, section_index) not in selected and cost <= remaining:
+            selected.add((file_index, section_index))
+            remaining -= cost
+
+    # The head of each file (imports, module docstring) orients the model, so it is kept first
+    for file_index in priorities:
+        if file_sections[file_index]:
+            select(file_index, 0)
+
+    # Then the most relevant sections; irrelevant ones fill the rest of the budget in file and line order
+    priority_rank = {file_index: rank for rank, file_index in enumerate(priorities)}
+    ranked = sorted(
+        (
+            (-section.score, priority_rank[file_index], section_index, file_index)
+            for file_index, sections in enumerate(file_sections)
+            for section_index, section in enumerate(sections)
+        )
+    )
+    for _, _, section_index, file_index in ranked:
+        select(file_index, section_index)
+
+    packed_files = []
+    for file_index, ((path, content), sections) in enumerate(zip(files, file_sections)):
+        kept = [index for index in range(len(sections)) if (file_index, index) in selected]
+        if len(kept) == len(sections):
+            packed_files.append(PackedFile(path, content, tokens[file_index], content, tokens[file_index], FULL))
+            continue
+        if not kept:
+            packed_files.append(PackedFile(path, content, tokens[file_index], "", 0, OMITTED))
+            continue
+
+        parts = []
+        elided_start = None
+        for index, section in enumerate(sections):
+            if (file_index, index) in selected:
+                if elided_start is not None:
+                    parts.append(_elision_marker(elided_start, section.start))
+                    elided_start = None
+                if parts and not parts[-1].endswith("\n"):
+                    parts.append("\n")
+                parts.append(section.text)
+            elif elided_start is None:
+                elided_start = section.start
+        if elided_start is not None:
+            if parts and not parts[-1].endswith("\n"):
+                parts.append("\n")
+            parts.append(_elision_marker(elided_start, sections[-1].end))
+
+        packed_content = "".join(parts)
+        packed_files.append(
+            PackedFile(
+                path, content, tokens[file_index], packed_content, count_tokens(packed_content, model), TRUNCATED
+            )
+        )
+    return packed_files
+
+
+def _elision_marker(start: int, end: int) -> str:
+    return f"... [{end - start} lines elided: lines {start + 1}-{end}] ...\n"
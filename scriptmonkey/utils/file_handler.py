@@ -1,12 +1,7 @@
 import os
 
-import pyperclip
-from rich.console import Console
-
 from .tree import create_tree
-
-
-console = Console()
+from ..telemetry import traced
 
 
 def copy_files_to_clipboard(file_paths, include_tree=True):
@@ -14,6 +9,11 @@ def copy_files_to_clipboard(file_paths, include_tree=True):
     Reads the content from the specified files and copies it to the clipboard in the specified format.
     Optionally includes a project directory tree.
     """
+    # Imported here so that reading and writing files does not pay for the clipboard and rich imports
+    import pyperclip
+    from rich.console import Console
+
+    console = Console()
     formatted_output = "- - - - - - - - - -\nHere are some details about the project.\n\n"
 
     for path in file_paths:
@@ -37,6 +37,7 @@ def copy_files_to_clipboard(file_paths, include_tree=True):
     console.print("[green]🐒 Content has been copied to the clipboard.[/green]")
 
 
+@traced("read_file")
 def read_file(path: str) -> str:
     """Loads a file and returns the content.
 
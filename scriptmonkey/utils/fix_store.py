@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import hashlib
+import threading
+
+FIX_STORE_FILE = os.path.expanduser("~/.scriptmonkey_fixes.sqlite")
+DEFAULT_LEASE = 300  # Seconds a process may take to fix an error before another one takes over
+DEFAULT_TTL = 7 * 24 * 60 * 60  # Fixes are forgotten after 7 days
+POLL_INTERVAL = 0.25  # Seconds between checks while waiting for another process's fix
+
+# States of a fingerprint in the store
+PENDING = "pending"  # A process is requesting the fix
+DONE = "done"  # Fixed: the entry holds the fix and the content of the file before and after it
+FAILED = "failed"  # The process that tried could not fix it; retried once the lease has passed
+OWNER = "owner"  # Returned by FixStore.claim() to the process that must request the fix
+
+
+def content_hash(content: str) -> str:
+    """Returns the SHA-256 hex digest of a text."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def fix_fingerprint(exc_type, exc_traceback, fix_context) -> tuple:
+    """
+    Identifies an error independently of the process it happened in, so every process that hits the same bug
+    agrees on it.
+
+    The signature is the exception type and the file and function of every user frame. Line numbers and messages
+    are left out, since they change when code above moves or with the data that triggered the error. The
+    fingerprint adds a hash of the code that raised the error (the code sent for the fix).
+
+    Args:
+        exc_type (type): The exception type.
+        exc_traceback (traceback): The traceback of the exception.
+        fix_context (FixContext): The code around the error, from extract_fix_context.
+
+    Returns:
+        tuple: The signature and the fingerprint, as hex digests.
+    """
+    from .code_context import user_frames
+
+    frames = [
+        [os.path.realpath(frame.f_code.co_filename), getattr(frame.f_code, "co_qualname", frame.f_code.co_name)]
+        for frame, _ in user_frames(exc_traceback)
+    ]
+    signature = content_hash(json.dumps([f"{exc_type.__module__}.{exc_type.__qualname__}", frames]))
+    code = fix_context.target.text if fix_context.target is not None else fix_context.source
+    return signature, content_hash(f"{signature}:{content_hash(code)}")
+
+
+class FixStore:
+    """
+    Fixes of errors shared by every process on the machine, backed by SQLite, so a bug that fires in many workers
+    at once is fixed by one of them.
+
+    The first process to claim a fingerprint requests the fix; the others wait until it is done and reuse it. A
+    process that dies while fixing loses its claim after `lease` seconds, and a failed fix is retried after as
+    long. Fixes are kept for `ttl` seconds. The database runs in WAL mode and claims are taken in an immediate
+    transaction, so two processes never both own a fingerprint.
+
+    Usage:
+        state, entry = store.claim(fingerprint)
+        if state == OWNER:
+            ...  # request and apply the fix
+            store.complete(fingerprint, signature, path, before, after, solution)
+    """
+
+    def __init__(self, path: str = FIX_STORE_FILE, lease: float = DEFAULT_LEASE, ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.lease = lease
+        self.ttl = ttl
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS fixes ("
+            "fingerprint TEXT PRIMARY KEY, signature TEXT, status TEXT NOT NULL, owner TEXT, claimed REAL NOT NULL, "
+            "path TEXT, before_hash TEXT, after_hash TEXT, after_content TEXT, solution TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS fixes_applied ON fixes (signature, path, after_hash)")
+
+    @staticmethod
+    def _owner() -> str:
+        # Threads of a process can hit the same error too, so each thread is a separate owner
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads, so every thread gets its own
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _entry(row) -> dict:
+        if row is None:
+            return None
+        status, owner, path, before_hash, after_hash, after_content, solution = row
+        return {
+            "status": status,
+            "owner": owner,
+            "path": path,
+            "before_hash": before_hash,
+            "after_hash": after_hash,
+            "after_content": after_content,
+            "solution": json.loads(solution) if solution else None,
+        }
+
+    def find_applied(self, signature: str, path: str, current_hash: str) -> dict:
+        """
+        Returns the fix of an error with this signature that left the file exactly as it is now, i.e. a fix that
+        was already applied, e.g. by another process while this one was still running the old code.
+        """
+        row = (
+            self._connection()
+            .execute(
+                "SELECT status, owner, path, before_hash, after_hash, after_content, solution FROM fixes "
+                "WHERE signature = ? AND path = ? AND after_hash = ? AND status = ? AND claimed > ?",
+                (signature, path, current_hash, DONE, time.time() - self.ttl),
+            )
+            .fetchone()
+        )
+        return self._entry(row)
+
+    def claim(self, fingerprint: str) -> tuple:
+        """
+        Claims the fix of a fingerprint, or waits for the process that owns it, at most until its lease expires.
+
+        Args:
+            fingerprint (str): The fingerprint of the error.
+
+        Returns:
+            tuple: (OWNER, None) if this process must request the fix, or (DONE or FAILED, entry) with the outcome
+                of the process that did.
+        """
+        conn = self._connection()
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT status, owner, path, before_hash, after_hash, after_content, solution, claimed "
+                    "FROM fixes WHERE fingerprint = ?",
+                    (fingerprint,),
+                ).fetchone()
+                if row is None or now - row[7] > (self.ttl if row[0] == DONE else self.lease):
+                    conn.execute(
+                        "INSERT OR REPLACE INTO fixes (fingerprint, status, owner, claimed) VALUES (?, ?, ?, ?)",
+                        (fingerprint, PENDING, self._owner(), now),
+                    )
+                    conn.execute("COMMIT")
+                    return OWNER, None
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if row[0] != PENDING:
+                return row[0], self._entry(row[:7])
+            time.sleep(POLL_INTERVAL)
+
+    def complete(self, fingerprint: str, signature: str, path: str, before: str, after: str, solution: dict) -> None:
+        """Records the fix of a claimed fingerprint: the file before and after it, and the model's explanation."""
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO fixes (fingerprint, signature, status, owner, claimed, path, before_hash, "
+            "after_hash, after_content, solution) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                fingerprint,
+                signature,
+                DONE,
+                self._owner(),
+                now,
+                path,
+                content_hash(before),
+                content_hash(after),
+                after,
+                json.dumps(solution),
+            ),
+        )
+        conn.execute("DELETE FROM fixes WHERE status != ? AND claimed < ?", (PENDING, now - self.ttl))
+
+    def fail(self, fingerprint: str) -> None:
+        """Records that a claimed fingerprint could not be fixed, so the waiting processes do not retry it."""
+        self._connection().execute(
+            "UPDATE fixes SET status = ?, claimed = ? WHERE fingerprint = ? AND owner = ?",
+            (FAILED, time.time(), fingerprint, self._owner()),
+        )
+
+    def release(self, fingerprint: str) -> None:
+        """Gives up a claim without an outcome, e.g. on an API error, so the next process can try."""
+        self._connection().execute(
+            "DELETE FROM fixes WHERE fingerprint = ? AND owner = ? AND status = ?",
+            (fingerprint, self._owner(), PENDING),
+        )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_fix_store():
+    """
+    Returns the fix store of this machine, at SCRIPTMONKEY_FIX_STORE or "~/.scriptmonkey_fixes.sqlite", or None
+    if it is disabled with SCRIPTMONKEY_FIX_STORE=off or cannot be opened.
+    """
+    global _store
+    path = os.getenv("SCRIPTMONKEY_FIX_STORE", FIX_STORE_FILE)
+    if path.lower() in ("off", "0", "false", "none", ""):
+        return None
+    with _store_lock:
+        if _store is None or _store.path != path:
+            try:
+                _store = FixStore(path)
+            except sqlite3.Error:
+                return None
+        return _store
@@ -0,0 +1,237 @@
+import os
+import re
+
+# Ignore files that are honored in every directory of a traversal
+IGNORE_FILES = (".gitignore", ".scriptmonkeyignore")
+
+
+def find_git_root(path: str):
+    """Returns the closest directory at or above `path` that contains a `.git` entry, or None."""
+    path = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(path, ".git")):
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _translate(pattern: str) -> str:
+    """Translates the body of a gitignore pattern (no negation, anchoring or trailing slash) to a regex."""
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            # "**/" matches zero or more directories
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            # A trailing "/**" (or a lone "**") matches everything inside
+            regex += ".*"
+            i += 2
+        elif char == "*":
+            regex += "[^/]*"
+            i += 1
+        elif char == "?":
+            regex += "[^/]"
+            i += 1
+        elif char == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                regex += re.escape(char)
+                i += 1
+            else:
+                body = pattern[i + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                regex += "[" + body.replace("\\", "\\\\") + "]"
+                i = end + 1
+        elif char == "\\" and i + 1 < len(pattern):
+            regex += re.escape(pattern[i + 1])
+            i += 2
+        else:
+            regex += re.escape(char)
+            i += 1
+    return regex
+
+
+class IgnoreRule:
+    """A single compiled gitignore pattern."""
+
+    def __init__(self, pattern: str):
+        self.negate = pattern.startswith("!")
+        if self.negate:
+            pattern = pattern[1:]
+        elif pattern.startswith("\\!") or pattern.startswith("\\#"):
+            pattern = pattern[1:]
+
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+
+        # Patterns with a slash (other than a trailing one) are relative to the ignore file's directory,
+        # all other patterns match a name at any depth
+        self.anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        self.source = _translate(pattern)
+        self.regex = re.compile(self.source + r"\Z", re.DOTALL)
+
+    def matches(self, relative_path: str, name: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        return self.regex.match(relative_path if self.anchored else name) is not None
+
+
+class IgnoreRuleSet:
+    """The compiled rules of one ignore file, relative to the directory they apply to."""
+
+    def __init__(self, base: str, lines):
+        self.base = os.path.abspath(base)
+        self.prefix = self.base + os.sep
+        self.rules = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip("\r")
+            # Trailing spaces are ignored unless escaped
+            if not line.endswith("\\ "):
+                line = line.rstrip(" ")
+            if not line or line.startswith("#"):
+                continue
+            self.rules.append(IgnoreRule(line))
+
+        self.has_anchored = any(rule.anchored for rule in self.rules)
+        self.combined = None
+        if self.rules and not any(rule.negate for rule in self.rules):
+            # Without negations the order of the rules does not matter, so they are merged into one regex
+            # per kind of match: (name or relative path) x (files or directories)
+            self.combined = {}
+            for anchored in (False, True):
+                for is_dir in (False, True):
+                    sources = [
+                        rule.source
+                        for rule in self.rules
+                        if rule.anchored == anchored and (is_dir or not rule.dir_only)
+                    ]
+                    if sources:
+                        pattern = "|".join(f"(?:{source})" for source in sources)
+                        self.combined[anchored, is_dir] = re.compile(f"(?:{pattern})\\Z", re.DOTALL)
+
+    @classmethod
+    def from_file(cls, base: str, path: str):
+        """Loads the rules of an ignore file, returning None if it does not exist or has no rules."""
+        try:
+            with open(path, "r", errors="replace") as f:
+                rule_set = cls(base, f.readlines())
+        except OSError:
+            return None
+        return rule_set if rule_set.rules else None
+
+    def match(self, path: str, name: str, is_dir: bool):
+        """Returns True if the last matching rule ignores the path, False if it re-includes it, None if none match."""
+        if not path.startswith(self.prefix):
+            return None
+        relative_path = path[len(self.prefix) :].replace(os.sep, "/") if self.has_anchored else None
+
+        if self.combined is not None:
+            regex = self.combined.get((False, is_dir))
+            if regex is not None and regex.match(name):
+                return True
+            regex = self.combined.get((True, is_dir))
+            if regex is not None and regex.match(relative_path):
+                return True
+            return None
+
+        for rule in reversed(self.rules):
+            if rule.matches(relative_path, name, is_dir):
+                return not rule.negate
+        return None
+
+
+class IgnoreMatcher:
+    """
+    Decides which paths of a directory tree are ignored by `.gitignore` files, `.git/info/exclude` and
+    `.scriptmonkeyignore` files.
+
+    Patterns are compiled once per ignore file. A matcher is immutable: descending into a directory that has its
+    own ignore files returns a new matcher with those rules added, so nested rules only apply to their subtree
+    and later rules take precedence, like in git.
+
+    Usage:
+        matcher = IgnoreMatcher.for_root("path/to/project")
+        matcher.is_ignored("path/to/project/build", is_dir=True)
+    """
+
+    def __init__(self, rule_sets=()):
+        self.rule_sets = tuple(rule_sets)
+
+    @classmethod
+    def for_root(cls, root: str):
+        """Builds the matcher that applies inside `root`, including the rules of the enclosing git repository."""
+        return cls.for_parents_of(root).for_directory(root)
+
+    @classmethod
+    def for_parents_of(cls, root: str):
+        """
+        Builds the matcher of the directories above `root`: `.git/info/exclude` and the ignore files between the
+        enclosing git repository's root and `root` (exclusive). Without a git repository the matcher is empty.
+        """
+        root = os.path.abspath(root)
+        git_root = find_git_root(root)
+        rule_sets = []
+
+        if git_root is not None:
+            exclude = IgnoreRuleSet.from_file(git_root, os.path.join(git_root, ".git", "info", "exclude"))
+            if exclude is not None:
+                rule_sets.append(exclude)
+
+            relative_root = os.path.relpath(root, git_root)
+            if relative_root != ".":
+                parts = relative_root.split(os.sep)
+                directories = [git_root] + [os.path.join(git_root, *parts[: i + 1]) for i in range(len(parts) - 1)]
+                for directory in directories:
+                    rule_sets.extend(cls._load_directory(directory))
+
+        return cls(rule_sets)
+
+    @staticmethod
+    def _load_directory(directory: str, names=None) -> list:
+        rule_sets = []
+        for ignore_file in IGNORE_FILES:
+            if names is not None and ignore_file not in names:
+                continue
+            rule_set = IgnoreRuleSet.from_file(directory, os.path.join(directory, ignore_file))
+            if rule_set is not None:
+                rule_sets.append(rule_set)
+        return rule_sets
+
+    def for_directory(self, directory: str, names=None):
+        """
+        Returns the matcher that applies inside `directory`.
+
+        Args:
+            directory (str): The directory being entered.
+            names (set, optional): The entry names of the directory, if already listed, to avoid probing for
+                ignore files that do not exist.
+
+        Returns:
+            IgnoreMatcher: This matcher if the directory has no ignore files, otherwise an extended one.
+        """
+        rule_sets = self._load_directory(os.path.abspath(directory), names)
+        if not rule_sets:
+            return self
+        return IgnoreMatcher(self.rule_sets + tuple(rule_sets))
+
+    def is_ignored(self, path: str, is_dir: bool = False) -> bool:
+        """Returns True if the path is excluded by the rules. The path's parents are assumed not to be ignored."""
+        if not self.rule_sets:
+            return False
+        path = os.path.abspath(path)
+        return self.is_ignored_entry(path, os.path.basename(path), is_dir)
+
+    def is_ignored_entry(self, path: str, name: str, is_dir: bool) -> bool:
+        """Like is_ignored, for an absolute, normalized path whose name is already known (e.g. from os.scandir)."""
+        for rule_set in reversed(self.rule_sets):
+            result = rule_set.match(path, name, is_dir)
+            if result is not None:
+                return result
+        return False
@@ -0,0 +1,88 @@
+import json
+
+
+class JsonArrayStream:
+    """
+    Extracts the objects of an array from a JSON document while it is being streamed, e.g. the `files` of a project
+    blueprint, so each one can be used as soon as it is complete rather than when the whole document is.
+
+    Only the array of `key` in the top-level object is read. The document itself is not validated; parse it once
+    it is complete for that.
+
+    Usage:
+        parser = JsonArrayStream("files")
+        for chunk in chunks:
+            for project_file in parser.feed(chunk):
+                ...
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.text = ""
+        self.position = 0  # Next character to scan
+        self.depth = 0  # Nesting of objects and arrays at `position`
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.last_string = None  # The last complete string, which is the key when a ':' follows
+        self.expect_array = False  # The key was just read; its value follows
+        self.array_depth = None  # Depth inside the array, once it has started
+        self.item_start = None
+        self.done = False
+
+    def feed(self, chunk: str) -> list:
+        """
+        Adds the next chunk of the document.
+
+        Returns:
+            list: The objects of the array that were completed by this chunk, in order.
+        """
+        self.text += chunk
+        items = []
+        text = self.text
+        for position in range(self.position, len(text)):
+            character = text[position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif character == "\\":
+                    self.escaped = True
+                elif character == '"':
+                    self.in_string = False
+                    self.last_string = text[self.string_start : position + 1]
+                continue
+            if self.done or character in " \t\r\n":
+                continue
+
+            if self.expect_array:
+                self.expect_array = False
+                if character == "[":
+                    self.depth += 1
+                    self.array_depth = self.depth
+                    continue
+
+            if character == '"':
+                self.in_string = True
+                self.string_start = position
+            elif character == ":":
+                if self.depth == 1 and self.array_depth is None and self._is_key():
+                    self.expect_array = True
+            elif character in "{[":
+                if character == "{" and self.depth == self.array_depth:
+                    self.item_start = position
+                self.depth += 1
+            elif character in "}]":
+                self.depth -= 1
+                if character == "}" and self.depth == self.array_depth and self.item_start is not None:
+                    items.append(json.loads(text[self.item_start : position + 1]))
+                    self.item_start = None
+                elif self.array_depth is not None and self.depth == self.array_depth - 1:
+                    self.done = True
+        self.position = len(text)
+        return items
+
+    def _is_key(self) -> bool:
+        try:
+            return json.loads(self.last_string) == self.key
+        except (TypeError, ValueError):
+            return False
@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+import threading
+
+MANIFEST_DIR = ".scriptmonkey"
+MANIFEST_FILE = "manifest.json"
+# Manifest key of the README written from the whole blueprint, apart from the blueprint's own entries
+README_KEY = f"{MANIFEST_DIR}/README"
+
+# File states reported by BuildManifest.status()
+MISSING = "missing"  # Never generated and not on disk
+FAILED = "failed"  # A previous generation failed or was interrupted
+CHANGED = "changed"  # The blueprint entry changed since the file was generated
+DONE = "done"  # Generated from the current blueprint entry and untouched since
+MODIFIED = "modified"  # Generated by ScriptMonkey, then edited locally
+UNTRACKED = "untracked"  # Exists on disk but was not created by ScriptMonkey
+
+NEEDS_BUILD = {MISSING, FAILED, CHANGED}
+
+
+def hash_text(text: str) -> str:
+    """Returns the SHA-256 hex digest of a string."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def hash_entry(entry) -> str:
+    """Returns a stable SHA-256 hex digest of a JSON-serializable blueprint entry."""
+    return hash_text(json.dumps(entry, sort_keys=True, default=str))
+
+
+class BuildManifest:
+    """
+    Tracks which files of a generated project are finished so an interrupted or repeated build can resume.
+
+    The manifest lives at `<base_directory>/.scriptmonkey/manifest.json` and stores, for every file, the hash of
+    the blueprint entry it was generated from, the hash of the content that was written and its status. It also
+    keeps the blueprint itself so a rerun with the same project description reuses it instead of planning again.
+    """
+
+    def __init__(self, base_directory: str):
+        self.path = os.path.join(base_directory, MANIFEST_DIR, MANIFEST_FILE)
+        self.lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data.setdefault("files", {})
+        return data
+
+    def save(self) -> None:
+        """Atomically writes the manifest to disk."""
+        with self.lock:
+            self._save()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+    def get_blueprint(self, project_description: str):
+        """Returns the saved blueprint if it was generated for the same project description, otherwise None."""
+        if self.data.get("description_hash") != hash_text(project_description):
+            return None
+        return self.data.get("blueprint")
+
+    def set_blueprint(self, project_description: str, blueprint: dict) -> None:
+        """Saves the blueprint generated for a project description."""
+        with self.lock:
+            self.data["description_hash"] = hash_text(project_description)
+            self.data["blueprint"] = blueprint
+            self._save()
+
+    def status(self, entry: dict, file_path: str) -> str:
+        """
+        Determines whether a file has to be (re)generated, without making any network call.
+
+        Args:
+            entry (dict): The blueprint entry for the file. Its 'path' is used as the manifest key.
+            file_path (str): Where the file lives on disk.
+
+        Returns:
+            str: One of MISSING, FAILED, CHANGED, DONE, MODIFIED or UNTRACKED. Only the states in NEEDS_BUILD
+                should be regenerated.
+        """
+        with self.lock:
+            record = self.data["files"].get(entry["path"])
+        exists = os.path.exists(file_path)
+
+        if record is None:
+            return UNTRACKED if exists else MISSING
+        if record.get("status") != DONE:
+            return FAILED
+        if not exists:
+            return MISSING
+
+        try:
+            with open(file_path, "r") as f:
+                content_hash = hash_text(f.read())
+        except (OSError, UnicodeDecodeError):
+            content_hash = None
+
+        if content_hash != record.get("content_hash"):
+            # Never overwrite a file the user edited after it was generated
+            return MODIFIED
+        if record.get("entry_hash") != hash_entry(entry):
+            return CHANGED
+        return DONE
+
+    def mark(self, entry: dict, status: str, content: str = None) -> None:
+        """Records the state of a file and persists the manifest immediately."""
+        record = {"entry_hash": hash_entry(entry), "status": status}
+        if content is not None:
+            record["content_hash"] = hash_text(content)
+        with self.lock:
+            self.data["files"][entry["path"]] = record
+            self._save()
@@ -0,0 +1,146 @@
+import os
+import ast
+import tempfile
+
+
+class PatchError(Exception):
+    """Raised when edits cannot be applied to a file; the file is left untouched."""
+
+
+def _find_exact(source: str, search: str) -> list:
+    positions = []
+    position = source.find(search)
+    while position != -1:
+        positions.append((position, position + len(search), ""))
+        position = source.find(search, position + 1)
+    return positions
+
+
+def _find_loose(source: str, search: str) -> list:
+    """
+    Finds the search text line by line, ignoring trailing whitespace and a uniform difference in indentation, the
+    two ways models most often misquote code.
+
+    Returns:
+        list: (start offset, end offset, indentation to add to the replacement) of every match.
+    """
+    lines = source.splitlines(keepends=True)
+    search_lines = search.strip("\n").splitlines()
+    if not search_lines:
+        return []
+    search_indent = _indentation(search_lines)
+    stripped = [line[len(search_indent) :].rstrip() if line.strip() else "" for line in search_lines]
+
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+
+    matches = []
+    for first in range(len(lines) - len(search_lines) + 1):
+        indent = None
+        for offset, expected in enumerate(stripped):
+            line = lines[first + offset].rstrip()
+            if not expected:
+                if line.strip():
+                    break
+                continue
+            if indent is None:
+                indent = line[: len(line) - len(line.lstrip())]
+            if line != indent + expected:
+                break
+        else:
+            matches.append((offsets[first], offsets[first + len(search_lines)], indent or ""))
+    return matches
+
+
+def _indentation(lines: list) -> str:
+    indents = [line[: len(line) - len(line.lstrip())] for line in lines if line.strip()]
+    if not indents:
+        return ""
+    shortest = min(indents, key=len)
+    return shortest if all(indent.startswith(shortest) for indent in indents) else ""
+
+
+def _reindent(text: str, indent: str) -> str:
+    lines = text.strip("\n").splitlines()
+    base = _indentation(lines)
+    return "".join(indent + line[len(base) :] + "\n" if line.strip() else "\n" for line in lines)
+
+
+def _line_of(source: str, offset: int) -> int:
+    return source.count("\n", 0, offset) + 1
+
+
+def apply_edits(source: str, edits: list, region: tuple = None, path: str = None) -> str:
+    """
+    Applies search/replace edits to the content of a file, all or nothing.
+
+    Each edit replaces one occurrence of its `search` text with its `replace` text. The search text is matched
+    exactly first, then line by line ignoring trailing whitespace and indentation (the replacement is then
+    re-indented to match). A search text must identify a single location; when it occurs several times, only the
+    occurrences within `region` are considered. Python files must still parse after the edits.
+
+    Args:
+        source (str): The current content of the file.
+        edits (list): Dicts with "search" and "replace" keys, applied in order.
+        region (tuple, optional): (first line, last line), 1-based, of the code the edits were written against.
+            Defaults to None.
+        path (str, optional): Path of the file, used to decide whether to check the syntax. Defaults to None.
+
+    Raises:
+        PatchError: If there are no edits, an edit does not match exactly one location, or the result does not
+            parse.
+
+    Returns:
+        str: The edited content.
+    """
+    if not edits:
+        raise PatchError("the patch has no edits")
+
+    for number, edit in enumerate(edits, start=1):
+        search, replace = edit["search"], edit["replace"]
+        if not search.strip():
+            raise PatchError(f"edit {number} has an empty search text")
+        matches = _find_exact(source, search) or _find_loose(source, search)
+        if len(matches) > 1 and region is not None:
+            matches = [match for match in matches if region[0] <= _line_of(source, match[0]) <= region[1]]
+        if not matches:
+            raise PatchError(f"the search text of edit {number} was not found")
+        if len(matches) > 1:
+            raise PatchError(f"the search text of edit {number} occurs {len(matches)} times")
+
+        start, end, indent = matches[0]
+        if indent or source[start:end] != search:
+            # A loose match replaces whole lines
+            replace = _reindent(replace, indent) if replace.strip() else ""
+        source = source[:start] + replace + source[end:]
+
+    if path is None or path.endswith(".py"):
+        try:
+            ast.parse(source)
+        except SyntaxError as e:
+            raise PatchError(f"the patched code does not parse: {e}") from e
+    return source
+
+
+def write_file_atomic(path: str, content: str) -> None:
+    """
+    Writes a file by replacing it with a fully written temporary file, so it is never left half written, and keeps
+    its permissions.
+
+    Args:
+        path (str): Path to the file.
+        content (str): Content to write to file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=".scriptmonkey-", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w") as file:
+            file.write(content)
+        if os.path.exists(path):
+            os.chmod(temporary_path, os.stat(path).st_mode & 0o7777)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
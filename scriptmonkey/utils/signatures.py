@@ -0,0 +1,83 @@
+import os
+import ast
+
+MAX_PREVIEW_LINES = 30  # Lines of a non-Python file shown instead of signatures
+MAX_CONSTANT_CHARS = 120  # Longer module-level constants are cut
+
+
+def python_signatures(content: str) -> str:
+    """
+    Returns the public interface of a Python module: the signatures of its public functions and classes with the
+    first line of their docstrings, methods included, and its module-level constants. Bodies are replaced with
+    `...`.
+
+    Returns:
+        str: The signatures, or None if the content does not parse.
+    """
+    try:
+        tree = ast.parse(content)
+    except SyntaxError:
+        return None
+    lines = content.splitlines()
+    signatures = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if not node.name.startswith("_"):
+                signatures.extend(_definition_signature(node, lines))
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            if all(isinstance(target, ast.Name) and target.id.isupper() for target in targets):
+                line = lines[node.lineno - 1]
+                signatures.append(line if len(line) <= MAX_CONSTANT_CHARS else line[:MAX_CONSTANT_CHARS] + " ...")
+    return "\n".join(signatures)
+
+
+def _definition_signature(node, lines: list) -> list:
+    start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+    body = node.body[0]
+    if body.lineno == node.end_lineno == node.lineno:
+        # A one-line definition, like `def name(): return value`
+        return lines[start - 1 : node.lineno - 1] + [lines[node.lineno - 1][: body.col_offset].rstrip() + " ..."]
+    signature = lines[start - 1 : body.lineno - 1]
+    indent = " " * (node.col_offset + 4)
+
+    docstring = ast.get_docstring(node)
+    if docstring:
+        signature.append(f'{indent}"""{docstring.strip().splitlines()[0]}"""')
+    if isinstance(node, ast.ClassDef):
+        members = [
+            member
+            for member in node.body
+            if isinstance(member, (ast.FunctionDef, ast.AsyncFunctionDef))
+            and (not member.name.startswith("_") or member.name.startswith("__"))
+        ]
+        for member in members:
+            signature.extend(_definition_signature(member, lines))
+        if not members:
+            signature.append(f"{indent}...")
+    else:
+        signature.append(f"{indent}...")
+    return signature
+
+
+def file_signatures(path: str, content: str) -> str:
+    """
+    Summarizes a generated file for the prompts of the files that use it: signatures for Python files, the first
+    lines for anything else (configuration files, templates, ...).
+
+    Args:
+        path (str): Path of the file, which determines its type.
+        content (str): Content of the file.
+
+    Returns:
+        str: The summary, empty if there is nothing to show.
+    """
+    if os.path.splitext(path)[1] == ".py":
+        signatures = python_signatures(content)
+        if signatures is not None:
+            return signatures
+    lines = content.strip("\n").splitlines()
+    preview = "\n".join(lines[:MAX_PREVIEW_LINES])
+    if len(lines) > MAX_PREVIEW_LINES:
+        preview += f"\n... [{len(lines) - MAX_PREVIEW_LINES} more lines]"
+    return preview
@@ -0,0 +1,39 @@
+from functools import lru_cache
+
+# Rough number of characters per token for English text and code, used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # tiktoken downloads its encodings on first use, which fails offline
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Counts the tokens of a text locally.
+
+    Uses tiktoken when it is installed (`pip install tiktoken`), otherwise estimates about four characters per token.
+
+    Args:
+        text (str): The text to count.
+        model (str, optional): The model whose tokenizer is used. Defaults to "gpt-4o".
+
+    Returns:
+        int: The number of tokens.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
@@ -1,69 +1,153 @@
 import os
 from collections import defaultdict
 
+from .ignore import IgnoreMatcher
+from ..telemetry import traced
 
-def create_tree(start_path, prefix="", max_depth=None, current_depth=0, max_files_per_type=5):
+
+# Lists 6 levels of entries (depths 0-5), which is what the --ask prompt advertises
+DEFAULT_MAX_DEPTH = 5
+# Global budgets for the whole tree, so huge workspaces produce a tree that can still be sent to the model
+DEFAULT_MAX_NODES = 2000
+DEFAULT_MAX_BYTES = 100_000
+
+
+@traced("tree")
+def create_tree(
+    start_path,
+    prefix="",
+    max_depth=DEFAULT_MAX_DEPTH,
+    current_depth=0,
+    max_files_per_type=5,
+    max_nodes=DEFAULT_MAX_NODES,
+    max_bytes=DEFAULT_MAX_BYTES,
+    respect_ignore_files=True,
+):
     """
     Generates a directory tree as a string with options to limit files of the same type,
     ignore directories, and handle critical code files.
+
+    The tree is built iteratively with `os.scandir`, so the type of each entry comes from the cached directory
+    entry and ignored directories are pruned before they are ever stat-ed or opened. Once `max_nodes` entries or
+    `max_bytes` characters have been emitted, every open directory is closed with a "… N more entries" summary.
+
+    Unless `respect_ignore_files` is False, paths excluded by `.gitignore` files (including nested ones and those of
+    the enclosing repository), `.git/info/exclude` and `.scriptmonkeyignore` files are left out as well, and ignored
+    directories are never descended into.
+
+    Args:
+        start_path (str): The directory to list.
+        prefix (str, optional): Prefix for every line of the tree. Defaults to "".
+        max_depth (int, optional): Deepest level whose contents are listed, None for no limit. Defaults to 5.
+        current_depth (int, optional): Depth of `start_path`. Defaults to 0.
+        max_files_per_type (int, optional): Files listed per non-code extension in a directory. Defaults to 5.
+        max_nodes (int, optional): Maximum number of entries in the tree, None for no limit. Defaults to 2000.
+        max_bytes (int, optional): Maximum size of the tree in characters, None for no limit. Defaults to 100000.
+        respect_ignore_files (bool, optional): Whether to honor gitignore-style ignore files. Defaults to True.
+
+    Returns:
+        str: The directory tree, one entry per line.
     """
-    # If max_depth is defined and the current depth exceeds it, stop recursion
+    # If max_depth is defined and the current depth exceeds it, stop
     if max_depth is not None and current_depth > max_depth:
         return ""
 
-    tree = ""
-    files = sorted(os.listdir(start_path))
+    lines = []
+    nodes = 0
+    size = 0
+
+    matcher = IgnoreMatcher.for_parents_of(start_path) if respect_ignore_files else None
+    entries, matcher = _list_directory(os.path.abspath(start_path), max_files_per_type, matcher, strict=True)
+
+    # Each frame is [entries, index of the next entry, prefix, depth, ignore matcher of the directory]
+    stack = [[entries, 0, prefix, current_depth, matcher]]
+    while stack:
+        frame = stack[-1]
+        entries, index, frame_prefix, depth, matcher = frame
+        if index >= len(entries):
+            stack.pop()
+            continue
+
+        if (max_nodes is not None and nodes >= max_nodes) or (max_bytes is not None and size >= max_bytes):
+            # Out of budget: summarize what is left in this directory and close it
+            lines.append(f"{frame_prefix}└── … {len(entries) - index} more entries")
+            stack.pop()
+            continue
+
+        name, path = entries[index]
+        frame[1] = index + 1
+        is_last = index == len(entries) - 1
+
+        line = frame_prefix + ("└── " if is_last else "├── ") + name
+        lines.append(line)
+        nodes += 1
+        size += len(line) + 1
+
+        # Descend into directories that are within the depth limit
+        if path is not None and (max_depth is None or depth + 1 <= max_depth):
+            child_prefix = frame_prefix + ("    " if is_last else "│   ")
+            child_entries, child_matcher = _list_directory(path, max_files_per_type, matcher)
+            stack.append([child_entries, 0, child_prefix, depth + 1, child_matcher])
+
+    return "".join(line + "\n" for line in lines)
+
+
+def _list_directory(path, max_files_per_type, matcher=None, strict=False):
+    """
+    Lists the entries of a directory to display.
+
+    Directories come first, ignored directories and paths excluded by the ignore matcher are dropped, and files of
+    non-code types are limited to `max_files_per_type` per extension with a summary of the omitted ones.
+
+    Returns:
+        tuple: A list of (name, path) tuples, where path is only set for directories, and the ignore matcher that
+            applies inside the directory.
+    """
+    scanned = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                # Prune ignored directories before descending into them
+                if is_dir and entry.name in ignored_dirs:
+                    continue
+                scanned.append((entry.name, entry.path, is_dir))
+    except OSError:
+        # Unreadable subdirectories are shown without contents, only the start directory must be readable
+        if strict:
+            raise
+        return [], matcher
+
+    if matcher is not None:
+        matcher = matcher.for_directory(path, {name for name, _, _ in scanned})
+        scanned = [item for item in scanned if not matcher.is_ignored_entry(item[1], item[0], item[2])]
+
+    directories = [(name, entry_path) for name, entry_path, is_dir in scanned if is_dir]
+    files = [name for name, _, is_dir in scanned if not is_dir]
 
     # Group files by their extensions
     files_by_extension = defaultdict(list)
-    for name in files:
-        if os.path.isdir(os.path.join(start_path, name)):
-            files_by_extension["<dir>"].append(name)
-        else:
-            _, ext = os.path.splitext(name)
-            files_by_extension[ext].append(name)
-
-    # Build a list of files to display
-    display_files = []
+    for name in sorted(files):
+        files_by_extension[os.path.splitext(name)[1]].append(name)
 
     # Add directories first
-    display_files.extend(sorted(files_by_extension["<dir>"]))
+    display = sorted(directories)
 
     # Add files, limiting non-important file types
     for ext, ext_files in files_by_extension.items():
-        if ext == "<dir>":
-            continue
         if ext in important_extensions:
             # Include all files of important types
-            display_files.extend(sorted(ext_files))
+            display.extend((name, None) for name in ext_files)
         else:
             # Limit the number of files to `max_files_per_type` for non-important types
-            display_files.extend(sorted(ext_files)[:max_files_per_type])
+            display.extend((name, None) for name in ext_files[:max_files_per_type])
             if len(ext_files) > max_files_per_type:
-                display_files.append(f"... ({len(ext_files) - max_files_per_type} more {ext} files omitted)")
-
-    # Iterate over the files and directories to build the tree
-    for index, name in enumerate(display_files):
-        path = os.path.join(start_path, name)
-
-        # Skip ignored directories
-        if os.path.isdir(path) and name in ignored_dirs:
-            continue
-
-        connector = "└── " if index == len(display_files) - 1 else "├── "
-        tree += prefix + connector + name + "\n"
-
-        if os.path.isdir(path):
-            new_prefix = prefix + ("    " if index == len(display_files) - 1 else "│   ")
-            tree += create_tree(
-                path,
-                new_prefix,
-                max_depth=max_depth,
-                current_depth=current_depth + 1,
-                max_files_per_type=max_files_per_type,
-            )
+                display.append((f"... ({len(ext_files) - max_files_per_type} more {ext} files omitted)", None))
 
-    return tree
+    return display, matcher
 
 
 ignored_dirs = {
@@ -103,6 +187,7 @@ ignored_dirs = {
     "htmlcov",
     ".mypy_cache",
     ".pytest_cache",
+    ".scriptmonkey",
 }
 
 # Define important file extensions
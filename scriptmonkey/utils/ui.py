@@ -8,10 +8,15 @@ import threading
 import subprocess
 
 import tempfile
+from rich.live import Live
+from rich.text import Text
+from rich.console import Group
 from rich.syntax import Syntax
 from rich.console import Console
 from rich.markdown import Markdown
 
+from ..telemetry import traced
+
 
 console = Console()
 
@@ -32,10 +37,15 @@ class Spinner:
         sys.stdout.flush()
 
     def __enter__(self):
+        # Only a terminal can redraw the line; in a log file or pipe every frame would pile up
+        if not sys.stdout.isatty():
+            return
         self.spin_thread = threading.Thread(target=self.spin)
         self.spin_thread.start()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.spin_thread is None:
+            return
         self.stop_running.set()
         self.spin_thread.join()
 
@@ -120,6 +130,7 @@ def cli_text_editor(mode: str) -> str:
     return user_input.strip()
 
 
+@traced("render")
 def render_response_with_syntax_highlighting(response):
     """
     Render a ChatGPT response with syntax highlighting for detected code blocks.
@@ -149,3 +160,110 @@ def render_response_with_syntax_highlighting(response):
     # Print any remaining text after the last code block
     if last_pos < len(response):
         console.print(Markdown(response[last_pos:]))
+
+
+class StreamingRenderer:
+    """
+    Incrementally renders a streamed ChatGPT response with syntax highlighting for code blocks.
+
+    Text between code blocks and the code blocks themselves are printed permanently as soon as they are complete,
+    so only the segment that is still being streamed is re-rendered in a `rich.live` region (at most
+    `refresh_per_second` times per second). The final output matches `render_response_with_syntax_highlighting`:
+    the text before a code block is only printed once the block is closed, because an unterminated block is
+    rendered together with that text as Markdown.
+
+    Usage:
+        with StreamingRenderer() as renderer:
+            for chunk in chatgpt_stream(prompt):
+                renderer.feed(chunk)
+    """
+
+    fence_pattern = re.compile(r"```(\w*)(\n)?")
+
+    def __init__(self, refresh_per_second=8):
+        self.refresh_interval = 1 / refresh_per_second
+        self.buffer = ""  # The segment that is still being streamed
+        self.scan_pos = 0  # Position in the buffer from which to look for the next fence
+        self.language = None  # Language of the open code block, None outside of code blocks
+        self.pre_text = ""  # Text and fence line preceding the open code block
+        self.pre_markdown = None  # The text preceding the open code block, parsed once
+        self.last_update = 0
+        self.live = Live(Text(""), console=console, refresh_per_second=refresh_per_second, transient=True)
+
+    def __enter__(self):
+        self.live.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.live.update(Text(""), refresh=True)
+        self.live.stop()
+        self.finish()
+
+    def feed(self, text: str) -> None:
+        """Adds a chunk of the response and updates the display."""
+        self.buffer += text
+        self._print_complete_segments()
+
+        now = time.monotonic()
+        if now - self.last_update >= self.refresh_interval:
+            self.last_update = now
+            self.live.update(self._pending_renderable())
+
+    def finish(self) -> None:
+        """Prints whatever is left of the response once the stream has ended."""
+        if self.language is not None:
+            # An unterminated code block is not matched by the regex renderer, so it is rendered as Markdown
+            self.buffer = self.pre_text + self.buffer
+            self.language = None
+        if self.buffer:
+            console.print(Markdown(self.buffer))
+        self.buffer = ""
+        self.scan_pos = 0
+
+    def _print_complete_segments(self) -> None:
+        while True:
+            if self.language is None:
+                start = self.buffer.find("```", self.scan_pos)
+                if start == -1:
+                    # Keep scanning from just before the end in case a fence is split across chunks
+                    self.scan_pos = max(0, len(self.buffer) - 2)
+                    return
+
+                match = self.fence_pattern.match(self.buffer, start)
+                if match.group(2) is None:
+                    if match.end() == len(self.buffer):
+                        # The fence line is not complete yet, wait for more text
+                        self.scan_pos = start
+                        return
+                    # Not a code fence (e.g. "```python foo"), keep looking after it
+                    self.scan_pos = start + 1
+                    continue
+
+                self.pre_text = self.buffer[: match.end()]
+                self.pre_markdown = Markdown(self.buffer[:start]) if start > 0 else None
+                self.language = match.group(1) or "text"  # Default to 'text' if no language is specified
+                self.buffer = self.buffer[match.end() :]
+                self.scan_pos = 0
+            else:
+                end = self.buffer.find("```", self.scan_pos)
+                if end == -1:
+                    self.scan_pos = max(0, len(self.buffer) - 2)
+                    return
+
+                syntax = Syntax(f"\n{self.buffer[:end]}", self.language, theme="monokai", line_numbers=False)
+                if self.pre_markdown is not None:
+                    console.print(self.pre_markdown)
+                console.print("\n")
+                console.print(syntax)
+                console.print("\n")
+                self.language = None
+                self.pre_text = ""
+                self.pre_markdown = None
+                self.buffer = self.buffer[end + 3 :]
+                self.scan_pos = 0
+
+    def _pending_renderable(self):
+        if self.language is not None:
+            syntax = Syntax(f"\n{self.buffer}", self.language, theme="monokai", line_numbers=False)
+            return syntax if self.pre_markdown is None else Group(self.pre_markdown, syntax)
+        return Markdown(self.buffer)
@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import traceback
+
+DEFAULT_CANDIDATES = 1  # Fixes requested per error; more than one needs verification, which is opt-in
+DEFAULT_VERIFY_TIMEOUT = 30  # Seconds a candidate may run; one still running by then is inconclusive
+POLL_INTERVAL = 0.05
+# The project is copied once per candidate: refused if the copies would exceed either limit
+MAX_COPY_BYTES = 50 * 1024 * 1024
+MAX_COPY_FILES = 10_000
+
+# Not copied to the sandboxes: version control, environments and caches
+COPY_IGNORE = shutil.ignore_patterns(
+    ".git", ".hg", ".svn", "__pycache__", "*.pyc", ".venv", "venv", "env", "node_modules", ".scriptmonkey", ".tox"
+)
+
+# Set in the sandboxes, where scriptmonkey.run() does nothing, so a candidate's error is not fixed in turn
+VERIFYING_ENV = "SCRIPTMONKEY_VERIFYING"
+
+
+class VerifyError(Exception):
+    """Raised when the fixes of an error cannot be verified, e.g. because there is no entry point to run again."""
+
+
+def failure_point(exc_type, exc_traceback, root: str) -> dict:
+    """
+    Describes where an exception was raised: its type and the innermost frame in a file under `root`, by file
+    and function rather than line, since a fix moves lines.
+    """
+    point = {"type": f"{exc_type.__module__}.{exc_type.__qualname__}", "path": None, "function": None}
+    root = os.path.realpath(root) + os.sep
+    for frame, _ in traceback.walk_tb(exc_traceback):
+        path = os.path.realpath(frame.f_code.co_filename)
+        if path.startswith(root):
+            point["path"] = os.path.relpath(path, root)
+            point["function"] = getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+    return point
+
+
+def entry_point():
+    """
+    Returns how the process was started: the root directory of the program, the script or module that was run,
+    its arguments, and whether it was run as a module (`python -m`).
+
+    The root is the directory of a script, or the directory that contains the top-level package of a module, so
+    the relative imports of `python -m package.main` resolve in the copy too.
+
+    Raises:
+        VerifyError: There is no script or module to run again, e.g. in an interactive session or with
+            `python -c`.
+    """
+    script = sys.argv[0] if sys.argv else ""
+    if not script or script == "-c" or not os.path.isfile(script):
+        raise VerifyError("there is no script to run again")
+    script = os.path.realpath(script)
+    spec = getattr(sys.modules.get("__main__"), "__spec__", None)
+    if spec is None or not spec.name:
+        return os.path.dirname(script), script, sys.argv[1:], False
+
+    root = script
+    for _ in spec.name.split("."):
+        root = os.path.dirname(root)
+    return root, spec.name, sys.argv[1:], True
+
+
+def copy_size(root: str, limit_bytes: int, limit_files: int) -> tuple:
+    """
+    Returns the bytes and the number of files a sandbox copies from `root`, counting only until either limit is
+    exceeded.
+    """
+    size, files = 0, 0
+    for directory, subdirectories, names in os.walk(root):
+        ignored = COPY_IGNORE(directory, subdirectories + names)
+        subdirectories[:] = [name for name in subdirectories if name not in ignored]
+        for name in names:
+            if name in ignored:
+                continue
+            try:
+                size += os.lstat(os.path.join(directory, name)).st_size
+            except OSError:
+                continue
+            files += 1
+            if size > limit_bytes or files > limit_files:
+                return size, files
+    return size, files
+
+
+class Sandbox:
+    """A temporary copy of the root directory of the program, in which a candidate fix is run."""
+
+    def __init__(self, root: str, target: str, arguments: list, module: bool, file_path: str, content: str):
+        self.source_root = root
+        self.directory = tempfile.mkdtemp(prefix="scriptmonkey-verify-")
+        self.root = os.path.join(self.directory, os.path.basename(root) or "project")
+        shutil.copytree(root, self.root, ignore=COPY_IGNORE, symlinks=True)
+        with open(os.path.join(self.root, os.path.relpath(file_path, root)), "w") as file:
+            file.write(content)
+        self.result_path = os.path.join(self.directory, "result.json")
+        self.target = target if module else os.path.join(self.root, os.path.relpath(target, root))
+        self.arguments = arguments
+        self.module = module
+        self.process = None
+
+    def start(self, cwd: str, original: dict) -> None:
+        import subprocess
+
+        # A working directory inside the project is mapped into the copy, so relative paths resolve the same way
+        cwd = os.path.realpath(cwd)
+        if cwd == self.source_root or cwd.startswith(self.source_root + os.sep):
+            cwd = os.path.join(self.root, os.path.relpath(cwd, self.source_root))
+        package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        python_path = [package_parent] + [path for path in [os.getenv("PYTHONPATH")] if path]
+        kind = "module" if self.module else "script"
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "scriptmonkey.verify", self.result_path, self.root, json.dumps(original), kind]
+            + [self.target, *self.arguments],
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(python_path), **{VERIFYING_ENV: "1"}),
+        )
+
+    def outcome(self):
+        """Returns None while the candidate runs, then "ok", or where it failed (see failure_point)."""
+        if self.process.poll() is None:
+            return None
+        try:
+            with open(self.result_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            # Killed, or exited without reaching the end of the runner, e.g. with os._exit()
+            if self.process.returncode == 0:
+                return "ok"
+            return {"type": None, "path": None, "function": None, "reached": False}
+
+    def close(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def verify_candidates(
+    file_path: str, candidates: list, exc_type, exc_traceback, timeout: float = DEFAULT_VERIFY_TIMEOUT
+) -> tuple:
+    """
+    Runs the program again against every candidate fix, each in its own copy of the program's root directory and
+    its own process, all at once, and returns the first candidate that gets past the original error: its run exits
+    cleanly, or it reaches the function that raised the error and then fails elsewhere or with another exception.
+
+    This executes the whole program once per candidate, side effects included: network requests, database writes
+    and files written outside its directory happen again. A run still going after `timeout` seconds is
+    inconclusive and does not count as a pass.
+
+    Args:
+        file_path (str): The file the candidates fix.
+        candidates (list): The new content of the file for every candidate.
+        exc_type (type): The type of the original error.
+        exc_traceback (traceback): The traceback of the original error.
+        timeout (float, optional): Seconds each candidate may run. Defaults to 30.
+
+    Returns:
+        tuple: The index of the passing candidate, or None if none passed, and the outcome of every candidate
+            ("ok", "timeout", or where it failed).
+
+    Raises:
+        VerifyError: The fixes cannot be verified: there is no entry point to run again, the file is not in the
+            program's root directory, or the copies would exceed MAX_COPY_BYTES or MAX_COPY_FILES.
+    """
+    root, target, arguments, module = entry_point()
+    file_path = os.path.realpath(file_path)
+    if not file_path.startswith(root + os.sep):
+        raise VerifyError(f"'{file_path}' is not in the program's directory '{root}'")
+    if root == os.path.dirname(root) or root == os.path.realpath(os.path.expanduser("~")):
+        raise VerifyError(f"the program's directory '{root}' is the home or root directory")
+    size, files = copy_size(root, MAX_COPY_BYTES // len(candidates), MAX_COPY_FILES // len(candidates))
+    if size * len(candidates) > MAX_COPY_BYTES or files * len(candidates) > MAX_COPY_FILES:
+        raise VerifyError(
+            f"copying '{root}' {len(candidates)} times would exceed {MAX_COPY_BYTES // 1024 // 1024} MB "
+            f"or {MAX_COPY_FILES} files"
+        )
+    original = failure_point(exc_type, exc_traceback, root)
+
+    sandboxes = []
+    try:
+        for content in candidates:
+            sandboxes.append(Sandbox(root, target, arguments, module, file_path, content))
+        for sandbox in sandboxes:
+            sandbox.start(os.getcwd(), original)
+
+        outcomes = [None] * len(sandboxes)
+        deadline = time.monotonic() + timeout
+        while True:
+            for number, sandbox in enumerate(sandboxes):
+                if outcomes[number] is None:
+                    outcomes[number] = sandbox.outcome()
+                    if outcomes[number] is not None and _got_past(outcomes[number], original):
+                        return number, outcomes
+            if all(outcome is not None for outcome in outcomes):
+                return None, outcomes
+            if time.monotonic() >= deadline:
+                # Whether the candidates still running fixed the error is unknown
+                return None, ["timeout" if outcome is None else outcome for outcome in outcomes]
+            time.sleep(POLL_INTERVAL)
+    finally:
+        for sandbox in sandboxes:
+            sandbox.close()
+
+
+def _got_past(outcome, original: dict) -> bool:
+    if outcome == "ok":
+        return True
+    if outcome == "timeout" or outcome["type"] is None:
+        return False
+    if not outcome.get("reached"):
+        # Failed before the code that raised the error ran, e.g. on an import
+        return False
+    return (outcome["type"], outcome["path"], outcome["function"]) != (
+        original["type"],
+        original["path"],
+        original["function"],
+    )
+
+
+class _ReachWatcher:
+    """
+    A profile function that records whether the function that raised the original error was called, and removes
+    itself once it was, so the rest of the run is not slowed down.
+    """
+
+    def __init__(self, root: str, original: dict):
+        self.root = os.path.realpath(root) + os.sep
+        self.path = original["path"]
+        self.function = original["function"]
+        self.reached = self.path is None
+        self._paths = {}
+
+    def install(self) -> None:
+        if not self.reached:
+            sys.setprofile(self)
+            threading.setprofile(self)
+
+    def __call__(self, frame, event, arg) -> None:
+        if event != "call":
+            return
+        code = frame.f_code
+        if getattr(code, "co_qualname", code.co_name) != self.function:
+            return
+        path = self._paths.get(code.co_filename)
+        if path is None:
+            real_path = os.path.realpath(code.co_filename)
+            path = os.path.relpath(real_path, self.root) if real_path.startswith(self.root) else ""
+            self._paths[code.co_filename] = path
+        if path == self.path:
+            self.reached = True
+            sys.setprofile(None)
+            threading.setprofile(None)
+
+
+def main(argv: list) -> None:
+    """
+    Runs a script or module like `python script.py` or `python -m module` would, and records whether and where it
+    failed, and whether it reached the function that raised the original error.
+    """
+    import runpy
+
+    result_path, root, original = argv[0], argv[1], json.loads(argv[2])
+    kind, target, arguments = argv[3], argv[4], argv[5:]
+    watcher = _ReachWatcher(root, original)
+    try:
+        watcher.install()
+        if kind == "module":
+            # The copy comes first, so the package is not imported from the original directory
+            sys.argv = [target] + arguments
+            sys.path[0] = root
+            runpy.run_module(target, run_name="__main__", alter_sys=True)
+        else:
+            sys.argv = [target] + arguments
+            sys.path[0] = os.path.dirname(target)
+            runpy.run_path(target, run_name="__main__")
+        outcome = "ok"
+    except SystemExit as e:
+        outcome = "ok" if e.code in (None, 0) else {"type": "SystemExit", "path": None, "function": None}
+    except BaseException as e:
+        outcome = failure_point(type(e), e.__traceback__, root)
+    sys.setprofile(None)
+    if outcome != "ok":
+        outcome["reached"] = watcher.reached
+    with open(result_path, "w") as file:
+        json.dump(outcome, file)
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
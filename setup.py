@@ -12,7 +12,8 @@ setup(
     license="MIT",
     packages=find_packages(),
     install_requires=["openai", "pydantic", "tqdm", "python-dotenv", "rich", "pyperclip"],
-    python_requires=">=3.6",
+    extras_require={"tokens": ["tiktoken"]},
+    python_requires=">=3.9",
     entry_points={
         "console_scripts": [
             "scriptmonkey=scriptmonkey.core:main",
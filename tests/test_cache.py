@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from scriptmonkey.openai_client.cache import ResponseCache
+
+
+def test_concurrent_async_requests_are_coalesced(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "response"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute_async("key", compute) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["response"] * 5
+    assert len(calls) == 1
+    assert cache.get("key") == "response"
+
+
+def test_async_failure_is_shared_and_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        raise ValueError("failed")
+
+    async def main():
+        return await asyncio.gather(
+            *(cache.get_or_compute_async("key", compute) for _ in range(3)), return_exceptions=True
+        )
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(main()))
+    assert cache.get("key") is None
+
+
+def test_cancelled_first_request_is_sent_again_by_the_next(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return "response"
+
+    async def main():
+        first = asyncio.ensure_future(cache.get_or_compute_async("key", compute))
+        await asyncio.sleep(0.05)
+        second = asyncio.ensure_future(cache.get_or_compute_async("key", compute))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "response"
+    assert len(calls) == 2
@@ -0,0 +1,66 @@
+import threading
+
+from scriptmonkey.utils.fix_store import DONE, FAILED, OWNER, FixStore
+
+
+def test_first_claim_owns_the_fingerprint(tmp_path):
+    store = FixStore(str(tmp_path / "fixes.sqlite"))
+    assert store.claim("fingerprint") == (OWNER, None)
+
+
+def test_waiting_claim_returns_the_completed_fix(tmp_path):
+    path = str(tmp_path / "fixes.sqlite")
+    store = FixStore(path)
+    assert store.claim("fingerprint")[0] == OWNER
+
+    results = []
+    # Another thread is another owner, like another process
+    waiter = threading.Thread(target=lambda: results.append(FixStore(path).claim("fingerprint")))
+    waiter.start()
+    store.complete("fingerprint", "signature", "module.py", "before", "after", {"solution": "Fixed."})
+    waiter.join(timeout=10)
+
+    state, entry = results[0]
+    assert state == DONE
+    assert entry["after_content"] == "after"
+    assert entry["solution"] == {"solution": "Fixed."}
+
+
+def test_failed_fix_is_reported_until_the_lease_expires(tmp_path):
+    store = FixStore(str(tmp_path / "fixes.sqlite"), lease=60)
+    store.claim("fingerprint")
+    store.fail("fingerprint")
+    assert store.claim("fingerprint")[0] == FAILED
+
+    expired = FixStore(str(tmp_path / "fixes.sqlite"), lease=0)
+    assert expired.claim("fingerprint") == (OWNER, None)
+
+
+def test_released_claim_can_be_taken_again(tmp_path):
+    store = FixStore(str(tmp_path / "fixes.sqlite"))
+    store.claim("fingerprint")
+    store.release("fingerprint")
+    assert store.claim("fingerprint") == (OWNER, None)
+
+
+def test_only_one_of_many_concurrent_claims_owns(tmp_path):
+    path = str(tmp_path / "fixes.sqlite")
+    FixStore(path)  # Creates the database before the threads race
+    barrier = threading.Barrier(8)
+    states = []
+
+    def claim():
+        store = FixStore(path, lease=60)
+        barrier.wait()
+        state, _ = store.claim("fingerprint")
+        states.append(state)
+        if state == OWNER:
+            store.fail("fingerprint")
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert states.count(OWNER) == 1
+    assert states.count(FAILED) == 7
@@ -0,0 +1,54 @@
+import os
+
+from scriptmonkey.utils.ignore import IgnoreMatcher
+
+
+def write(path, content=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_patterns_match_names_at_any_depth(tmp_path):
+    write(tmp_path / ".gitignore", "*.pyc\nbuild/\n")
+    matcher = IgnoreMatcher.for_root(str(tmp_path))
+    assert matcher.is_ignored(str(tmp_path / "pkg" / "module.pyc"))
+    assert matcher.is_ignored(str(tmp_path / "pkg" / "build"), is_dir=True)
+    assert not matcher.is_ignored(str(tmp_path / "pkg" / "build"))  # A file named build is kept
+    assert not matcher.is_ignored(str(tmp_path / "pkg" / "module.py"))
+
+
+def test_anchored_patterns_are_relative_to_the_ignore_file(tmp_path):
+    write(tmp_path / ".gitignore", "/docs/*.html\nlogs/**\n")
+    matcher = IgnoreMatcher.for_root(str(tmp_path))
+    assert matcher.is_ignored(str(tmp_path / "docs" / "index.html"))
+    assert not matcher.is_ignored(str(tmp_path / "src" / "docs" / "index.html"))
+    assert matcher.is_ignored(str(tmp_path / "logs" / "2024" / "app.log"))
+
+
+def test_later_negations_re_include(tmp_path):
+    write(tmp_path / ".gitignore", "*.log\n!keep.log\n")
+    matcher = IgnoreMatcher.for_root(str(tmp_path))
+    assert matcher.is_ignored(str(tmp_path / "debug.log"))
+    assert not matcher.is_ignored(str(tmp_path / "keep.log"))
+
+
+def test_nested_rules_only_apply_to_their_subtree(tmp_path):
+    write(tmp_path / ".gitignore", "*.tmp\n")
+    write(tmp_path / "sub" / ".scriptmonkeyignore", "*.csv\n!important.tmp\n")
+    root = IgnoreMatcher.for_root(str(tmp_path))
+    sub = root.for_directory(str(tmp_path / "sub"))
+    assert root.for_directory(str(tmp_path / "other")) is root
+    assert not root.is_ignored(str(tmp_path / "data.csv"))
+    assert sub.is_ignored(str(tmp_path / "sub" / "data.csv"))
+    assert sub.is_ignored(str(tmp_path / "sub" / "scratch.tmp"))
+    assert not sub.is_ignored(str(tmp_path / "sub" / "important.tmp"))
+
+
+def test_rules_of_the_enclosing_repository_apply(tmp_path):
+    os.makedirs(tmp_path / ".git" / "info")
+    write(tmp_path / ".git" / "info" / "exclude", "secret.txt\n")
+    write(tmp_path / ".gitignore", "*.bak\n")
+    matcher = IgnoreMatcher.for_root(str(tmp_path / "project"))
+    assert matcher.is_ignored(str(tmp_path / "project" / "secret.txt"))
+    assert matcher.is_ignored(str(tmp_path / "project" / "old.bak"))
@@ -0,0 +1,45 @@
+import json
+
+from scriptmonkey.utils.json_stream import JsonArrayStream
+
+DOCUMENT = json.dumps(
+    {
+        "name": "files",
+        "files": [
+            {"path": "app/", "description": "Braces } and brackets ] in a \"string\".", "functions": None},
+            {"path": "app/main.py", "description": "Entry point.", "functions": [{"function_name": "main"}]},
+        ],
+        "after": [{"path": "ignored"}],
+    }
+)
+
+
+def feed_in_chunks(parser: JsonArrayStream, text: str, size: int) -> list:
+    items = []
+    for start in range(0, len(text), size):
+        items += parser.feed(text[start : start + size])
+    return items
+
+
+def test_items_are_parsed_whatever_the_chunk_size():
+    expected = json.loads(DOCUMENT)["files"]
+    for size in (1, 2, 7, len(DOCUMENT)):
+        assert feed_in_chunks(JsonArrayStream("files"), DOCUMENT, size) == expected
+
+
+def test_items_are_returned_as_soon_as_they_are_complete():
+    parser = JsonArrayStream("files")
+    first_end = DOCUMENT.index("}, {") + 1
+    assert parser.feed(DOCUMENT[:first_end]) == [json.loads(DOCUMENT)["files"][0]]
+    assert parser.feed(DOCUMENT[first_end:]) == [json.loads(DOCUMENT)["files"][1]]
+
+
+def test_only_the_top_level_key_is_read():
+    document = json.dumps({"nested": {"files": [{"path": "no"}]}, "files": [{"path": "yes"}]})
+    assert JsonArrayStream("files").feed(document) == [{"path": "yes"}]
+
+
+def test_a_string_value_equal_to_the_key_is_not_a_key():
+    # "files" as the value of "name" must not start the array
+    document = json.dumps({"name": "files", "other": [{"path": "no"}], "files": [{"path": "yes"}]})
+    assert JsonArrayStream("files").feed(document) == [{"path": "yes"}]
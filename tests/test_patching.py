@@ -0,0 +1,70 @@
+import pytest
+
+from scriptmonkey.utils.patching import PatchError, apply_edits
+
+SOURCE = """def add(a, b):
+    return a - b
+
+
+def scale(value):
+    return value * 3
+
+
+def main():
+    return add(1, 2)
+"""
+
+
+def test_exact_match_is_replaced():
+    edits = [{"search": "    return a - b\n", "replace": "    return a + b\n"}]
+    assert "return a + b" in apply_edits(SOURCE, edits)
+
+
+def test_loose_match_ignores_indentation_and_trailing_whitespace():
+    # Quoted without its indentation and with trailing spaces: the replacement is re-indented
+    edits = [{"search": "return value * 3   ", "replace": "return value * 2"}]
+    patched = apply_edits(SOURCE, edits)
+    assert "    return value * 2\n" in patched
+    assert "value * 3" not in patched
+
+
+def test_edits_are_applied_in_order():
+    edits = [
+        {"search": "return a - b", "replace": "return a + b"},
+        {"search": "return a + b", "replace": "return b + a"},
+    ]
+    assert "return b + a" in apply_edits(SOURCE, edits)
+
+
+def test_ambiguous_search_text_is_rejected():
+    source = "def f():\n    return 1\n\n\ndef g():\n    return 1\n"
+    with pytest.raises(PatchError, match="occurs 2 times"):
+        apply_edits(source, [{"search": "return 1", "replace": "return 2"}])
+
+
+def test_region_picks_the_occurrence_inside_it():
+    source = "def f():\n    return 1\n\n\ndef g():\n    return 1\n"
+    patched = apply_edits(source, [{"search": "return 1", "replace": "return 2"}], region=(5, 6))
+    assert patched == "def f():\n    return 1\n\n\ndef g():\n    return 2\n"
+
+
+def test_missing_search_text_is_rejected():
+    with pytest.raises(PatchError, match="not found"):
+        apply_edits(SOURCE, [{"search": "return a * b", "replace": "return a + b"}])
+
+
+def test_empty_patch_and_empty_search_are_rejected():
+    with pytest.raises(PatchError, match="no edits"):
+        apply_edits(SOURCE, [])
+    with pytest.raises(PatchError, match="empty search"):
+        apply_edits(SOURCE, [{"search": "  \n", "replace": "x = 1"}])
+
+
+def test_python_that_does_not_parse_is_rejected():
+    with pytest.raises(PatchError, match="does not parse"):
+        apply_edits(SOURCE, [{"search": "return a - b", "replace": "return a +"}], path="module.py")
+
+
+def test_other_files_are_not_parsed():
+    patched = apply_edits("name: value\n", [{"search": "value", "replace": "other: ["}], path="settings.yaml")
+    assert patched == "name: other: [\n"
@@ -0,0 +1,21 @@
+from scriptmonkey.openai_client.ratelimit import TIER_1_RATE_LIMITS, _parse_rate_limits
+
+
+def test_parses_requests_and_tokens_per_minute():
+    assert _parse_rate_limits("gpt-4o=5000:800000, gpt-4o-mini=5000:4000000") == {
+        "gpt-4o": (5000, 800000),
+        "gpt-4o-mini": (5000, 4000000),
+    }
+
+
+def test_missing_limit_is_not_enforced():
+    assert _parse_rate_limits("gpt-4o=500,gpt-4o-mini=:900") == {"gpt-4o": (500, None), "gpt-4o-mini": (None, 900)}
+
+
+def test_malformed_items_are_skipped(capsys):
+    assert _parse_rate_limits("gpt-4o=fast:1,gpt-4o-mini,=1:2,o1=-5,gpt-4=10:20") == {"gpt-4": (10, 20)}
+    assert capsys.readouterr().out.count("ignored the rate limit") == 4
+
+
+def test_presets():
+    assert _parse_rate_limits("tier1") == TIER_1_RATE_LIMITS
@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from scriptmonkey.scheduler import BuildScheduler, break_cycles, dependency_levels
+from scriptmonkey.utils.manifest import BuildManifest
+
+
+def test_break_cycles_drops_the_edge_that_closes_a_cycle():
+    graph = {"a.py": {"b.py"}, "b.py": {"c.py"}, "c.py": {"a.py"}, "d.py": {"a.py"}}
+    acyclic = break_cycles(graph, ["a.py", "b.py", "c.py", "d.py"])
+    # a -> b -> c is kept in blueprint order; c -> a closes the cycle
+    assert acyclic == {"a.py": {"b.py"}, "b.py": {"c.py"}, "c.py": set(), "d.py": {"a.py"}}
+
+
+def test_break_cycles_keeps_an_acyclic_graph():
+    graph = {"a.py": set(), "b.py": {"a.py"}, "c.py": {"a.py", "b.py"}}
+    assert break_cycles(graph, ["a.py", "b.py", "c.py"]) == graph
+
+
+def test_break_cycles_drops_self_dependencies():
+    assert break_cycles({"a.py": {"a.py"}}, ["a.py"]) == {"a.py": set()}
+
+
+def test_dependency_levels():
+    graph = {"a.py": set(), "b.py": {"a.py"}, "c.py": set(), "d.py": {"b.py", "c.py"}}
+    assert dependency_levels(graph, ["a.py", "b.py", "c.py", "d.py"]) == [["a.py", "c.py"], ["b.py"], ["d.py"]]
+
+
+BLUEPRINT = [
+    {"path": "app/", "description": "The application package.", "functions": None},
+    {"path": "requirements.txt", "description": "Dependencies.", "functions": []},
+    {"path": "app/main.py", "description": "Entry point. Uses app.services.", "functions": []},
+    {"path": "app/services.py", "description": "Business logic. Uses app.models.", "functions": []},
+    {"path": "app/models.py", "description": "Data models.", "functions": []},
+    {"path": "config/settings.yaml", "description": "Settings.", "functions": []},
+]
+
+
+def build(tmp_path, project_files=None, streamed=()):
+    finished = []
+    lock = threading.Lock()
+
+    def build_file(project_file, file_path, overview, context):
+        with lock:
+            finished.append(project_file["path"])
+        return f"# {project_file['path']}\n"
+
+    manifest = BuildManifest(str(tmp_path))
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        scheduler = BuildScheduler(
+            executor, build_file, "A project.", str(tmp_path), manifest, project_files=project_files
+        )
+        for project_file in streamed or project_files:
+            scheduler.add(project_file)
+        scheduler.finish_blueprint()
+        results = {path: future.result(timeout=10) for path, future, _ in scheduler.pending if future is not None}
+    return scheduler, finished, results
+
+
+def test_scheduler_builds_files_after_their_dependencies(tmp_path):
+    scheduler, finished, results = build(tmp_path, project_files=BLUEPRINT)
+    assert sorted(finished) == sorted(entry["path"] for entry in BLUEPRINT if not entry["path"].endswith("/"))
+    assert results[str(tmp_path / "app" / "models.py")] == "# app/models.py\n"
+    position = {path: number for number, path in enumerate(finished)}
+    assert position["app/models.py"] < position["app/services.py"] < position["app/main.py"]
+    assert position["requirements.txt"] == len(finished) - 1
+    assert scheduler.dependencies["app/services.py"] == {"app/models.py"}
+
+
+def test_streamed_blueprint_waits_for_entry_points_and_requirements(tmp_path):
+    scheduler, finished, _ = build(tmp_path, streamed=BLUEPRINT)
+    position = {path: number for number, path in enumerate(finished)}
+    assert position["app/services.py"] < position["app/main.py"]
+    assert position["app/models.py"] < position["app/main.py"]
+    assert position["requirements.txt"] == len(finished) - 1
+    # While streaming, services.py could not wait for models.py, which was listed after it
+    assert scheduler.dependencies["app/services.py"] == set()
+
+
+def test_failed_file_is_reported_and_does_not_block_its_dependents(tmp_path):
+    def build_file(project_file, file_path, overview, context):
+        if project_file["path"] == "app/models.py":
+            raise RuntimeError("generation failed")
+        return "content"
+
+    manifest = BuildManifest(str(tmp_path))
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        scheduler = BuildScheduler(executor, build_file, "A project.", str(tmp_path), manifest, BLUEPRINT)
+        for project_file in BLUEPRINT:
+            scheduler.add(project_file)
+        scheduler.finish_blueprint()
+        errors = {path: future.exception(timeout=10) for path, future, _ in scheduler.pending if future is not None}
+    assert isinstance(errors[str(tmp_path / "app" / "models.py")], RuntimeError)
+    assert errors[str(tmp_path / "app" / "services.py")] is None
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from scriptmonkey.openai_client import (
+    FakeBackend,
+    chatgpt_stream,
+    chatgpt_stream_async,
+    disable_cache,
+    enable_cache,
+    set_backend,
+)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    previous = set_backend(FakeBackend(latency=0, tokens_per_second=None, completion_tokens=400))
+    yield enable_cache(str(tmp_path / "cache.sqlite"))
+    disable_cache()
+    set_backend(previous)
+
+
+def test_complete_stream_is_cached(cache):
+    first = "".join(chatgpt_stream("Explain decorators."))
+    assert list(chatgpt_stream("Explain decorators.")) == [first]
+
+
+def test_stream_cut_off_at_max_tokens_is_not_cached(cache):
+    "".join(chatgpt_stream("Explain decorators.", max_tokens=5))
+    assert len(list(chatgpt_stream("Explain decorators.", max_tokens=5))) > 1
+
+
+def test_async_stream_cut_off_at_max_tokens_is_not_cached(cache):
+    async def read():
+        return [chunk async for chunk in chatgpt_stream_async("Explain decorators.", max_tokens=5)]
+
+    asyncio.run(read())
+    assert len(asyncio.run(read())) > 1